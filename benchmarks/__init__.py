@@ -0,0 +1,7 @@
+##-----------------------------------------------------------------------
+## File : benchmarks/__init__.py
+##
+## Description: Benchmarks for the recipe manager. Run them from the
+##              project folder with "python -m benchmarks.<name>" so the
+##              project's modules can be imported.
+##-----------------------------------------------------------------------
@@ -0,0 +1,157 @@
+##-----------------------------------------------------------------------
+## File : benchmarks/recipe_memory.py
+##
+## Description: Measures how many bytes each recipe takes in memory, for
+##              the old Recipe layout (a __dict__ per object with lists of
+##              freshly parsed strings) and for the current one (__slots__
+##              with tuples of interned strings), on the same synthetic
+##              library. Run with "python -m benchmarks.recipe_memory".
+##-----------------------------------------------------------------------
+
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+
+from recipe import Recipe
+
+DEFAULT_COUNT = 1000000
+TAG_WORDS = ["Dinner", "Lunch", "Breakfast", "Dessert", "Quick", "Vegan", "Vegetarian", "Gluten", "Dairy", "Meat", "Fish", "Spicy", "Baked", "Soup", "Salad", "Pasta"]
+INGREDIENT_WORDS = ["Salt", "Pepper", "Sugar", "Butter", "Flour", "Large eggs", "Milk", "Olive oil", "Garlic", "Onion", "Tomato", "Basil", "Chicken", "Beef", "Rice", "Cheese", "Lemon", "Water", "Vanilla extract", "Baking soda"]
+AMOUNT_WORDS = ["1 cup", "2 cups", "1/2 cup", "1 teaspoon", "2 tablespoons", "1 pinch", "3", "2", "1 pound", "to taste"]
+
+
+## class legacy_recipe
+##
+## Description:
+##
+##   The Recipe layout from before __slots__ and interning: every object
+##   has a __dict__ and keeps the lists it was given. Only used as the
+##   "before" side of the benchmark.
+
+class legacy_recipe:
+
+    ## __init__(self, name, photo_name, tags, ingredients, description)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Stores the fields as they are.
+    ##
+    ## Parameters : the same as Recipe
+    ##
+    ## Return Value : none
+
+    def __init__(self, name, photo_name, tags, ingredients, description):
+        self.name = name
+        self.photo_name = photo_name
+        self.tags = tags
+        self.ingredients = ingredients
+        self.description = description
+
+
+## fresh(text)
+##
+## Summary of the fresh string helper:
+##
+## Returns a new string object equal to text.
+##
+## Parameters : text - any string
+##
+## Return Value : str that is not the same object as text
+##
+## Description:
+##
+## The parser builds every tag and ingredient from the file's bytes, so
+## none of them are shared. Round tripping through bytes does the same
+## here.
+
+def fresh(text):
+    return text.encode("utf-8").decode("utf-8")
+
+
+## synthetic_fields(count, seed=0)
+##
+## Summary of the library generator:
+##
+## Yields the fields of a synthetic library, the way the parser would
+## hand them over.
+##
+## Parameters :
+##    count - number of recipes
+##    seed - random seed, so every run builds the same library
+##
+## Return Value : generator of (name, photo_name, tags, ingredients,
+##                description)
+##
+## Description:
+##
+## Each recipe has 1-4 tags and 4-12 ingredients drawn from small
+## vocabularies, like a real recipe collection.
+
+def synthetic_fields(count, seed=0):
+    rng = random.Random(seed)
+    for number in range(count):
+        tags = [fresh(tag) for tag in rng.sample(TAG_WORDS, rng.randint(1, 4))]
+        ingredients = [(fresh(ingredient), fresh(rng.choice(AMOUNT_WORDS))) for ingredient in rng.sample(INGREDIENT_WORDS, rng.randint(4, 12))]
+        yield f"Recipe {number}", f"photo_{number}.png", tags, ingredients, f"Mix everything for recipe {number} and serve."
+
+
+## measure(build, count, seed=0)
+##
+## Summary of the measuring function:
+##
+## Builds a library with one recipe class and reports its memory use.
+##
+## Parameters :
+##    build - Recipe or legacy_recipe
+##    count - number of recipes
+##    seed - random seed for synthetic_fields
+##
+## Return Value : bytes per recipe still allocated once the library is
+##                built
+##
+## Description:
+##
+## tracemalloc counts every allocation made while the library is built
+## that is still alive afterwards, which covers the objects, their lists
+## or tuples and the strings only they refer to.
+
+def measure(build, count, seed=0):
+    gc.collect()
+    tracemalloc.start()
+    library = [build(*fields) for fields in synthetic_fields(count, seed)]
+    gc.collect()
+    used, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del library
+    return used / count
+
+
+## main(argv=None)
+##
+## Summary of the benchmark entry point:
+##
+## Measures both layouts and prints the results.
+##
+## Parameters : argv - argument list (defaults to sys.argv[1:])
+##
+## Return Value : process exit status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.recipe_memory", description="Compare bytes per recipe before and after __slots__ and interning.")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help=f"recipes in the synthetic library (default {DEFAULT_COUNT})")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    before = measure(legacy_recipe, args.count, args.seed)
+    after = measure(Recipe, args.count, args.seed)
+    print(f"{args.count} recipes")
+    print(f"dict + lists     : {before:8.0f} bytes/recipe  ({before * args.count / 2**20:8.1f} MiB)")
+    print(f"slots + interned : {after:8.0f} bytes/recipe  ({after * args.count / 2**20:8.1f} MiB)")
+    print(f"saved            : {1 - after / before:8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
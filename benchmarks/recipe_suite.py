@@ -0,0 +1,490 @@
+##-----------------------------------------------------------------------
+## File : benchmarks/recipe_suite.py
+##
+## Description: Times the recipe_manager operations the window depends on
+##              (loading, saving, adding, editing, deleting and tag
+##              filtering) on synthetic libraries of 1k, 100k and 1M
+##              recipes. The results are written as JSON, and a saved
+##              result can be given as a baseline to flag anything that
+##              got slower. Run with "python -m benchmarks.recipe_suite".
+##-----------------------------------------------------------------------
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from recipe_manager import recipe_manager
+from recipe_storage import text_storage
+
+from benchmarks.synthetic_library import add_library_arguments, library_recipes, options_from_args, write_library
+
+FORMAT_VERSION = 1
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_OPS = 200
+DEFAULT_QUERIES = 20
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_CHANGE = 0.005
+CASES = ["load_recipes", "load_lazy", "save_recipes", "load_snapshot", "tag_filter", "update_recipe", "add_recipe", "delete_recipe"]
+
+
+## timed(function)
+##
+## Summary of the timing helper:
+##
+## Runs a function once and returns how long it took.
+##
+## Parameters : function - function taking no arguments
+##
+## Return Value : seconds as a float
+##
+## Description:
+##
+## Garbage left over from the run before is collected first so it is not
+## charged to this one.
+
+def timed(function):
+    gc.collect()
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+## result(size, case, ops, runs)
+##
+## Summary of the result builder:
+##
+## Builds the JSON entry for one case at one library size.
+##
+## Parameters :
+##    size - recipes in the library
+##    case - name of the case, one of CASES
+##    ops - operations done in each run
+##    runs - seconds taken by each run
+##
+## Return Value : dict
+##
+## Description:
+##
+## The fastest run is the one compared, since the slower ones only add
+## noise from the rest of the machine.
+
+def result(size, case, ops, runs):
+    best = min(runs)
+    return {"size": size, "case": case, "ops": ops, "seconds": best, "per_op": best / ops, "runs": runs}
+
+
+## load_manager(filename, storage)
+##
+## Summary of the loading helper:
+##
+## Loads a file into a new recipe_manager.
+##
+## Parameters :
+##    filename - recipes file
+##    storage - storage backend for the manager
+##
+## Return Value : recipe_manager
+
+def load_manager(filename, storage):
+    manager = recipe_manager(storage)
+    manager.load_recipes(filename)
+    return manager
+
+
+## time_loads(filename, make_storage, repeat)
+##
+## Summary of the load timing function:
+##
+## Times loading a file into a new manager several times.
+##
+## Parameters :
+##    filename - recipes file
+##    make_storage - function returning a new storage backend
+##    repeat - number of runs
+##
+## Return Value : tuple (list of seconds, the last manager loaded)
+
+def time_loads(filename, make_storage, repeat):
+    runs = []
+    loaded = []
+    for run in range(repeat):
+        loaded.clear()
+        storage = make_storage()
+        runs.append(timed(lambda: loaded.append(load_manager(filename, storage))))
+    return runs, loaded[0]
+
+
+## tag_queries(manager, count, seed)
+##
+## Summary of the query generator:
+##
+## Picks the tag filters the tag_filter case runs.
+##
+## Parameters :
+##    manager - loaded recipe_manager
+##    count - number of queries
+##    seed - random seed
+##
+## Return Value : list of (match_all, match_any, match_none) tuples
+##
+## Description:
+##
+## Mixes the filters the tag panel builds: one or two tags that must all
+## match, sometimes with a tag to leave out, and some "any of" queries.
+
+def tag_queries(manager, count, seed):
+    rng = random.Random(seed)
+    tags = sorted(manager.all_tags)
+    queries = []
+    for number in range(count):
+        if number % 3 == 2:
+            queries.append(((), tuple(rng.sample(tags, min(3, len(tags)))), ()))
+        else:
+            match_all = tuple(rng.sample(tags, min(1 + number % 2, len(tags))))
+            match_none = tuple(tag for tag in rng.sample(tags, 1) if tag not in match_all) if number % 4 == 1 else ()
+            queries.append((match_all, (), match_none))
+    return queries
+
+
+## run_queries(manager, queries)
+##
+## Summary of the query runner:
+##
+## Runs every query with an empty query cache.
+##
+## Parameters :
+##    manager - loaded recipe_manager
+##    queries - list from tag_queries
+##
+## Return Value : none
+##
+## Description:
+##
+## forget_queries is called before each query so the bitsets, the
+## recipe list and the tag counts are worked out every time, as they are
+## after any edit.
+
+def run_queries(manager, queries):
+    for match_all, match_any, match_none in queries:
+        manager.forget_queries()
+        manager.tag_query(match_all, match_any, match_none)
+
+
+## retag(manager, recipes, tag_words)
+##
+## Summary of the edit runner:
+##
+## Swaps one tag of each recipe for another tag through update_recipe.
+##
+## Parameters :
+##    manager - loaded recipe_manager
+##    recipes - the recipes to edit
+##    tag_words - list of (old tag, new tag) pairs, one per recipe
+##
+## Return Value : none
+
+def retag(manager, recipes, tag_words):
+    for recipe_object, (old_tag, new_tag) in zip(recipes, tag_words):
+        tags = [new_tag if tag == old_tag else tag for tag in recipe_object.tags]
+        manager.update_recipe(recipe_object, recipe_object.name, recipe_object.photo_name, tags, recipe_object.ingredients, recipe_object.description)
+
+
+## run_size(size, options, ops, queries, repeat, workdir)
+##
+## Summary of the per size benchmark:
+##
+## Writes a library of one size and times every case on it.
+##
+## Parameters :
+##    size - recipes in the library
+##    options - library_options
+##    ops - adds, edits and deletes per run
+##    queries - tag filters per run
+##    repeat - runs per case
+##    workdir - folder for the generated files
+##
+## Return Value : list of result dicts
+##
+## Description:
+##
+## The loads start from the text file without its snapshot or record
+## index, the way a library synced from elsewhere is first opened.
+## save_recipes saves like the window does (text file plus snapshot) and
+## load_snapshot reads that copy back. The mutating cases then run one
+## after another on a single loaded manager, so the library drifts a
+## little between runs (new recipes are added, picked recipes deleted)
+## but always the same way for the same options.
+
+def run_size(size, options, ops, queries, repeat, workdir):
+    filename = os.path.join(workdir, f"recipes_{size}.txt")
+    saved = os.path.join(workdir, f"saved_{size}.txt")
+    write_library(filename, size, options)
+    results = []
+
+    lazy_storages = []
+
+    def lazy_storage():
+        storage = text_storage(lazy_bodies=True, use_index=False)
+        lazy_storages.append(storage)
+        return storage
+
+    runs, manager = time_loads(filename, lazy_storage, repeat)
+    for storage in lazy_storages:
+        storage.close_body_records()
+    del manager
+    results.append(result(size, "load_lazy", size, runs))
+
+    runs, manager = time_loads(filename, lambda: text_storage(use_snapshot=False, use_index=False), repeat)
+    results.append(result(size, "load_recipes", size, runs))
+
+    save_storage = text_storage()
+    runs = [timed(lambda: save_storage.save(manager, saved)) for run in range(repeat)]
+    results.append(result(size, "save_recipes", size, runs))
+    del manager
+
+    runs, manager = time_loads(saved, text_storage, repeat)
+    results.append(result(size, "load_snapshot", size, runs))
+
+    rng = random.Random(options.seed)
+    query_list = tag_queries(manager, queries, options.seed)
+    runs = [timed(lambda: run_queries(manager, query_list)) for run in range(repeat)]
+    results.append(result(size, "tag_filter", len(query_list), runs))
+
+    count = min(ops, size)
+    tags = sorted(manager.all_tags)
+    runs = []
+    for run in range(repeat):
+        recipes = rng.sample(manager.recipe_list, count)
+        swaps = []
+        for recipe_object in recipes:
+            unused = [tag for tag in tags if tag not in recipe_object.tags]
+            swaps.append((rng.choice(recipe_object.tags), rng.choice(unused)) if unused and recipe_object.tags else (None, None))
+        runs.append(timed(lambda: retag(manager, recipes, swaps)))
+    results.append(result(size, "update_recipe", count, runs))
+
+    runs = []
+    for run in range(repeat):
+        recipes = list(library_recipes(ops, options, size + run * ops))
+        runs.append(timed(lambda: [manager.add_recipe(recipe_object) for recipe_object in recipes]))
+    results.append(result(size, "add_recipe", ops, runs))
+
+    runs = []
+    for run in range(repeat):
+        names = [recipe_object.name for recipe_object in rng.sample(manager.recipe_list, min(ops, len(manager.recipe_list)))]
+        runs.append(timed(lambda: [manager.delete_recipe(name) for name in names]))
+    results.append(result(size, "delete_recipe", len(names), runs))
+
+    del manager
+    for path in (filename, saved):
+        for suffix in ("", ".snap", ".idx"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+    results.sort(key=lambda entry: CASES.index(entry["case"]))
+    return results
+
+
+## compare(current, baseline, tolerance, min_change)
+##
+## Summary of the baseline comparison:
+##
+## Lines up two sets of results and marks the cases that got slower.
+##
+## Parameters :
+##    current - results dict of this run
+##    baseline - results dict loaded from an earlier run
+##    tolerance - fraction per_op may grow by before it counts, e.g. 0.25
+##    min_change - seconds a run must grow by before it counts
+##
+## Return Value : list of (size, case, baseline per_op, current per_op,
+##                ratio, status) where status is "ok", "faster",
+##                "REGRESSION" or "new"
+##
+## Description:
+##
+## Cases are matched by size and name. min_change keeps the tiny 1k
+## cases, where a few microseconds is most of the time, from being
+## flagged by timer noise.
+
+def compare(current, baseline, tolerance, min_change):
+    before = {(entry["size"], entry["case"]): entry for entry in baseline["results"]}
+    rows = []
+    for entry in current["results"]:
+        old = before.get((entry["size"], entry["case"]))
+        if old is None:
+            rows.append((entry["size"], entry["case"], None, entry["per_op"], None, "new"))
+            continue
+        ratio = entry["per_op"] / old["per_op"] if old["per_op"] else float("inf")
+        grown = (entry["per_op"] - old["per_op"]) * entry["ops"]
+        if ratio > 1 + tolerance and grown > min_change:
+            status = "REGRESSION"
+        elif ratio < 1 / (1 + tolerance):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((entry["size"], entry["case"], old["per_op"], entry["per_op"], ratio, status))
+    return rows
+
+
+## format_seconds(seconds)
+##
+## Summary of the duration formatter:
+##
+## Shows a duration in s, ms or us so the table columns stay short.
+##
+## Parameters : seconds - float or None
+##
+## Return Value : string
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.2f} ms"
+    return f"{seconds * 1000000:.2f} us"
+
+
+## print_results(results, file)
+##
+## Summary of the results table:
+##
+## Prints one line per case.
+##
+## Parameters :
+##    results - results dict
+##    file - stream to print to
+##
+## Return Value : none
+
+def print_results(results, file):
+    print(f"{'size':>9}  {'case':<14} {'ops':>8} {'total':>11} {'per op':>11}", file=file)
+    for entry in results["results"]:
+        print(f"{entry['size']:>9}  {entry['case']:<14} {entry['ops']:>8} {format_seconds(entry['seconds']):>11} {format_seconds(entry['per_op']):>11}", file=file)
+
+
+## print_comparison(rows, file)
+##
+## Summary of the comparison table:
+##
+## Prints the rows from compare.
+##
+## Parameters :
+##    rows - list from compare
+##    file - stream to print to
+##
+## Return Value : none
+
+def print_comparison(rows, file):
+    print(f"{'size':>9}  {'case':<14} {'baseline':>11} {'now':>11} {'ratio':>7}  status", file=file)
+    for size, case, old, new, ratio, status in rows:
+        shown = f"{ratio:.2f}x" if ratio is not None else "-"
+        print(f"{size:>9}  {case:<14} {format_seconds(old):>11} {format_seconds(new):>11} {shown:>7}  {status}", file=file)
+
+
+## parse_sizes(text)
+##
+## Summary of the size argument parser:
+##
+## Turns "1000,100k,1M" into a list of ints.
+##
+## Parameters : text - command line value
+##
+## Return Value : list of ints
+
+def parse_sizes(text):
+    sizes = []
+    for part in text.split(","):
+        part = part.strip().lower()
+        scale = 1
+        if part.endswith("k"):
+            scale, part = 1000, part[:-1]
+        elif part.endswith("m"):
+            scale, part = 1000000, part[:-1]
+        try:
+            sizes.append(int(part) * scale)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad size {part!r}")
+    return sizes
+
+
+## main(argv=None)
+##
+## Summary of the benchmark entry point:
+##
+## Runs the suite, writes the JSON results and compares them with a
+## baseline if one was given.
+##
+## Parameters : argv - argument list (defaults to sys.argv[1:])
+##
+## Return Value : process exit status, 1 if a regression was found
+##
+## Description:
+##
+## The table goes to stderr and the JSON to --output (stdout by default),
+## so "python -m benchmarks.recipe_suite > baseline.json" saves a
+## baseline for later runs to be compared with.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.recipe_suite", description="Time recipe_manager operations on synthetic libraries.")
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES, help="library sizes, e.g. 1k,100k,1M (default)")
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help=f"adds, edits and deletes per run (default {DEFAULT_OPS})")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help=f"tag filters per run (default {DEFAULT_QUERIES})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"runs per case, the fastest counts (default {DEFAULT_REPEAT})")
+    parser.add_argument("--workdir", help="folder for the generated libraries (default a temporary folder)")
+    parser.add_argument("--output", "-o", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"slowdown allowed before a case is flagged (default {DEFAULT_TOLERANCE})")
+    parser.add_argument("--min-change", type=float, default=DEFAULT_MIN_CHANGE, help=f"seconds a run must slow down by before it is flagged (default {DEFAULT_MIN_CHANGE})")
+    add_library_arguments(parser)
+    args = parser.parse_args(argv)
+    options = options_from_args(args)
+    repeat = max(1, args.repeat)
+    ops = max(1, args.ops)
+
+    results = {
+        "format": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "library": options.as_dict(),
+        "ops": ops,
+        "queries": args.queries,
+        "repeat": repeat,
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for size in args.sizes:
+            results["results"].extend(run_size(size, options, ops, max(1, args.queries), repeat, workdir))
+            print(f"finished {size} recipes", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    print_results(results, sys.stderr)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("library") != results["library"]:
+        print("warning: the baseline was made with different library options", file=sys.stderr)
+    rows = compare(results, baseline, args.tolerance, args.min_change)
+    print(file=sys.stderr)
+    print_comparison(rows, sys.stderr)
+    return 1 if any(row[5] == "REGRESSION" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+##-----------------------------------------------------------------------
+## File : benchmarks/synthetic_library.py
+##
+## Description: Builds fake recipe libraries for the benchmarks. The same
+##              seed and options always give the same recipes, so two runs
+##              (or two machines) time exactly the same work. Run with
+##              "python -m benchmarks.synthetic_library out.txt --count N"
+##              to write a library in the recipes.txt format.
+##-----------------------------------------------------------------------
+
+import argparse
+import random
+import sys
+
+from recipe import Recipe
+from recipe_parser import ENCODING, format_recipe
+
+from benchmarks.recipe_memory import AMOUNT_WORDS, INGREDIENT_WORDS, TAG_WORDS
+
+DESCRIPTION_WORDS = ["mix", "stir", "bake", "whisk", "chop", "slice", "boil", "simmer", "season", "serve", "fold", "pour", "heat", "cool", "rest", "the", "until", "golden", "gently", "well", "and", "with", "in", "a", "pan", "bowl", "oven", "minutes"]
+
+
+## class library_options
+##
+## Description:
+##
+##   The shape of a synthetic library. Ranges are (lowest, highest)
+##   pairs and both ends can be picked.
+##
+## Data members:
+##
+##   tags : Range of tags per recipe.
+##   tag_vocabulary : Number of different tags in the library.
+##   ingredients : Range of ingredients per recipe.
+##   ingredient_vocabulary : Number of different ingredients.
+##   description_words : Range of words per description.
+##   seed : Random seed.
+##
+## Methods:
+##
+##   __init__ - store the options.
+##   as_dict - the options as plain JSON values.
+
+class library_options:
+
+    ## __init__(self, tags=(1, 4), tag_vocabulary=16, ingredients=(4, 12), ingredient_vocabulary=20, description_words=(8, 40), seed=0)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Stores the options.
+    ##
+    ## Parameters : see the data members
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## A range that asks for more tags or ingredients than the vocabulary
+    ## has is cut down to the vocabulary size.
+
+    def __init__(self, tags=(1, 4), tag_vocabulary=16, ingredients=(4, 12), ingredient_vocabulary=20, description_words=(8, 40), seed=0):
+        self.tag_vocabulary = max(1, tag_vocabulary)
+        self.ingredient_vocabulary = max(1, ingredient_vocabulary)
+        self.tags = (min(tags[0], self.tag_vocabulary), min(tags[1], self.tag_vocabulary))
+        self.ingredients = (min(ingredients[0], self.ingredient_vocabulary), min(ingredients[1], self.ingredient_vocabulary))
+        self.description_words = description_words
+        self.seed = seed
+
+    ## as_dict(self)
+    ##
+    ## Summary of the option export function:
+    ##
+    ## Returns the options as plain values, for the benchmark results.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : dict
+
+    def as_dict(self):
+        return {
+            "tags": list(self.tags),
+            "tag_vocabulary": self.tag_vocabulary,
+            "ingredients": list(self.ingredients),
+            "ingredient_vocabulary": self.ingredient_vocabulary,
+            "description_words": list(self.description_words),
+            "seed": self.seed,
+        }
+
+
+## vocabulary(words, size, prefix)
+##
+## Summary of the vocabulary builder:
+##
+## Returns size different words, the real ones first.
+##
+## Parameters :
+##    words - list of real words to start with
+##    size - number of words wanted
+##    prefix - start of the made up words used once words runs out
+##
+## Return Value : list of strings
+##
+## Description:
+##
+## Made up words have no spaces, so tags built from them stay single tags
+## once written to the file.
+
+def vocabulary(words, size, prefix):
+    return list(words[:size]) + [f"{prefix}{number}" for number in range(len(words), size)]
+
+
+## library_recipes(count, options, start=0)
+##
+## Summary of the library generator:
+##
+## Yields the recipes of a synthetic library.
+##
+## Parameters :
+##    count - number of recipes
+##    options - library_options
+##    start - number of the first recipe
+##
+## Return Value : generator of Recipe
+##
+## Description:
+##
+## Recipe n is called "Recipe n", so recipes made with a later start
+## never clash with the first count. Each recipe number has its own
+## random stream (seeded from the seed and the number), so recipe n is
+## the same however many recipes come before it.
+
+def library_recipes(count, options, start=0):
+    tag_words = vocabulary(TAG_WORDS, options.tag_vocabulary, "Tag")
+    ingredient_words = vocabulary(INGREDIENT_WORDS, options.ingredient_vocabulary, "Ingredient ")
+    for number in range(start, start + count):
+        rng = random.Random(options.seed * 1000003 + number)
+        tags = rng.sample(tag_words, rng.randint(*options.tags))
+        ingredients = [(ingredient, rng.choice(AMOUNT_WORDS)) for ingredient in rng.sample(ingredient_words, rng.randint(*options.ingredients))]
+        words = [rng.choice(DESCRIPTION_WORDS) for word in range(rng.randint(*options.description_words))]
+        description = " ".join(words).capitalize() + "."
+        yield Recipe(f"Recipe {number}", f"photo_{number}.png", tags, ingredients, description)
+
+
+## write_library(filename, count, options)
+##
+## Summary of the library writer:
+##
+## Writes a synthetic library in the recipes.txt format.
+##
+## Parameters :
+##    filename - file to write
+##    count - number of recipes
+##    options - library_options
+##
+## Return Value : number of bytes written
+##
+## Description:
+##
+## Uses format_recipe, the same function text_storage saves with, and
+## writes "\n" line endings on every platform so the file is the same
+## everywhere.
+
+def write_library(filename, count, options):
+    size = 0
+    with open(filename, "w", encoding=ENCODING, newline="\n") as file:
+        for recipe_object in library_recipes(count, options):
+            text = format_recipe(recipe_object)
+            file.write(text)
+            size += len(text.encode(ENCODING))
+    return size
+
+
+## parse_range(text)
+##
+## Summary of the range argument parser:
+##
+## Turns "4" or "4-12" into a (lowest, highest) pair.
+##
+## Parameters : text - command line value
+##
+## Return Value : tuple of two ints
+
+def parse_range(text):
+    low, separator, high = text.partition("-")
+    try:
+        low = int(low)
+        high = int(high) if separator else low
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected N or N-M, not {text!r}")
+    if low < 0 or high < low:
+        raise argparse.ArgumentTypeError(f"bad range {text!r}")
+    return low, high
+
+
+## add_library_arguments(parser)
+##
+## Summary of the shared argument function:
+##
+## Adds the library shape options to an argument parser.
+##
+## Parameters : parser - argparse.ArgumentParser
+##
+## Return Value : none
+##
+## Description:
+##
+## Shared with benchmarks.recipe_suite so both take the same options.
+
+def add_library_arguments(parser):
+    defaults = library_options()
+    parser.add_argument("--tags", type=parse_range, default=defaults.tags, help="tags per recipe, N or N-M (default 1-4)")
+    parser.add_argument("--tag-vocabulary", type=int, default=defaults.tag_vocabulary, help=f"different tags in the library (default {defaults.tag_vocabulary})")
+    parser.add_argument("--ingredients", type=parse_range, default=defaults.ingredients, help="ingredients per recipe, N or N-M (default 4-12)")
+    parser.add_argument("--ingredient-vocabulary", type=int, default=defaults.ingredient_vocabulary, help=f"different ingredients in the library (default {defaults.ingredient_vocabulary})")
+    parser.add_argument("--description-words", type=parse_range, default=defaults.description_words, help="words per description, N or N-M (default 8-40)")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+## options_from_args(args)
+##
+## Summary of the option builder:
+##
+## Builds library_options from arguments added by add_library_arguments.
+##
+## Parameters : args - parsed arguments
+##
+## Return Value : library_options
+
+def options_from_args(args):
+    return library_options(args.tags, args.tag_vocabulary, args.ingredients, args.ingredient_vocabulary, args.description_words, args.seed)
+
+
+## main(argv=None)
+##
+## Summary of the generator entry point:
+##
+## Writes a synthetic library to a file.
+##
+## Parameters : argv - argument list (defaults to sys.argv[1:])
+##
+## Return Value : process exit status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic_library", description="Write a synthetic recipe library in the recipes.txt format.")
+    parser.add_argument("filename")
+    parser.add_argument("--count", type=int, default=1000, help="number of recipes (default 1000)")
+    add_library_arguments(parser)
+    args = parser.parse_args(argv)
+
+    size = write_library(args.filename, args.count, options_from_args(args))
+    print(f"wrote {args.count} recipes ({size / 2**20:.1f} MiB) to {args.filename}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
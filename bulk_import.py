@@ -0,0 +1,228 @@
+##-----------------------------------------------------------------------
+## File : bulk_import.py
+##
+## Description: Imports many recipes files into one recipe_manager at
+##              once. The files are parsed in parallel by a pool of worker
+##              processes, which send back plain tuples instead of Recipe
+##              objects, and the results are added to the manager in the
+##              order the files were given so every run gives the same
+##              library. Recipes whose name is already taken are skipped,
+##              overwrite the old recipe or get a new name, depending on
+##              the collision policy.
+##-----------------------------------------------------------------------
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from recipe import Recipe
+from recipe_journal import fields_recipe
+from recipe_parser import ENCODING, iter_records, parse_record
+
+COLLISION_POLICIES = ("skip", "overwrite", "rename")
+JSONL_SUFFIX = ".jsonl"
+
+
+## parse_file(path)
+##
+## Summary of the worker function:
+##
+## Parses one recipes file into compact records.
+##
+## Parameters : path - a recipes.txt format file, or a .jsonl export
+##
+## Return Value : (list of records, error message or None)
+##
+## Description:
+##
+## Runs in a worker process. Each record is a tuple (name, photo_name,
+## tags, ingredients, description) of strings and tuples, which pickles
+## far smaller and faster than a Recipe. A .jsonl file holds one
+## recipe_journal.recipe_fields list per line. A file that cannot be read, or
+## that has a broken record, returns the records before the problem and
+## a message describing it, since exceptions with extra arguments do not
+## always survive the trip back from a worker.
+
+def parse_file(path):
+    records = []
+    try:
+        for recipe_object in file_recipes(path):
+            records.append((recipe_object.name, recipe_object.photo_name, tuple(recipe_object.tags), tuple(recipe_object.ingredients), recipe_object.description))
+    except (OSError, ValueError) as error:
+        return records, str(error)
+    return records, None
+
+
+## file_recipes(path)
+##
+## Summary of the file reader:
+##
+## Streams the recipes of a recipes text file or a .jsonl export.
+##
+## Parameters : path - the file to read
+##
+## Return Value : generator of Recipe
+##
+## Description:
+##
+## Raises RecipeParseError for a broken text record and ValueError
+## naming the line for a broken JSON line.
+
+def file_recipes(path):
+    if not path.endswith(JSONL_SUFFIX):
+        for record_number, offset, length, blocks in iter_records(path):
+            yield parse_record(blocks)
+        return
+    with open(path, "r", encoding=ENCODING) as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                recipe_object = fields_recipe(json.loads(line))
+            except (ValueError, TypeError) as error:
+                raise ValueError(f"line {line_number}: {error}") from None
+            yield recipe_object
+
+
+## record_recipe(record)
+##
+## Summary of the record converter:
+##
+## Builds a Recipe from a record made by parse_file.
+##
+## Parameters : record - (name, photo_name, tags, ingredients, description)
+##
+## Return Value : Recipe
+
+def record_recipe(record):
+    name, photo_name, tags, ingredients, description = record
+    return Recipe(name, photo_name, list(tags), list(ingredients), description)
+
+
+## free_name(manager, name, suffixes)
+##
+## Summary of the rename helper:
+##
+## Finds an unused name for a recipe whose name is taken.
+##
+## Parameters :
+##    manager - the recipe_manager being imported into
+##    name - the name that is taken
+##    suffixes - dictionary name -> next number to try, shared across one
+##               import so repeated collisions do not start from 2 again
+##
+## Return Value : "name (2)", "name (3)", ... whichever is free first
+
+def free_name(manager, name, suffixes):
+    number = suffixes.get(name, 2)
+    while manager.get_recipe(f"{name} ({number})") is not None:
+        number += 1
+    suffixes[name] = number + 1
+    return f"{name} ({number})"
+
+
+## merge_records(manager, records, policy, counts, suffixes)
+##
+## Summary of the merge function:
+##
+## Adds one file's records to the manager.
+##
+## Parameters :
+##    manager - the recipe_manager being imported into
+##    records - list of records from parse_file
+##    policy - "skip", "overwrite" or "rename"
+##    counts - dictionary of result counts, updated in place
+##    suffixes - rename counters for free_name
+##
+## Return Value : none
+##
+## Description:
+##
+## A name already in the manager (from before the import or from an
+## earlier record) is handled by the policy: skip drops the new recipe,
+## overwrite copies it onto the old one with update_recipe and rename
+## adds it as "name (2)" and so on.
+
+def merge_records(manager, records, policy, counts, suffixes):
+    for record in records:
+        existing = manager.get_recipe(record[0])
+        if existing is None:
+            manager.add_recipe(record_recipe(record))
+            counts["added"] += 1
+        elif policy == "skip":
+            counts["skipped"] += 1
+        elif policy == "overwrite":
+            name, photo_name, tags, ingredients, description = record
+            manager.update_recipe(existing, name, photo_name, list(tags), list(ingredients), description)
+            counts["overwritten"] += 1
+        else:
+            manager.add_recipe(record_recipe((free_name(manager, record[0], suffixes),) + record[1:]))
+            counts["renamed"] += 1
+
+
+## bulk_import(manager, paths, policy="skip", workers=None)
+##
+## Summary of the bulk import function:
+##
+## Parses many recipes files in parallel and adds their recipes to a
+## manager.
+##
+## Parameters :
+##    manager - the recipe_manager to import into
+##    paths - recipes text files or .jsonl exports, in the order they
+##            should be added
+##    policy - what to do with a name that is already taken: "skip",
+##             "overwrite" or "rename"
+##    workers - number of worker processes (defaults to the CPU count)
+##
+## Return Value : dictionary with the counts "added", "skipped",
+##                "overwritten" and "renamed", and "errors", a list of
+##                (path, message) for files that could not be fully read
+##
+## Description:
+##
+## Files are handed to the pool largest first so one big file does not
+## end up running alone at the end, but they are merged strictly in the
+## order given, each as soon as it and every file before it are done.
+## The result is the same as adding the files one after another with a
+## single process. The records before a broken record in a file are
+## still imported. A single file, or workers=1, is parsed without
+## starting a pool.
+
+def bulk_import(manager, paths, policy="skip", workers=None):
+    if policy not in COLLISION_POLICIES:
+        raise ValueError(f"unknown collision policy {policy!r}")
+    paths = list(paths)
+    counts = {"added": 0, "skipped": 0, "overwritten": 0, "renamed": 0, "errors": []}
+    suffixes = {}
+
+    if workers == 1 or len(paths) <= 1:
+        for path in paths:
+            records, error = parse_file(path)
+            merge_records(manager, records, policy, counts, suffixes)
+            if error is not None:
+                counts["errors"].append((path, error))
+        return counts
+
+    def file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        uses = {}
+        for path in sorted(dict.fromkeys(paths), key=file_size, reverse=True):
+            futures[path] = executor.submit(parse_file, path)
+        for path in paths:
+            uses[path] = uses.get(path, 0) + 1
+        for path in paths:
+            records, error = futures[path].result()
+            uses[path] -= 1
+            if uses[path] == 0:
+                del futures[path]
+            merge_records(manager, records, policy, counts, suffixes)
+            if error is not None:
+                counts["errors"].append((path, error))
+    return counts
@@ -0,0 +1,263 @@
+##-----------------------------------------------------------------------
+## File : image_cache.py
+##
+## Description: Two level cache for recipe photos. Resized images are
+##              kept in memory in least-recently-used order up to a byte
+##              budget, and every resized image is also written to a
+##              thumbnail folder on disk so later runs do not have to
+##              decode the full size photo again. PIL is only imported
+##              when the first photo is decoded, so it does not slow down
+##              starting the program.
+##-----------------------------------------------------------------------
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+THUMBNAIL_DIR = ".thumbnails"
+MEMORY_BUDGET_BYTES = 32 * 1024 * 1024
+
+
+## fit_size(size, box)
+##
+## Summary of the fit function:
+##
+## Scales an image size to fit inside a box, keeping its shape.
+##
+## Parameters :
+##    size - (width, height) of the original image
+##    box - (width, height) the image has to fit in
+##
+## Return Value : (width, height) of the resized image
+##
+## Description:
+##
+## Uses the same scale factor the photo panel always has, so small images
+## are enlarged to fill the box as well.
+
+def fit_size(size, box):
+    width, height = size
+    scale = min(box[0]/width, box[1]/height)
+    return int(width*scale), int(height*scale)
+
+
+## class image_cache
+##
+## Description:
+##
+##   Hands out photos resized to fit a box. A photo is looked up in
+##   memory first, then in the thumbnail folder, and only decoded from the
+##   original file when neither has it. Entries are keyed by the photo's
+##   path, modified time, file size and the box, so editing or replacing a
+##   photo makes its old entries unused.
+##
+## Data members:
+##
+##   budget_bytes : Most bytes of pixel data kept in memory.
+##   used_bytes : Bytes of pixel data currently kept in memory.
+##   thumbnail_dir : Folder for resized copies, or None to skip the disk.
+##   entries : OrderedDict key -> (image, bytes), oldest use first.
+##
+## Methods:
+##
+##   __init__ - set the memory budget and thumbnail folder.
+##   photo_key - build the cache key for a photo and box.
+##   thumbnail_path - where the resized copy of a photo is stored.
+##   load - return a photo resized to fit a box.
+##   lookup - return a photo from memory without touching the disk.
+##   resize_photo - read a photo from its thumbnail or the original.
+##   remember - add a resized image to memory and evict old ones.
+##   clear - drop everything kept in memory.
+
+class image_cache:
+
+    ## __init__(self, budget_bytes=MEMORY_BUDGET_BYTES, thumbnail_dir=THUMBNAIL_DIR)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Sets up an empty cache.
+    ##
+    ## Parameters :
+    ##    budget_bytes - most bytes of pixel data to keep in memory
+    ##    thumbnail_dir - folder for resized copies, or None for memory only
+    ##
+    ## Return Value : none
+
+    def __init__(self, budget_bytes=MEMORY_BUDGET_BYTES, thumbnail_dir=THUMBNAIL_DIR):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.thumbnail_dir = thumbnail_dir
+        self.entries = OrderedDict()
+
+    ## photo_key(self, path, box)
+    ##
+    ## Summary of the key function:
+    ##
+    ## Builds the cache key for a photo resized to fit a box.
+    ##
+    ## Parameters :
+    ##    path - photo file
+    ##    box - (width, height) the photo has to fit in
+    ##
+    ## Return Value : tuple (path, mtime_ns, size, box)
+    ##
+    ## Description:
+    ##
+    ## Raises OSError (FileNotFoundError) when the photo does not exist.
+
+    def photo_key(self, path, box):
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size, tuple(box)
+
+    ## thumbnail_path(self, key)
+    ##
+    ## Summary of the thumbnail path function:
+    ##
+    ## Returns the file the resized copy for a key is stored in.
+    ##
+    ## Parameters : key - from photo_key
+    ##
+    ## Return Value : path inside thumbnail_dir
+    ##
+    ## Description:
+    ##
+    ## The name is a hash of the absolute path, modified time, file size
+    ## and box, so a changed photo never matches an old thumbnail.
+
+    def thumbnail_path(self, key):
+        path, mtime_ns, size, box = key
+        digest = hashlib.sha1(repr((os.path.abspath(path), mtime_ns, size, box)).encode("utf-8")).hexdigest()
+        return os.path.join(self.thumbnail_dir, digest + ".png")
+
+    ## load(self, path, box)
+    ##
+    ## Summary of the load function:
+    ##
+    ## Returns a photo resized to fit a box.
+    ##
+    ## Parameters :
+    ##    path - photo file
+    ##    box - (width, height) the photo has to fit in
+    ##
+    ## Return Value : PIL Image
+    ##
+    ## Description:
+    ##
+    ## Checks memory, then the thumbnail folder, then decodes and resizes
+    ## the original (writing its thumbnail). Raises OSError when the photo
+    ## is missing or cannot be read. The returned image is shared with the
+    ## cache and must not be changed.
+
+    def load(self, path, box):
+        key = self.photo_key(path, box)
+        image = self.lookup(key)
+        if image is None:
+            image = self.resize_photo(key)
+            self.remember(key, image)
+        return image
+
+    ## lookup(self, key)
+    ##
+    ## Summary of the memory lookup function:
+    ##
+    ## Returns the in-memory image for a key and marks it recently used.
+    ##
+    ## Parameters : key - from photo_key
+    ##
+    ## Return Value : PIL Image or None
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    ## resize_photo(self, key)
+    ##
+    ## Summary of the resize function:
+    ##
+    ## Reads the resized photo for a key from disk.
+    ##
+    ## Parameters : key - from photo_key
+    ##
+    ## Return Value : PIL Image
+    ##
+    ## Description:
+    ##
+    ## Uses the thumbnail when there is one. Otherwise the original is
+    ## decoded, resized and saved as a thumbnail through a temporary file
+    ## so another reader never sees half of one. Failing to write the
+    ## thumbnail is not an error. Does not touch the memory tier, so it
+    ## is safe to call from a worker thread.
+
+    def resize_photo(self, key):
+        from PIL import Image
+
+        if self.thumbnail_dir is not None:
+            thumbnail = self.thumbnail_path(key)
+            try:
+                with Image.open(thumbnail) as image:
+                    image.load()
+                    return image
+            except OSError:
+                pass
+
+        path, mtime_ns, size, box = key
+        with Image.open(path) as original:
+            image = original.resize(fit_size(original.size, box))
+
+        if self.thumbnail_dir is not None:
+            try:
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+                temp_path = f"{thumbnail}.{os.getpid()}.{threading.get_ident()}.tmp"
+                image.save(temp_path, "PNG", compress_level=1)
+                os.replace(temp_path, thumbnail)
+            except (OSError, ValueError):
+                pass
+        return image
+
+    ## remember(self, key, image)
+    ##
+    ## Summary of the remember function:
+    ##
+    ## Keeps a resized image in memory and evicts the least recently used
+    ## ones until the cache is back under budget_bytes.
+    ##
+    ## Parameters :
+    ##    key - from photo_key
+    ##    image - the resized image
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## An image larger than the whole budget is not kept.
+
+    def remember(self, key, image):
+        size = image.width * image.height * len(image.getbands())
+        if size > self.budget_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.used_bytes -= old[1]
+        self.entries[key] = (image, size)
+        self.used_bytes += size
+        while self.used_bytes > self.budget_bytes:
+            evicted_key, (evicted, evicted_size) = self.entries.popitem(last=False)
+            self.used_bytes -= evicted_size
+
+    ## clear(self)
+    ##
+    ## Summary of the clear function:
+    ##
+    ## Drops every image kept in memory. Thumbnails on disk are kept.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
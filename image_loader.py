@@ -0,0 +1,255 @@
+##-----------------------------------------------------------------------
+## File : image_loader.py
+##
+## Description: Decodes and resizes recipe photos on a small pool of
+##              worker threads so the Tk main loop never waits on PIL.
+##              Finished images are passed back through a queue that the
+##              main loop checks with root.after, and are stored in the
+##              image_cache from there.
+##-----------------------------------------------------------------------
+
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 30
+LOADER_WORKERS = 2
+
+
+## class image_loader
+##
+## Description:
+##
+##   Loads photos through an image_cache in the background. Only the most
+##   recent request gets its callback; an older request that finishes late
+##   is still cached but otherwise dropped. Prefetched photos are loaded
+##   the same way without a callback so they are ready in memory when the
+##   user gets to them.
+##
+## Data members:
+##
+##   root : Tk window whose after() drives the polling.
+##   cache : image_cache the photos are loaded through and stored in.
+##   executor : ThreadPoolExecutor doing the decoding.
+##   results : Queue of (key, image, error) from the workers.
+##   in_flight : Mapping key -> Future for photos being loaded.
+##   prefetched : Keys submitted by the latest prefetch call.
+##   generation : Number of the latest request; older ones are stale.
+##   current : (generation, key, callback) of the request waiting for
+##             its photo, or None.
+##   polling : True while a poll is scheduled.
+##
+## Methods:
+##
+##   __init__ - start the worker pool.
+##   request - load one photo and call back with it on the Tk thread.
+##   prefetch - load photos that may be wanted soon.
+##   cancel - forget the current request.
+##   submit - hand one photo to the worker pool.
+##   decode - worker side of a load.
+##   poll - deliver finished loads on the Tk thread.
+##   shutdown - stop the worker pool.
+
+class image_loader:
+
+    ## __init__(self, root, cache, workers=LOADER_WORKERS)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Starts the worker threads.
+    ##
+    ## Parameters :
+    ##    root - Tk window used for after() polling
+    ##    cache - image_cache to load through
+    ##    workers - number of decoding threads
+    ##
+    ## Return Value : none
+
+    def __init__(self, root, cache, workers=LOADER_WORKERS):
+        self.root = root
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image_loader")
+        self.results = queue.Queue()
+        self.in_flight = {}
+        self.prefetched = []
+        self.generation = 0
+        self.current = None
+        self.polling = False
+
+    ## request(self, path, box, callback)
+    ##
+    ## Summary of the request function:
+    ##
+    ## Loads one photo resized to fit a box and passes it to callback.
+    ##
+    ## Parameters :
+    ##    path - photo file
+    ##    box - (width, height) the photo has to fit in
+    ##    callback - function(image) run on the Tk thread; image is None
+    ##               when the photo could not be read
+    ##
+    ## Return Value : True if callback has already run (the photo was in
+    ##                memory or missing), False if it will run later
+    ##
+    ## Description:
+    ##
+    ## Makes every earlier request stale. A photo already in memory is
+    ## handed over straight away; otherwise it is loaded by the pool,
+    ## reusing a prefetch of the same photo if one is running.
+
+    def request(self, path, box, callback):
+        self.generation += 1
+        self.current = None
+        try:
+            key = self.cache.photo_key(path, box)
+        except OSError:
+            callback(None)
+            return True
+        image = self.cache.lookup(key)
+        if image is not None:
+            callback(image)
+            return True
+        self.current = (self.generation, key, callback)
+        self.submit(key)
+        return False
+
+    ## prefetch(self, paths, box)
+    ##
+    ## Summary of the prefetch function:
+    ##
+    ## Starts loading photos that may be wanted soon.
+    ##
+    ## Parameters :
+    ##    paths - photo files, most wanted first
+    ##    box - (width, height) the photos have to fit in
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Prefetches from an earlier call that have not started yet are
+    ## cancelled first, since the user has moved on. Missing photos and
+    ## photos already in memory are skipped.
+
+    def prefetch(self, paths, box):
+        waiting_key = self.current[1] if self.current is not None else None
+        for key in self.prefetched:
+            future = self.in_flight.get(key)
+            if key != waiting_key and future is not None and future.cancel():
+                del self.in_flight[key]
+        self.prefetched = []
+        for path in dict.fromkeys(paths):
+            try:
+                key = self.cache.photo_key(path, box)
+            except OSError:
+                continue
+            if self.cache.lookup(key) is None:
+                self.submit(key)
+                self.prefetched.append(key)
+
+    ## cancel(self)
+    ##
+    ## Summary of the cancel function:
+    ##
+    ## Drops the current request so its callback never runs.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Used when the photo panel is cleared. A load that is already
+    ## running still finishes and is cached.
+
+    def cancel(self):
+        self.generation += 1
+        self.current = None
+
+    ## submit(self, key)
+    ##
+    ## Summary of the submit function:
+    ##
+    ## Hands one photo to the worker pool unless it is already loading.
+    ##
+    ## Parameters : key - from image_cache.photo_key
+    ##
+    ## Return Value : none
+
+    def submit(self, key):
+        if key not in self.in_flight:
+            self.in_flight[key] = self.executor.submit(self.decode, key)
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_MS, self.poll)
+
+    ## decode(self, key)
+    ##
+    ## Summary of the worker function:
+    ##
+    ## Reads and resizes a photo on a worker thread.
+    ##
+    ## Parameters : key - from image_cache.photo_key
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Only touches the disk and PIL; the cache's memory tier is left to
+    ## poll so it is never changed from two threads.
+
+    def decode(self, key):
+        try:
+            self.results.put((key, self.cache.resize_photo(key), None))
+        except Exception as error:
+            self.results.put((key, None, error))
+
+    ## poll(self)
+    ##
+    ## Summary of the poll function:
+    ##
+    ## Delivers finished loads on the Tk thread.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Stores each finished image in the cache and runs the current
+    ## request's callback if its photo is among them. Keeps polling while
+    ## anything is still loading.
+
+    def poll(self):
+        while True:
+            try:
+                key, image, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight.pop(key, None)
+            if image is not None:
+                self.cache.remember(key, image)
+            if self.current is not None and self.current[1] == key and self.current[0] == self.generation:
+                callback = self.current[2]
+                self.current = None
+                callback(image)
+
+        for key in [key for key, future in self.in_flight.items() if future.cancelled()]:
+            del self.in_flight[key]
+        if self.in_flight:
+            self.root.after(POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    ## shutdown(self)
+    ##
+    ## Summary of the shutdown function:
+    ##
+    ## Stops the worker pool without waiting for running loads.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,287 @@
+##-----------------------------------------------------------------------
+## File : ingredient_index.py
+##
+## Description: Answers "what can I cook with what I have". Ingredient
+##              names are normalized so "Large eggs" and "egg" match, and
+##              every ingredient keeps a bitset of the recipes that use it
+##              (using the recipe ids recipe_manager already hands out for
+##              the tag bitsets). A pantry query adds those bitsets up
+##              into bit-sliced counters and compares the count against
+##              each recipe's ingredient total, so no recipe is looked at
+##              one at a time.
+##-----------------------------------------------------------------------
+
+import re
+
+from search_index import singular
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+DESCRIPTOR_WORDS = frozenset("""
+    large small medium big extra fresh freshly frozen dried ripe raw cold warm hot
+    chopped diced minced sliced grated shredded crushed peeled softened melted
+    beaten cooked uncooked finely roughly thinly whole boneless skinless
+    """.split())
+
+
+## normalize_ingredient(name)
+##
+## Summary of the ingredient normalizer:
+##
+## Reduces an ingredient name to the form used for matching.
+##
+## Parameters : name - ingredient name as written in a recipe or pantry
+##
+## Return Value : normalized name ("" if nothing is left)
+##
+## Description:
+##
+## Case folds the name, drops punctuation and size/preparation words such
+## as "large" or "chopped", and makes every remaining word singular, so
+## "Large Eggs", "eggs" and "egg" all become "egg". If every word is a
+## descriptor the words are kept, so "Chopped" alone still matches itself.
+
+def normalize_ingredient(name):
+    words = WORD_PATTERN.findall(name.casefold())
+    kept = [word for word in words if word not in DESCRIPTOR_WORDS] or words
+    return " ".join(singular(word) for word in kept)
+
+
+## normalize_pantry(pantry)
+##
+## Summary of the pantry normalizer:
+##
+## Normalizes every ingredient a user has, once per query.
+##
+## Parameters : pantry - ingredient names as the user typed them
+##
+## Return Value : frozenset of normalized names, without empty ones
+##
+## Description:
+##
+## match and missing both take this set, so a query that returns many
+## recipes does not normalize the pantry again for each of them.
+
+def normalize_pantry(pantry):
+    return frozenset(filter(None, map(normalize_ingredient, pantry)))
+
+
+## class ingredient_index
+##
+## Description:
+##
+##   Bitsets of recipe ids per normalized ingredient and per ingredient
+##   count, kept in step with recipe_manager one recipe at a time.
+##
+## Data members:
+##
+##   bits : Mapping ingredient -> bytearray bitset of recipe ids.
+##   masks : Cache of bits converted to ints.
+##   size_bits : Mapping n -> bytearray bitset of recipes with n
+##               different ingredients.
+##   size_masks : Cache of size_bits converted to ints.
+##   recipe_ingredients : Mapping recipe id -> frozenset of its
+##                        normalized ingredients.
+##
+## Methods:
+##
+##   __init__ - start empty.
+##   add - index one recipe's ingredients.
+##   remove - drop one recipe.
+##   mask / size_mask - int bitsets for the queries.
+##   count_bits - bit-sliced counters of how many pantry items each
+##                recipe uses.
+##   match - bitsets of recipes missing 0, 1, ... k ingredients.
+##   missing - the ingredients one recipe still needs.
+
+class ingredient_index:
+
+    ## __init__(self)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Sets up an empty index.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def __init__(self):
+        self.bits = {}
+        self.masks = {}
+        self.size_bits = {}
+        self.size_masks = {}
+        self.recipe_ingredients = {}
+
+    ## add(self, recipe_id, ingredients, set_bit)
+    ##
+    ## Summary of the add function:
+    ##
+    ## Indexes one recipe's ingredients.
+    ##
+    ## Parameters :
+    ##    recipe_id - the recipe's bit position from recipe_manager
+    ##    ingredients - (ingredient, amount) pairs
+    ##    set_bit - recipe_manager.set_bit
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## An ingredient listed twice counts once. Recipes with no ingredients
+    ## are remembered but never match a pantry.
+
+    def add(self, recipe_id, ingredients, set_bit):
+        names = frozenset(filter(None, (normalize_ingredient(ingredient) for ingredient, amount in ingredients)))
+        self.recipe_ingredients[recipe_id] = names
+        for name in names:
+            set_bit(self.bits.setdefault(name, bytearray()), recipe_id, 1)
+            self.masks.pop(name, None)
+        if names:
+            set_bit(self.size_bits.setdefault(len(names), bytearray()), recipe_id, 1)
+            self.size_masks.pop(len(names), None)
+
+    ## remove(self, recipe_id, set_bit)
+    ##
+    ## Summary of the remove function:
+    ##
+    ## Drops one recipe from the index.
+    ##
+    ## Parameters :
+    ##    recipe_id - the recipe's bit position
+    ##    set_bit - recipe_manager.set_bit
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Uses the ingredients stored by add, so it works after the recipe
+    ## has been edited.
+
+    def remove(self, recipe_id, set_bit):
+        names = self.recipe_ingredients.pop(recipe_id, None)
+        if names is None:
+            return
+        for name in names:
+            set_bit(self.bits[name], recipe_id, 0)
+            self.masks.pop(name, None)
+        if names:
+            set_bit(self.size_bits[len(names)], recipe_id, 0)
+            self.size_masks.pop(len(names), None)
+
+    ## mask(self, name)
+    ##
+    ## Summary of the ingredient mask function:
+    ##
+    ## Returns the recipes using a normalized ingredient as an int bitset.
+    ##
+    ## Parameters : name - normalized ingredient name
+    ##
+    ## Return Value : int bitset (0 for unknown ingredients)
+
+    def mask(self, name):
+        mask = self.masks.get(name)
+        if mask is None:
+            mask = int.from_bytes(self.bits.get(name, b""), "little")
+            self.masks[name] = mask
+        return mask
+
+    ## size_mask(self, size)
+    ##
+    ## Summary of the size mask function:
+    ##
+    ## Returns the recipes with a given number of different ingredients
+    ## as an int bitset.
+    ##
+    ## Parameters : size - number of ingredients
+    ##
+    ## Return Value : int bitset
+
+    def size_mask(self, size):
+        mask = self.size_masks.get(size)
+        if mask is None:
+            mask = int.from_bytes(self.size_bits.get(size, b""), "little")
+            self.size_masks[size] = mask
+        return mask
+
+    ## count_bits(self, pantry)
+    ##
+    ## Summary of the counting function:
+    ##
+    ## Counts, for every recipe at once, how many pantry items it uses.
+    ##
+    ## Parameters : pantry - set of normalized ingredient names
+    ##
+    ## Return Value : list of int bitsets; bit r of slices[i] is bit i of
+    ##                recipe r's count
+    ##
+    ## Description:
+    ##
+    ## Each pantry item's bitset is added into the counters with a ripple
+    ## carry, which is a few big-int operations per item instead of a loop
+    ## over recipes.
+
+    def count_bits(self, pantry):
+        slices = []
+        for name in pantry:
+            carry = self.mask(name)
+            for index in range(len(slices)):
+                if not carry:
+                    break
+                slices[index], carry = slices[index] ^ carry, slices[index] & carry
+            if carry:
+                slices.append(carry)
+        return slices
+
+    ## match(self, pantry, max_missing=0)
+    ##
+    ## Summary of the pantry match function:
+    ##
+    ## Finds the recipes that can be made from a pantry, or nearly.
+    ##
+    ## Parameters :
+    ##    pantry - normalized ingredient names from normalize_pantry
+    ##    max_missing - most ingredients a result may be missing
+    ##
+    ## Return Value : list where entry m is the int bitset of recipes
+    ##                missing exactly m ingredients
+    ##
+    ## Description:
+    ##
+    ## A recipe with n ingredients is missing m of them when the pantry
+    ## covers exactly n - m. The recipes with n ingredients are a size
+    ## bitset and the recipes whose count equals a value come from the
+    ## counter slices, so each (n, m) pair is a handful of ANDs.
+
+    def match(self, pantry, max_missing=0):
+        slices = self.count_bits([name for name in pantry if name in self.bits])
+        results = [0] * (max_missing + 1)
+        for size in self.size_bits:
+            size_mask = self.size_mask(size)
+            if not size_mask:
+                continue
+            for missing in range(min(max_missing, size) + 1):
+                count = size - missing
+                if count >> len(slices):
+                    continue
+                bits = size_mask
+                for index, counter in enumerate(slices):
+                    bits &= counter if (count >> index) & 1 else ~counter
+                    if not bits:
+                        break
+                results[missing] |= bits
+        return results
+
+    ## missing(self, recipe_id, pantry)
+    ##
+    ## Summary of the missing ingredient function:
+    ##
+    ## Lists the ingredients of one recipe that are not in the pantry.
+    ##
+    ## Parameters :
+    ##    recipe_id - the recipe's bit position
+    ##    pantry - normalized ingredient names from normalize_pantry
+    ##
+    ## Return Value : sorted list of normalized ingredient names
+
+    def missing(self, recipe_id, pantry):
+        return sorted(self.recipe_ingredients.get(recipe_id, frozenset()) - pantry)
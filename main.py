@@ -9,10 +9,63 @@
 ##              so that the same recipes are available across multiple runs.
 ##-----------------------------------------------------------------------
 
+import time
+
+## Taken before the other imports so --timing can report how long they took.
+STARTED = time.perf_counter()
+
+import argparse
 import tkinter as tk
+from recipe_storage import sqlite_storage, text_storage
 from recipe_ui import menu_manager
+from tracing import start_tracing, stop_tracing
+
+IMPORTED = time.perf_counter()
+
+
+## print_startup_report(phases)
+##
+## Summary of the startup report function:
+##
+## Prints how long each part of starting the program took.
+##
+## Parameters : phases - list of (phase, seconds) from menu_manager
+##
+## Return Value : none
+##
+## Description:
+##
+## The import phase and the total from the start of the process to the
+## library being fully loaded are added here, since menu_manager cannot
+## see them.
+
+def print_startup_report(phases):
+    total = time.perf_counter() - STARTED
+    for phase, seconds in [("import", IMPORTED - STARTED)] + phases + [("total", total)]:
+        print(f"{phase:<12} {seconds * 1000:9.1f} ms")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Browse and edit recipes.")
+    parser.add_argument("--sqlite", metavar="DATABASE", help="store recipes in an SQLite database instead of recipes.txt")
+    parser.add_argument("--lazy", action="store_true", help="read ingredients and descriptions from recipes.txt only when a recipe is shown")
+    parser.add_argument("--timing", action="store_true", help="print how long each part of starting up took")
+    parser.add_argument("--trace", metavar="FILE", help="time every callback and write a Chrome trace to FILE on exit")
+    parser.add_argument("--no-watch", action="store_true", help="do not pick up changes other programs make to recipes.txt while open")
+    args = parser.parse_args()
+
+    if args.trace:
+        start_tracing()
+    report = print_startup_report if args.timing else None
     root = tk.Tk()
-    menu = menu_manager(root)
-    root.mainloop()
\ No newline at end of file
+    if args.sqlite:
+        menu = menu_manager(root, sqlite_storage(), args.sqlite, startup_report=report)
+    elif args.lazy:
+        menu = menu_manager(root, text_storage(lazy_bodies=True), startup_report=report, watch=not args.no_watch)
+    else:
+        menu = menu_manager(root, startup_report=report, watch=not args.no_watch)
+    root.mainloop()
+    if args.trace:
+        recorder = stop_tracing()
+        recorder.write_chrome(args.trace)
+        recorder.print_summary()
\ No newline at end of file
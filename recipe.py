@@ -9,30 +9,85 @@
 ##              so that the same recipes are available across multiple runs.
 ##-----------------------------------------------------------------------
 
+import sys
+
+
+## intern_tags(tags)
+##
+## Summary of the tag interning helper:
+##
+## Turns a list of tags into a tuple of interned strings.
+##
+## Parameters : tags - iterable of tag names
+##
+## Return Value : tuple of str
+##
+## Description:
+##
+## The same few tags appear on thousands of recipes. Interning makes
+## every "Dinner" one shared string instead of a copy per recipe, and a
+## tuple is smaller than a list.
+
+def intern_tags(tags):
+    return tuple(sys.intern(tag) for tag in tags)
+
+
+## intern_ingredients(ingredients)
+##
+## Summary of the ingredient interning helper:
+##
+## Turns (ingredient, amount) pairs into a tuple of pairs of interned
+## strings.
+##
+## Parameters : ingredients - iterable of (ingredient, amount) pairs, or
+##                            None for a body that is not loaded yet
+##
+## Return Value : tuple of (str, str) pairs, or None
+##
+## Description:
+##
+## Ingredient names like "Salt" and amounts like "1 cup" repeat across
+## most of a library, so each one is kept once.
+
+def intern_ingredients(ingredients):
+    if ingredients is None:
+        return None
+    return tuple((sys.intern(ingredient), sys.intern(amount)) for ingredient, amount in ingredients)
+
+
 ## class Recipe
 ##
 ## Description:
 ##
 ##   This class represents a single recipe record and provides simple
 ##   storage for the recipe's fields used by the UI and persistence
-##   layers.
+##   layers. Uses __slots__ and interned tag and ingredient strings so a
+##   large library takes as little memory as possible.
 ##
 ## Data members:
 ##
 ##   name (str): Recipe name used for display and identification.
 ##   photo_name (str): File name or path for an associated image.
-##   tags (list[str]): Tags used for filtering and searching.
-##   ingredients (list[tuple[str,str]]): (ingredient, amount) pairs.
+##   tags (tuple[str]): Tags used for filtering and searching.
+##   ingredients (tuple[tuple[str,str]]): (ingredient, amount) pairs.
 ##   description (str): Free-form directions or notes for the recipe.
+##   body_loader (callable or None): Reads ingredients and description
+##       on first access for recipes loaded without them.
 ##
 ## Methods:
 ##
 ##   __init__ - initialize a recipe instance with the provided fields.
 ##   set_values - update all fields of the recipe in-place.
+##   ingredients / description - properties that load the body on demand.
+##   load_body - fetch ingredients and description through body_loader.
+##   unload_body - drop ingredients and description until next used.
+##   body_loaded - check whether ingredients and description are present.
 
 class Recipe:
 
-    ## __init__(self, name, photo_name, tags, ingredients, description)
+    __slots__ = ("name", "photo_name", "tags", "_ingredients", "_description", "body_loader")
+
+    ## __init__(self, name, photo_name, tags, ingredients, description, body_loader=None)
     ##
     ## Summary of the constructor function:
     ##
@@ -42,22 +97,115 @@ class Recipe:
     ##    name - recipe name
     ##    photo_name - image file name or path
     ##    tags - list of tags
-    ##    ingredients - (ingredient, amount) pairs
-    ##    description - directions or notes
+    ##    ingredients - (ingredient, amount) pairs, or None if not loaded
+    ##    description - directions or notes, or None if not loaded
+    ##    body_loader - optional function(recipe) returning
+    ##                  (ingredients, description)
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
     ## Stores the provided values on the new object for use by the UI
-    ## and persistence layers.
+    ## and persistence layers. Tags and ingredients are stored as tuples of
+    ## interned strings whatever sequence they are passed as. A storage
+    ## backend can pass None for ingredients and description plus a
+    ## body_loader, and they will be read the first time either one is
+    ## used.
 
-    def __init__(self, name, photo_name, tags, ingredients, description):
+    def __init__(self, name, photo_name, tags, ingredients, description, body_loader=None):
         self.name = name
         self.photo_name = photo_name
-        self.tags = tags
-        self.ingredients = ingredients
-        self.description = description
+        self.tags = intern_tags(tags)
+        self._ingredients = intern_ingredients(ingredients)
+        self._description = description
+        self.body_loader = body_loader
+
+    ## ingredients
+    ##
+    ## Summary of the ingredients property:
+    ##
+    ## Returns the (ingredient, amount) pairs, loading them first if the
+    ## recipe was created without its body.
+
+    @property
+    def ingredients(self):
+        if self._ingredients is None and self.body_loader is not None:
+            self.load_body()
+        return self._ingredients
+
+    @ingredients.setter
+    def ingredients(self, value):
+        self._ingredients = intern_ingredients(value)
+
+    ## description
+    ##
+    ## Summary of the description property:
+    ##
+    ## Returns the directions, loading them first if the recipe was
+    ## created without its body.
+
+    @property
+    def description(self):
+        if self._description is None and self.body_loader is not None:
+            self.load_body()
+        return self._description
+
+    @description.setter
+    def description(self, value):
+        self._description = value
+
+    ## load_body(self)
+    ##
+    ## Summary of the body loader function:
+    ##
+    ## Fetches ingredients and description through body_loader.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called automatically by the properties; can also be called to load
+    ## a body ahead of time.
+
+    def load_body(self):
+        ingredients, self._description = self.body_loader(self)
+        self._ingredients = intern_ingredients(ingredients)
+
+    ## unload_body(self)
+    ##
+    ## Summary of the body unloader function:
+    ##
+    ## Drops ingredients and description so body_loader reads them again
+    ## the next time they are used.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Only for recipes whose stored body is up to date; a storage backend
+    ## uses it to keep a bounded number of bodies in memory.
+
+    def unload_body(self):
+        self._ingredients = None
+        self._description = None
+
+    ## body_loaded(self)
+    ##
+    ## Summary of the body check function:
+    ##
+    ## Tells whether ingredients and description are in memory.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : True if the body is loaded, otherwise False
+
+    def body_loaded(self):
+        return self._ingredients is not None and self._description is not None
 
     ## set_values(self, name, photo_name, tags, ingredients, description)
     ##
@@ -68,7 +216,7 @@ class Recipe:
     ## Parameters :
     ##    name - new name
     ##    photo_name - new image file name or path
-    ##    tags - new tag list
+    ##    tags - new tags
     ##    ingredients - new (ingredient, amount) pairs
     ##    description - new directions or notes
     ##
@@ -82,6 +230,6 @@ class Recipe:
     def set_values(self, name, photo_name, tags, ingredients, description):
         self.name = name
         self.photo_name = photo_name
-        self.tags = tags
+        self.tags = intern_tags(tags)
         self.ingredients = ingredients
         self.description = description
\ No newline at end of file
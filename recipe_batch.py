@@ -0,0 +1,381 @@
+##-----------------------------------------------------------------------
+## File : recipe_batch.py
+##
+## Description: Groups many changes to a recipe_manager into one. Inside
+##              "with manager.batch():" recipes are added, edited and
+##              deleted as usual, but the search and pantry indexes, the
+##              storage backend and the tag listeners only hear about the
+##              overall result once the block ends. If the block raises,
+##              the manager is put back exactly as it was before it.
+##-----------------------------------------------------------------------
+
+MISSING = object()
+
+
+## class recipe_batch
+##
+## Description:
+##
+##   Context manager returned by recipe_manager.batch. Nothing is copied
+##   until the first change, and after that only what each change
+##   touches is saved: the recipe list, live_bits and all_tags once, and
+##   each name, tag, id and edited recipe the first time it changes. A
+##   batch opened while another is active joins it, and only the
+##   outermost one commits or rolls back.
+##
+## Data members:
+##
+##   manager : The recipe_manager being changed.
+##   outer : The batch this one joined, or None if it is the outermost.
+##   started : True once the first change has saved the shared state.
+##   touched : Mapping Recipe -> (was live, name, id) before the batch,
+##             in the order the recipes were first changed.
+##   saved_list : Copy of recipe_list from before the first change.
+##   saved_live : Copy of live_bits from before the first change.
+##   saved_next_id : next_id from before the first change.
+##   saved_tags : Copy of all_tags from before the first change.
+##   saved_names : Mapping name -> (recipe_index entry, name_counts
+##                 entry) before the batch, MISSING for none.
+##   saved_tag_state : Mapping tag -> (tag_counts entry, copy of its
+##                     tag_bits) before the batch, MISSING for none.
+##   saved_values : Mapping Recipe -> its five fields before its first
+##                  edit in the batch.
+##   text_index : The manager's search_index, held back until commit.
+##   pantry_index : The manager's ingredient_index, held back until
+##                  commit.
+##
+## Methods:
+##
+##   __init__ - prepare an empty batch.
+##   __enter__ / __exit__ - start the batch, then commit it or roll it
+##                          back.
+##   save - remember what a change is about to modify.
+##   start - remember the state shared by every change.
+##   edited - release an edited body from storage straight away.
+##   changes - the net add, update and delete of each touched recipe.
+##   commit - bring indexes, storage and tag listeners up to date.
+##   update_indexes - apply the net changes to the held back indexes.
+##   rollback - put the manager back the way it was.
+
+class recipe_batch:
+
+    ## __init__(self, manager)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Prepares an empty batch for a manager.
+    ##
+    ## Parameters : manager - the recipe_manager to change
+    ##
+    ## Return Value : none
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.outer = None
+        self.started = False
+        self.touched = {}
+        self.saved_list = None
+        self.saved_live = None
+        self.saved_next_id = 0
+        self.saved_tags = None
+        self.saved_names = {}
+        self.saved_tag_state = {}
+        self.saved_values = {}
+        self.text_index = None
+        self.pantry_index = None
+
+    ## __enter__(self)
+    ##
+    ## Summary of the batch start function:
+    ##
+    ## Makes this the manager's active batch, or joins the one already
+    ## active.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : the batch
+
+    def __enter__(self):
+        if self.manager.active_batch is not None:
+            self.outer = self.manager.active_batch
+        else:
+            self.manager.active_batch = self
+        return self
+
+    ## __exit__(self, error_type, error, traceback)
+    ##
+    ## Summary of the batch end function:
+    ##
+    ## Commits the batch, or rolls it back if the block raised.
+    ##
+    ## Parameters : the exception leaving the block, if any
+    ##
+    ## Return Value : False, so an exception carries on after the
+    ##                rollback
+    ##
+    ## Description:
+    ##
+    ## A joined batch does nothing here; its changes belong to the outer
+    ## one.
+
+    def __exit__(self, error_type, error, traceback):
+        if self.outer is not None:
+            return False
+        self.manager.active_batch = None
+        if error_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    ## save(self, recipe_object, names, tags, values=False)
+    ##
+    ## Summary of the save function:
+    ##
+    ## Remembers everything a change to one recipe may modify.
+    ##
+    ## Parameters :
+    ##    recipe_object - the recipe being added, edited or deleted
+    ##    names - names whose recipe_index entries may change
+    ##    tags - tags whose counts and bits may change
+    ##    values - True for an edit, which changes the recipe's fields
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called by the manager before it changes anything. Only the first
+    ## value of each name, tag and recipe is kept, since that is what a
+    ## rollback has to restore.
+
+    def save(self, recipe_object, names, tags, values=False):
+        manager = self.manager
+        if not self.started:
+            self.start()
+        if recipe_object not in self.touched:
+            recipe_id = manager.recipe_ids.get(recipe_object)
+            self.touched[recipe_object] = (recipe_id is not None, recipe_object.name, recipe_id)
+        for name in names:
+            if name not in self.saved_names:
+                self.saved_names[name] = (manager.recipe_index.get(name, MISSING), manager.name_counts.get(name, MISSING))
+        for tag in tags:
+            tag = tag.strip()
+            if tag not in self.saved_tag_state:
+                bits = manager.tag_bits.get(tag)
+                self.saved_tag_state[tag] = (manager.tag_counts.get(tag, MISSING), None if bits is None else bytearray(bits))
+        if values and recipe_object not in self.saved_values:
+            self.saved_values[recipe_object] = (recipe_object.name, recipe_object.photo_name, recipe_object.tags, recipe_object.ingredients, recipe_object.description)
+
+    ## start(self)
+    ##
+    ## Summary of the first change function:
+    ##
+    ## Saves the state every change modifies and holds back the indexes.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Copying recipe_list is one pass over a list of references, paid
+    ## once per batch instead of undoing each change one by one. The
+    ## search and pantry indexes are taken off the manager so its changes
+    ## skip them; a search during the batch builds a fresh index from the
+    ## current recipes instead.
+
+    def start(self):
+        manager = self.manager
+        self.started = True
+        self.saved_list = list(manager.recipe_list)
+        self.saved_live = bytearray(manager.live_bits)
+        self.saved_next_id = manager.next_id
+        self.saved_tags = list(manager.all_tags)
+        self.text_index, manager.text_index = manager.text_index, None
+        self.pantry_index, manager.pantry_index = manager.pantry_index, None
+
+    ## edited(self, recipe_object)
+    ##
+    ## Summary of the edit function:
+    ##
+    ## Tells storage straight away that an edited body is no longer a
+    ## copy of what is stored.
+    ##
+    ## Parameters : recipe_object - the recipe that was edited
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Storage only hears about the edit at commit, and a lazily loaded
+    ## body could otherwise be unloaded and read back from the file
+    ## before then.
+
+    def edited(self, recipe_object):
+        self.manager.storage.forget_body(recipe_object)
+
+    ## changes(self)
+    ##
+    ## Summary of the net change function:
+    ##
+    ## Works out what happened to each touched recipe overall.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : list of (op, name, recipe_object) for record_many
+    ##
+    ## Description:
+    ##
+    ## A recipe that was there before and still is was updated (under its
+    ## old name), one that is new was added and one that is gone was
+    ## deleted. A recipe added and deleted in the same batch is left out.
+    ## The changes are in the order the recipes were first touched.
+
+    def changes(self):
+        recipe_ids = self.manager.recipe_ids
+        changes = []
+        for recipe_object, (was_live, name, recipe_id) in self.touched.items():
+            live = recipe_object in recipe_ids
+            if was_live and live:
+                changes.append(("update", name, recipe_object))
+            elif live:
+                changes.append(("add", recipe_object.name, recipe_object))
+            elif was_live:
+                changes.append(("delete", name, recipe_object))
+        return changes
+
+    ## commit(self)
+    ##
+    ## Summary of the commit function:
+    ##
+    ## Brings everything that was held back up to date at once.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Updates the indexes, tells the tag listeners which tags came into
+    ## or went out of use over the whole batch, then hands the net changes
+    ## to the storage backend's record_many, which stores them in one
+    ## write.
+
+    def commit(self):
+        if not self.started:
+            return
+        manager = self.manager
+        self.update_indexes()
+        before = set(self.saved_tags)
+        after = set(manager.all_tags)
+        added = [tag for tag in manager.all_tags if tag not in before]
+        removed = [tag for tag in self.saved_tags if tag not in after]
+        if added or removed:
+            manager.notify_tags(added, removed)
+        changes = self.changes()
+        if changes:
+            manager.storage.record_many(manager, changes)
+
+    ## update_indexes(self)
+    ##
+    ## Summary of the index update function:
+    ##
+    ## Applies the batch's net changes to the held back indexes.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## An index built during the batch already has every change and
+    ## replaces the held back one. Otherwise each touched recipe is
+    ## updated once, however many times it changed. When the batch
+    ## touched more than a quarter of the library the held back indexes
+    ## are dropped instead, since building them again on the next search
+    ## is cheaper.
+
+    def update_indexes(self):
+        manager = self.manager
+        text_index, pantry_index = self.text_index, self.pantry_index
+        self.text_index = None
+        self.pantry_index = None
+        if len(self.touched) * 4 > len(manager.recipe_list):
+            return
+        if manager.text_index is None and text_index is not None:
+            for recipe_object, (was_live, name, recipe_id) in self.touched.items():
+                live = recipe_object in manager.recipe_ids
+                if was_live and live:
+                    text_index.update(recipe_object)
+                elif live:
+                    text_index.add(recipe_object)
+                elif was_live:
+                    text_index.remove(recipe_object)
+            manager.text_index = text_index
+        if manager.pantry_index is None and pantry_index is not None:
+            for recipe_object, (was_live, name, recipe_id) in self.touched.items():
+                if was_live:
+                    pantry_index.remove(recipe_id, manager.set_bit)
+                if recipe_object in manager.recipe_ids:
+                    pantry_index.add(manager.recipe_ids[recipe_object], recipe_object.ingredients, manager.set_bit)
+            manager.pantry_index = pantry_index
+
+    ## rollback(self)
+    ##
+    ## Summary of the rollback function:
+    ##
+    ## Puts the manager back the way it was before the batch.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## recipe_list and all_tags are restored in place because the window
+    ## keeps references to them. Nothing reached storage or the tag
+    ## listeners, so they need no undoing; the held back indexes never
+    ## saw the changes, so they are put back as they were and any index
+    ## built during the batch is thrown away.
+
+    def rollback(self):
+        if not self.started:
+            return
+        manager = self.manager
+        for recipe_object, values in self.saved_values.items():
+            recipe_object.set_values(*values)
+        manager.recipe_list[:] = self.saved_list
+        for name, (entry, count) in self.saved_names.items():
+            if entry is MISSING:
+                manager.recipe_index.pop(name, None)
+            else:
+                manager.recipe_index[name] = entry
+            if count is MISSING:
+                manager.name_counts.pop(name, None)
+            else:
+                manager.name_counts[name] = count
+        for recipe_object in self.touched:
+            recipe_id = manager.recipe_ids.pop(recipe_object, None)
+            if recipe_id is not None:
+                del manager.id_recipes[recipe_id]
+        for recipe_object, (was_live, name, recipe_id) in self.touched.items():
+            if was_live:
+                manager.recipe_ids[recipe_object] = recipe_id
+                manager.id_recipes[recipe_id] = recipe_object
+        manager.live_bits[:] = self.saved_live
+        manager.live_mask = None
+        manager.next_id = self.saved_next_id
+        for tag, (count, bits) in self.saved_tag_state.items():
+            manager.tag_masks.pop(tag, None)
+            if count is MISSING:
+                manager.tag_counts.pop(tag, None)
+                manager.tag_bits.pop(tag, None)
+            else:
+                manager.tag_counts[tag] = count
+                manager.tag_bits[tag] = bits
+        manager.all_tags[:] = self.saved_tags
+        manager.text_index = self.text_index
+        manager.pantry_index = self.pantry_index
+        self.text_index = None
+        self.pantry_index = None
+        manager.forget_queries()
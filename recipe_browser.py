@@ -0,0 +1,768 @@
+##-----------------------------------------------------------------------
+## File : recipe_browser.py
+##
+## Description: The recipe browser in the top left of the main window. A
+##              search box sits above a list that only ever holds the
+##              rows that fit on screen, so the number of recipes does not
+##              change how much Tk has to draw. Names are kept in a sorted
+##              index that answers prefix searches with a binary search
+##              and substring searches through a table of three letter
+##              pieces of each name.
+##-----------------------------------------------------------------------
+
+import heapq
+import tkinter as tk
+from bisect import bisect_left, insort
+from tkinter import *
+
+BROWSER_ROWS = 6
+GRAM_LENGTH = 3
+
+
+## name_key(name)
+##
+## Summary of the sort key helper:
+##
+## Returns the key a name is sorted and searched by.
+##
+## Parameters : name - recipe name
+##
+## Return Value : tuple (case folded name, name)
+##
+## Description:
+##
+## Sorting by the folded name ignores case; the name itself breaks ties
+## so the order is always the same.
+
+def name_key(name):
+    return name.casefold(), name
+
+
+## name_grams(folded)
+##
+## Summary of the gram helper:
+##
+## Returns every three letter piece of a folded name.
+##
+## Parameters : folded - case folded recipe name
+##
+## Return Value : set of strings
+
+def name_grams(folded):
+    return {folded[index:index + GRAM_LENGTH] for index in range(len(folded) - GRAM_LENGTH + 1)}
+
+
+## class name_index
+##
+## Description:
+##
+##   Sorted, searchable set of recipe names. Two recipes with the same
+##   name share one entry, since selecting either one by name finds the
+##   same recipe.
+##
+## Data members:
+##
+##   keys : Sorted list of name_key for every distinct name.
+##   counts : Mapping name -> number of recipes with that name.
+##   grams : Mapping three letter piece -> set of names containing it.
+##
+## Methods:
+##
+##   __init__ - build the index from a list of names.
+##   add - add one name.
+##   add_many - add a batch of names with one sort.
+##   remove - remove one name.
+##   position - where a name is in sorted order.
+##   prefix_matches - names starting with some text.
+##   substring_matches - names containing but not starting with some text.
+
+class name_index:
+
+    ## __init__(self, names=())
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Builds the index.
+    ##
+    ## Parameters : names - recipe names, duplicates allowed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Sorts once instead of inserting names one at a time.
+
+    def __init__(self, names=()):
+        self.counts = {}
+        self.grams = {}
+        for name in names:
+            self.counts[name] = self.counts.get(name, 0) + 1
+        self.keys = sorted(name_key(name) for name in self.counts)
+        for folded, name in self.keys:
+            for gram in name_grams(folded):
+                self.grams.setdefault(gram, set()).add(name)
+
+    ## add(self, name)
+    ##
+    ## Summary of the add function:
+    ##
+    ## Adds one recipe name.
+    ##
+    ## Parameters : name - recipe name
+    ##
+    ## Return Value : True if the name was not in the index before
+
+    def add(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if self.counts[name] > 1:
+            return False
+        key = name_key(name)
+        insort(self.keys, key)
+        for gram in name_grams(key[0]):
+            self.grams.setdefault(gram, set()).add(name)
+        return True
+
+    ## add_many(self, names)
+    ##
+    ## Summary of the batch add function:
+    ##
+    ## Adds a batch of recipe names.
+    ##
+    ## Parameters : names - recipe names, duplicates allowed
+    ##
+    ## Return Value : list of name_key for the names that were new
+    ##
+    ## Description:
+    ##
+    ## The new keys are appended and the list sorted again, which Python's
+    ## sort does as a merge of two sorted runs, instead of one insort per
+    ## name.
+
+    def add_many(self, names):
+        added = []
+        for name in names:
+            count = self.counts.get(name, 0)
+            self.counts[name] = count + 1
+            if count == 0:
+                key = name_key(name)
+                added.append(key)
+                for gram in name_grams(key[0]):
+                    self.grams.setdefault(gram, set()).add(name)
+        self.keys.extend(added)
+        self.keys.sort()
+        return added
+
+    ## remove(self, name)
+    ##
+    ## Summary of the remove function:
+    ##
+    ## Removes one recipe name.
+    ##
+    ## Parameters : name - recipe name
+    ##
+    ## Return Value : True if no recipe has the name any more
+
+    def remove(self, name):
+        count = self.counts.get(name, 0)
+        if count == 0:
+            return False
+        if count > 1:
+            self.counts[name] = count - 1
+            return False
+        del self.counts[name]
+        key = name_key(name)
+        del self.keys[bisect_left(self.keys, key)]
+        for gram in name_grams(key[0]):
+            names = self.grams[gram]
+            names.discard(name)
+            if not names:
+                del self.grams[gram]
+        return True
+
+    ## position(self, name)
+    ##
+    ## Summary of the position function:
+    ##
+    ## Finds a name in sorted order.
+    ##
+    ## Parameters : name - recipe name
+    ##
+    ## Return Value : index into keys, or -1 if the name is not there
+
+    def position(self, name):
+        key = name_key(name)
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return -1
+
+    ## prefix_matches(self, text)
+    ##
+    ## Summary of the prefix search function:
+    ##
+    ## Returns the keys of names starting with some text.
+    ##
+    ## Parameters : text - case folded search text
+    ##
+    ## Return Value : sorted list of name_key
+    ##
+    ## Description:
+    ##
+    ## The matches are one run of the sorted keys, found with two binary
+    ## searches.
+
+    def prefix_matches(self, text):
+        start = bisect_left(self.keys, (text,))
+        end = bisect_left(self.keys, (text + "\U0010ffff",))
+        return self.keys[start:end]
+
+    ## substring_matches(self, text)
+    ##
+    ## Summary of the substring search function:
+    ##
+    ## Returns the keys of names that contain some text somewhere other
+    ## than at the start.
+    ##
+    ## Parameters : text - case folded search text
+    ##
+    ## Return Value : sorted list of name_key
+    ##
+    ## Description:
+    ##
+    ## Text of three letters or more only checks the names that contain
+    ## every three letter piece of it, starting from the rarest piece.
+    ## Shorter text has to check every name.
+
+    def substring_matches(self, text):
+        if len(text) < GRAM_LENGTH:
+            return [key for key in self.keys if text in key[0] and not key[0].startswith(text)]
+        postings = sorted((self.grams.get(gram, set()) for gram in name_grams(text)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        found = []
+        for name in candidates:
+            key = name_key(name)
+            if text in key[0] and not key[0].startswith(text):
+                found.append(key)
+        found.sort()
+        return found
+
+
+## class recipe_browser
+##
+## Description:
+##
+##   Search box plus a list of recipe names that only holds the visible
+##   rows. The rows shown are a window into the current view: every name
+##   when the search box is empty, otherwise the names starting with the
+##   search text followed by the names containing it. Scrolling moves the
+##   window and redraws BROWSER_ROWS rows.
+##
+## Data members:
+##
+##   index : name_index of every recipe name.
+##   variable : StringVar holding the selected recipe name.
+##   command : Function called after the user selects a recipe.
+##   query : Current case folded search text.
+##   parts : Sorted lists of name_key making up the view, in order.
+##   top : View position of the first visible row.
+##   frame, search_var, search_entry, listbox, scrollbar : Tk widgets.
+##
+## Methods:
+##
+##   __init__ - build the widgets and the name index.
+##   pack - place the browser in its parent.
+##   view_size / view_name / view_position - read the current view.
+##   search - change the search text.
+##   matches_query - which part of the view a name belongs in.
+##   add / remove / rename - apply one change to the recipe names.
+##   add_names - add a batch of names while recipes are still loading.
+##   reset - replace every name.
+##   clear_selection - forget the selected recipe.
+##   neighbours - names next to a name in sorted order.
+##   render - redraw the visible rows.
+##   scroll_to / scroll / on_scrollbar / on_wheel - move the window.
+##   select_row / move_selection / on_listbox_select / on_return - choose
+##       a recipe with the mouse or keyboard.
+
+class recipe_browser:
+
+    ## __init__(self, parent, variable, names, command)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Builds the search box and list and indexes the names.
+    ##
+    ## Parameters :
+    ##    parent - frame to build the browser in
+    ##    variable - StringVar that receives the selected name
+    ##    names - every recipe name
+    ##    command - function called with no arguments after a selection
+    ##
+    ## Return Value : none
+
+    def __init__(self, parent, variable, names, command):
+        self.index = name_index(names)
+        self.variable = variable
+        self.command = command
+        self.query = ""
+        self.parts = [self.index.keys]
+        self.top = 0
+
+        self.frame = Frame(parent, bg="lightgrey")
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(self.frame, textvariable=self.search_var)
+        self.search_entry.pack(side="top", fill="x")
+        self.scrollbar = tk.Scrollbar(self.frame, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox = tk.Listbox(self.frame, height=BROWSER_ROWS, selectmode="browse", exportselection=False, activestyle="none")
+        self.listbox.pack(side="left", fill="both", expand=True)
+
+        self.search_var.trace_add("write", lambda *args: self.search(self.search_var.get()))
+        self.listbox.bind("<<ListboxSelect>>", self.on_listbox_select)
+        for widget in (self.listbox, self.search_entry):
+            widget.bind("<Down>", lambda event: self.move_selection(1))
+            widget.bind("<Up>", lambda event: self.move_selection(-1))
+            widget.bind("<Next>", lambda event: self.scroll(BROWSER_ROWS))
+            widget.bind("<Prior>", lambda event: self.scroll(-BROWSER_ROWS))
+        self.search_entry.bind("<Return>", self.on_return)
+        self.listbox.bind("<MouseWheel>", self.on_wheel)
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(1))
+        self.render()
+
+    ## pack(self, **options)
+    ##
+    ## Summary of the pack function:
+    ##
+    ## Packs the browser frame with the given options.
+    ##
+    ## Parameters : options - pack options
+    ##
+    ## Return Value : none
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    ## view_size(self)
+    ##
+    ## Summary of the view size function:
+    ##
+    ## Returns how many names the current view holds.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : int
+
+    def view_size(self):
+        return sum(len(part) for part in self.parts)
+
+    ## view_name(self, position)
+    ##
+    ## Summary of the view lookup function:
+    ##
+    ## Returns the name at a position of the current view.
+    ##
+    ## Parameters : position - 0-based view position
+    ##
+    ## Return Value : recipe name
+
+    def view_name(self, position):
+        for part in self.parts:
+            if position < len(part):
+                return part[position][1]
+            position -= len(part)
+        raise IndexError(position)
+
+    ## view_position(self, name)
+    ##
+    ## Summary of the view position function:
+    ##
+    ## Finds a name in the current view.
+    ##
+    ## Parameters : name - recipe name
+    ##
+    ## Return Value : 0-based view position, or -1 if it is not shown
+
+    def view_position(self, name):
+        key = name_key(name)
+        offset = 0
+        for part in self.parts:
+            index = bisect_left(part, key)
+            if index < len(part) and part[index] == key:
+                return offset + index
+            offset += len(part)
+        return -1
+
+    ## search(self, text)
+    ##
+    ## Summary of the search function:
+    ##
+    ## Shows only the names matching some search text.
+    ##
+    ## Parameters : text - what the user typed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Names starting with the text come first, then names containing it.
+    ## When the new text just adds letters to the old text the matches
+    ## can only shrink, so the old matches are filtered instead of
+    ## searching the whole index again.
+
+    def search(self, text):
+        query = text.casefold()
+        if not query:
+            self.parts = [self.index.keys]
+        elif self.query and query.startswith(self.query):
+            prefix, rest = self.parts
+            new_prefix = [key for key in prefix if key[0].startswith(query)]
+            moved = [key for key in prefix if query in key[0] and not key[0].startswith(query)]
+            kept = [key for key in rest if query in key[0]]
+            self.parts = [new_prefix, list(heapq.merge(moved, kept))]
+        else:
+            self.parts = [self.index.prefix_matches(query), self.index.substring_matches(query)]
+        self.query = query
+        self.scroll_to(0)
+
+    ## matches_query(self, key)
+    ##
+    ## Summary of the match check:
+    ##
+    ## Finds which part of the current view a name belongs in.
+    ##
+    ## Parameters : key - name_key of the name
+    ##
+    ## Return Value : the part list, or None if the name does not match
+
+    def matches_query(self, key):
+        if not self.query:
+            return None
+        if key[0].startswith(self.query):
+            return self.parts[0]
+        if self.query in key[0]:
+            return self.parts[1]
+        return None
+
+    ## add(self, name)
+    ##
+    ## Summary of the add function:
+    ##
+    ## Adds a new recipe name to the browser.
+    ##
+    ## Parameters : name - recipe name
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The name goes into the index, and into the search results if it
+    ## matches the search text; only the visible rows are redrawn.
+
+    def add(self, name):
+        if self.index.add(name):
+            part = self.matches_query(name_key(name))
+            if part is not None:
+                insort(part, name_key(name))
+        self.render()
+
+    ## add_names(self, names)
+    ##
+    ## Summary of the batch add function:
+    ##
+    ## Adds the names of a batch of loaded recipes to the browser.
+    ##
+    ## Parameters : names - recipe names
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Used while the library loads in steps. A search in progress is run
+    ## again over the grown index, keeping the scroll position.
+
+    def add_names(self, names):
+        if self.index.add_many(names) and self.query:
+            self.parts = [self.index.prefix_matches(self.query), self.index.substring_matches(self.query)]
+        self.render()
+
+    ## reset(self, names)
+    ##
+    ## Summary of the reset function:
+    ##
+    ## Replaces every name in the browser.
+    ##
+    ## Parameters : names - every recipe name
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The index is rebuilt and the search text applied to it again.
+
+    def reset(self, names):
+        self.index = name_index(names)
+        self.query = ""
+        self.search(self.search_var.get())
+
+    ## remove(self, name)
+    ##
+    ## Summary of the remove function:
+    ##
+    ## Removes a deleted recipe's name from the browser.
+    ##
+    ## Parameters : name - recipe name
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The name stays while another recipe still has it.
+
+    def remove(self, name):
+        if self.index.remove(name):
+            key = name_key(name)
+            part = self.matches_query(key)
+            if part is not None:
+                del part[bisect_left(part, key)]
+        self.render()
+
+    ## rename(self, old_name, new_name)
+    ##
+    ## Summary of the rename function:
+    ##
+    ## Moves a renamed recipe to its new place in the browser.
+    ##
+    ## Parameters :
+    ##    old_name - the recipe's name before the edit
+    ##    new_name - the recipe's name after it
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## If the renamed recipe was selected, the new name is selected.
+
+    def rename(self, old_name, new_name):
+        if old_name == new_name:
+            return
+        self.remove(old_name)
+        self.add(new_name)
+        if self.variable.get() == old_name:
+            self.variable.set(new_name)
+            self.render()
+
+    ## clear_selection(self)
+    ##
+    ## Summary of the clear function:
+    ##
+    ## Leaves no recipe selected.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def clear_selection(self):
+        self.variable.set("")
+        self.render()
+
+    ## neighbours(self, name, count)
+    ##
+    ## Summary of the neighbour function:
+    ##
+    ## Returns the names either side of a name in the browser, nearest
+    ## first.
+    ##
+    ## Parameters :
+    ##    name - recipe name
+    ##    count - how many names to take on each side
+    ##
+    ## Return Value : list of names
+    ##
+    ## Description:
+    ##
+    ## Uses the current view so it follows what the user sees.
+
+    def neighbours(self, name, count):
+        position = self.view_position(name)
+        if position == -1:
+            return []
+        size = self.view_size()
+        found = []
+        for step in range(1, count + 1):
+            for index in (position + step, position - step):
+                if 0 <= index < size:
+                    found.append(self.view_name(index))
+        return found
+
+    ## render(self)
+    ##
+    ## Summary of the render function:
+    ##
+    ## Redraws the visible rows and the scrollbar.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Inserts at most BROWSER_ROWS names and highlights the selected one
+    ## if it is among them.
+
+    def render(self):
+        size = self.view_size()
+        self.top = max(0, min(self.top, size - BROWSER_ROWS))
+        rows = [self.view_name(position) for position in range(self.top, min(size, self.top + BROWSER_ROWS))]
+        self.listbox.delete(0, "end")
+        if rows:
+            self.listbox.insert(0, *rows)
+        chosen = self.variable.get()
+        for row, name in enumerate(rows):
+            if name == chosen:
+                self.listbox.selection_set(row)
+                break
+        if size > BROWSER_ROWS:
+            self.scrollbar.set(self.top / size, (self.top + BROWSER_ROWS) / size)
+        else:
+            self.scrollbar.set(0, 1)
+
+    ## scroll_to(self, position)
+    ##
+    ## Summary of the scroll function:
+    ##
+    ## Makes a view position the first visible row.
+    ##
+    ## Parameters : position - 0-based view position
+    ##
+    ## Return Value : none
+
+    def scroll_to(self, position):
+        self.top = position
+        self.render()
+
+    ## scroll(self, rows)
+    ##
+    ## Summary of the relative scroll function:
+    ##
+    ## Moves the visible rows up or down.
+    ##
+    ## Parameters : rows - how many rows to move (negative is up)
+    ##
+    ## Return Value : "break" so Tk does not scroll the list itself
+
+    def scroll(self, rows):
+        self.scroll_to(self.top + rows)
+        return "break"
+
+    ## on_scrollbar(self, action, amount, unit=None)
+    ##
+    ## Summary of the scrollbar handler:
+    ##
+    ## Moves the visible rows when the scrollbar is used.
+    ##
+    ## Parameters :
+    ##    action - "moveto" or "scroll"
+    ##    amount - fraction for moveto, step count for scroll
+    ##    unit - "units" or "pages" for scroll
+    ##
+    ## Return Value : none
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.view_size()))
+        elif unit == "pages":
+            self.scroll(int(amount) * BROWSER_ROWS)
+        else:
+            self.scroll(int(amount))
+
+    ## on_wheel(self, event)
+    ##
+    ## Summary of the mouse wheel handler:
+    ##
+    ## Scrolls three rows per wheel step.
+    ##
+    ## Parameters : event - Tk mouse wheel event
+    ##
+    ## Return Value : "break"
+
+    def on_wheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    ## select_row(self, position)
+    ##
+    ## Summary of the selection function:
+    ##
+    ## Selects the recipe at a view position and tells the window.
+    ##
+    ## Parameters : position - 0-based view position
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Scrolls just enough for the row to be visible.
+
+    def select_row(self, position):
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + BROWSER_ROWS:
+            self.top = position - BROWSER_ROWS + 1
+        self.variable.set(self.view_name(position))
+        self.render()
+        self.command()
+
+    ## move_selection(self, step)
+    ##
+    ## Summary of the keyboard selection function:
+    ##
+    ## Selects the row above or below the selected one.
+    ##
+    ## Parameters : step - 1 for down, -1 for up
+    ##
+    ## Return Value : "break"
+    ##
+    ## Description:
+    ##
+    ## With nothing selected in the view, Down picks the first row.
+
+    def move_selection(self, step):
+        size = self.view_size()
+        if size:
+            position = self.view_position(self.variable.get())
+            if position == -1:
+                position = self.top
+            else:
+                position = max(0, min(size - 1, position + step))
+            self.select_row(position)
+        return "break"
+
+    ## on_listbox_select(self, event)
+    ##
+    ## Summary of the click handler:
+    ##
+    ## Selects the recipe the user clicked.
+    ##
+    ## Parameters : event - Tk event
+    ##
+    ## Return Value : none
+
+    def on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.select_row(self.top + selection[0])
+
+    ## on_return(self, event)
+    ##
+    ## Summary of the enter key handler:
+    ##
+    ## Selects the first search result.
+    ##
+    ## Parameters : event - Tk event
+    ##
+    ## Return Value : "break"
+
+    def on_return(self, event):
+        if self.view_size():
+            self.select_row(0)
+        return "break"
@@ -0,0 +1,505 @@
+##-----------------------------------------------------------------------
+## File : recipe_cli.py
+##
+## Description: Command line tools for working with recipe libraries on
+##              a machine without a display. Run it as
+##              "python -m recipe_cli <command> ..." with one of the
+##              commands import, export, query, dedupe or validate. It
+##              never imports tkinter or PIL. Recipes are streamed one at
+##              a time wherever the command allows it, and every command
+##              reports how many recipes per second it handled on stderr.
+##-----------------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+from bulk_import import COLLISION_POLICIES, JSONL_SUFFIX, bulk_import, file_recipes
+from ingredient_index import normalize_ingredient
+from recipe_journal import fields_recipe, recipe_fields
+from recipe_manager import recipe_manager
+from recipe_parser import ENCODING, RecipeParseError, format_recipe, iter_records, parse_record
+from recipe_storage import sqlite_storage, text_storage
+from search_index import recipe_terms, tokenize
+
+OUTPUT_FORMATS = ("txt", "jsonl", "names")
+
+
+## report(action, count, started)
+##
+## Summary of the throughput report:
+##
+## Prints how many recipes a command handled and how fast.
+##
+## Parameters :
+##    action - what was done, e.g. "exported"
+##    count - number of recipes
+##    started - time.perf_counter() value from when the work started
+##
+## Return Value : none
+##
+## Description:
+##
+## Goes to stderr so it never mixes with recipes written to stdout.
+
+def report(action, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"{action} {count} recipes in {elapsed:.2f} s ({rate:.0f} recipes/s)", file=sys.stderr)
+
+
+## read_records(path)
+##
+## Summary of the located record reader:
+##
+## Streams the recipes of a recipe file along with where each one is.
+##
+## Parameters : path - a recipes text file, or a .jsonl export
+##
+## Return Value : generator of (location text, Recipe)
+##
+## Description:
+##
+## Text files go through recipe_parser and .jsonl files hold one
+## recipe_journal.recipe_fields list per line. A broken record raises
+## RecipeParseError (or ValueError for a bad JSON line) after every
+## recipe before it.
+
+def read_records(path):
+    if path.endswith(JSONL_SUFFIX):
+        with open(path, "r", encoding=ENCODING) as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    recipe_object = fields_recipe(json.loads(line))
+                except (ValueError, TypeError) as error:
+                    raise ValueError(f"line {line_number}: {error}") from None
+                yield f"line {line_number}", recipe_object
+    else:
+        for record_number, offset, length, blocks in iter_records(path):
+            yield f"record {record_number} at byte {offset}", parse_record(blocks)
+
+
+## library_storage(use_sqlite)
+##
+## Summary of the backend chooser:
+##
+## Returns the storage backend for a library.
+##
+## Parameters : use_sqlite - True for an SQLite database
+##
+## Return Value : sqlite_storage or text_storage
+
+def library_storage(use_sqlite):
+    return sqlite_storage() if use_sqlite else text_storage()
+
+
+## library_recipes(path, use_sqlite)
+##
+## Summary of the library reader:
+##
+## Streams every recipe of a library in list order.
+##
+## Parameters :
+##    path - recipes file or database
+##    use_sqlite - True for an SQLite database
+##
+## Return Value : iterator of Recipe
+##
+## Description:
+##
+## Uses the backend's stream when it can. A text library with journaled
+## changes still to replay is loaded into a recipe_manager instead, so
+## the changes are not lost.
+
+def library_recipes(path, use_sqlite):
+    storage = library_storage(use_sqlite)
+    recipes = storage.stream(path)
+    if recipes is None:
+        manager = recipe_manager(storage)
+        manager.load_recipes(path)
+        recipes = iter(manager.recipe_list)
+    return recipes
+
+
+## open_output(path)
+##
+## Summary of the output opener:
+##
+## Opens the file a command writes to.
+##
+## Parameters : path - output file, or "-" for stdout
+##
+## Return Value : text file object
+
+def open_output(path):
+    if path == "-":
+        return open(sys.stdout.fileno(), "w", encoding=ENCODING, closefd=False)
+    return open(path, "w", encoding=ENCODING)
+
+
+## output_format(path, chosen)
+##
+## Summary of the format chooser:
+##
+## Picks the format recipes are written in.
+##
+## Parameters :
+##    path - output file, or "-"
+##    chosen - format given on the command line, or None
+##
+## Return Value : "txt", "jsonl" or "names"
+##
+## Description:
+##
+## Without --format a .jsonl file gets JSON lines and anything else the
+## recipes.txt format.
+
+def output_format(path, chosen):
+    if chosen is not None:
+        return chosen
+    return "jsonl" if path.endswith(JSONL_SUFFIX) else "txt"
+
+
+## write_recipes(recipes, file, file_format)
+##
+## Summary of the recipe writer:
+##
+## Writes recipes to a file as they arrive.
+##
+## Parameters :
+##    recipes - iterable of Recipe
+##    file - open text file
+##    file_format - "txt", "jsonl" or "names"
+##
+## Return Value : number of recipes written
+
+def write_recipes(recipes, file, file_format):
+    count = 0
+    for recipe_object in recipes:
+        if file_format == "txt":
+            file.write(format_recipe(recipe_object))
+        elif file_format == "jsonl":
+            file.write(json.dumps(recipe_fields(recipe_object), ensure_ascii=False) + "\n")
+        else:
+            file.write(recipe_object.name + "\n")
+        count += 1
+    return count
+
+
+## recipe_matcher(match_all, match_any, match_none, ingredients, text)
+##
+## Summary of the query builder:
+##
+## Builds a test for whether one recipe matches a query.
+##
+## Parameters :
+##    match_all - tags every result must have (AND)
+##    match_any - tags of which a result must have at least one (OR)
+##    match_none - tags no result may have (NOT)
+##    ingredients - ingredients every result must use
+##    text - words every result must contain
+##
+## Return Value : function(Recipe) -> bool
+##
+## Description:
+##
+## Works on one recipe at a time so a query can stream a library of any
+## size. Ingredients are compared after normalize_ingredient and words
+## after the search stemmer, the same as the app's pantry and full text
+## searches.
+
+def recipe_matcher(match_all, match_any, match_none, ingredients, text):
+    match_all = set(match_all)
+    match_any = set(match_any)
+    match_none = set(match_none)
+    wanted_ingredients = {name for name in map(normalize_ingredient, ingredients) if name}
+    wanted_terms = set(tokenize(text))
+
+    def matches(recipe_object):
+        tags = set(recipe_object.tags)
+        if not tags >= match_all or (match_any and tags.isdisjoint(match_any)) or not tags.isdisjoint(match_none):
+            return False
+        if wanted_ingredients and not wanted_ingredients <= {normalize_ingredient(ingredient) for ingredient, amount in recipe_object.ingredients}:
+            return False
+        if wanted_terms and not wanted_terms <= recipe_terms(recipe_object)[0].keys():
+            return False
+        return True
+
+    return matches
+
+
+## recipe_digest(recipe_object, by)
+##
+## Summary of the duplicate key function:
+##
+## Returns what two recipes must share to count as duplicates.
+##
+## Parameters :
+##    recipe_object - the recipe
+##    by - "name" or "content"
+##
+## Return Value : 16 byte digest
+##
+## Description:
+##
+## A fixed size digest keeps the memory per distinct recipe small no
+## matter how long the recipes are.
+
+def recipe_digest(recipe_object, by):
+    key = recipe_object.name if by == "name" else format_recipe(recipe_object)
+    return hashlib.blake2b(key.encode(ENCODING), digest_size=16).digest()
+
+
+## recipe_problems(recipe_object)
+##
+## Summary of the recipe checker:
+##
+## Lists what is wrong with one recipe.
+##
+## Parameters : recipe_object - the recipe to check
+##
+## Return Value : list of problem descriptions
+
+def recipe_problems(recipe_object):
+    problems = []
+    if not recipe_object.name:
+        problems.append("recipe has no name")
+    if not recipe_object.ingredients:
+        problems.append("recipe has no ingredients")
+    if any(not ingredient.strip() for ingredient, amount in recipe_object.ingredients):
+        problems.append("ingredient with no name")
+    if len(set(recipe_object.tags)) != len(recipe_object.tags):
+        problems.append("tag listed twice")
+    return problems
+
+
+## import_command(args)
+##
+## Summary of the import command:
+##
+## Adds the recipes of one or more files to a library.
+##
+## Parameters : args - parsed command line
+##
+## Return Value : process exit status (1 when a file could not be fully
+##                read)
+##
+## Description:
+##
+## The library is loaded, the input files are parsed in parallel by
+## bulk_import and the library is saved once at the end rather than
+## journaled one recipe at a time. Names that are already taken are
+## handled by --on-collision.
+
+def import_command(args):
+    manager = recipe_manager(library_storage(args.sqlite))
+    manager.load_recipes(args.library)
+    started = time.perf_counter()
+    counts = bulk_import(manager, args.files, args.on_collision, args.workers)
+    manager.save_recipes(args.library)
+    for path, error in counts["errors"]:
+        print(f"{path}: {error}", file=sys.stderr)
+    print(f"added {counts['added']}, skipped {counts['skipped']}, overwritten {counts['overwritten']}, renamed {counts['renamed']}", file=sys.stderr)
+    report("imported", counts["added"] + counts["skipped"] + counts["overwritten"] + counts["renamed"], started)
+    return 1 if counts["errors"] else 0
+
+
+## export_command(args)
+##
+## Summary of the export command:
+##
+## Writes every recipe of a library to a file or stdout.
+##
+## Parameters : args - parsed command line
+##
+## Return Value : process exit status
+
+def export_command(args):
+    started = time.perf_counter()
+    with open_output(args.output) as file:
+        count = write_recipes(library_recipes(args.library, args.sqlite), file, output_format(args.output, args.format))
+    report("exported", count, started)
+    return 0
+
+
+## query_command(args)
+##
+## Summary of the query command:
+##
+## Writes the recipes of a library that match tags, ingredients and
+## words.
+##
+## Parameters : args - parsed command line
+##
+## Return Value : process exit status (1 when nothing matched)
+##
+## Description:
+##
+## Prints matching names by default. The library is streamed, so the
+## query only holds the recipe it is looking at.
+
+def query_command(args):
+    matches = recipe_matcher(args.all, args.any, args.none, args.ingredient, args.text)
+    started = time.perf_counter()
+    scanned = 0
+    found = 0
+    with open_output(args.output) as file:
+        for recipe_object in library_recipes(args.library, args.sqlite):
+            scanned += 1
+            if matches(recipe_object):
+                found += write_recipes([recipe_object], file, args.format)
+    report(f"matched {found} of", scanned, started)
+    return 0 if found else 1
+
+
+## dedupe_command(args)
+##
+## Summary of the dedupe command:
+##
+## Copies a recipe file, leaving out repeated recipes.
+##
+## Parameters : args - parsed command line
+##
+## Return Value : process exit status
+##
+## Description:
+##
+## The first recipe with a name (or with exactly the same contents) is
+## kept. Only a 16 byte digest per distinct recipe is remembered.
+
+def dedupe_command(args):
+    seen = set()
+    started = time.perf_counter()
+    scanned = 0
+
+    def first_copies():
+        nonlocal scanned
+        for recipe_object in file_recipes(args.source):
+            scanned += 1
+            digest = recipe_digest(recipe_object, args.by)
+            if digest not in seen:
+                seen.add(digest)
+                yield recipe_object
+
+    with open_output(args.output) as file:
+        kept = write_recipes(first_copies(), file, output_format(args.output, args.format))
+    print(f"kept {kept}, dropped {scanned - kept} duplicates", file=sys.stderr)
+    report("deduplicated", scanned, started)
+    return 0
+
+
+## validate_command(args)
+##
+## Summary of the validate command:
+##
+## Checks recipe files and lists every problem found.
+##
+## Parameters : args - parsed command line
+##
+## Return Value : process exit status (1 when a problem was found)
+##
+## Description:
+##
+## Reports unreadable records, recipes without a name or ingredients,
+## blank ingredient names, repeated tags and repeated recipe names
+## within a file. Reading a file stops at a record that cannot be
+## parsed.
+
+def validate_command(args):
+    started = time.perf_counter()
+    count = 0
+    problems = 0
+    for path in args.files:
+        names = set()
+        try:
+            for location, recipe_object in read_records(path):
+                count += 1
+                found = recipe_problems(recipe_object)
+                digest = recipe_digest(recipe_object, "name")
+                if digest in names:
+                    found.append(f"duplicate name {recipe_object.name!r}")
+                names.add(digest)
+                for problem in found:
+                    print(f"{path}: {location}: {problem}")
+                problems += len(found)
+        except (OSError, ValueError) as error:
+            print(f"{path}: {error}")
+            problems += 1
+    print(f"{problems} problems found", file=sys.stderr)
+    report("validated", count, started)
+    return 1 if problems else 0
+
+
+## main(argv=None)
+##
+## Summary of the command line entry point:
+##
+## Parses the command line and runs one command.
+##
+## Parameters : argv - argument list (defaults to sys.argv[1:])
+##
+## Return Value : process exit status
+##
+## Description:
+##
+## Libraries are recipes text files unless --sqlite is given. Recipe
+## files given to import, dedupe and validate can be text files or
+## .jsonl exports. A broken recipes file is reported on stderr with
+## exit status 2.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m recipe_cli", description="Import, export, query, dedupe and validate recipe libraries without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="add the recipes of one or more files to a library")
+    import_parser.add_argument("library")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--on-collision", choices=COLLISION_POLICIES, default="skip", help="what to do with a name the library already has")
+    import_parser.add_argument("--workers", type=int, help="parser processes (defaults to the CPU count)")
+    import_parser.set_defaults(run=import_command)
+
+    export_parser = commands.add_parser("export", help="write every recipe of a library")
+    export_parser.add_argument("library")
+    export_parser.add_argument("output", nargs="?", default="-")
+    export_parser.add_argument("--format", choices=OUTPUT_FORMATS)
+    export_parser.set_defaults(run=export_command)
+
+    query_parser = commands.add_parser("query", help="list the recipes matching tags, ingredients and words")
+    query_parser.add_argument("library")
+    query_parser.add_argument("--all", nargs="+", default=[], metavar="TAG", help="tags every result must have")
+    query_parser.add_argument("--any", nargs="+", default=[], metavar="TAG", help="tags of which a result needs one")
+    query_parser.add_argument("--none", nargs="+", default=[], metavar="TAG", help="tags no result may have")
+    query_parser.add_argument("--ingredient", nargs="+", default=[], metavar="NAME", help="ingredients every result must use")
+    query_parser.add_argument("--text", default="", help="words every result must contain")
+    query_parser.add_argument("--format", choices=OUTPUT_FORMATS, default="names")
+    query_parser.add_argument("--output", default="-")
+    query_parser.set_defaults(run=query_command)
+
+    dedupe_parser = commands.add_parser("dedupe", help="copy a recipe file without repeated recipes")
+    dedupe_parser.add_argument("source")
+    dedupe_parser.add_argument("output", nargs="?", default="-")
+    dedupe_parser.add_argument("--by", choices=("name", "content"), default="name")
+    dedupe_parser.add_argument("--format", choices=OUTPUT_FORMATS)
+    dedupe_parser.set_defaults(run=dedupe_command)
+
+    validate_parser = commands.add_parser("validate", help="check recipe files for problems")
+    validate_parser.add_argument("files", nargs="+")
+    validate_parser.set_defaults(run=validate_command)
+
+    for command_parser in (import_parser, export_parser, query_parser):
+        command_parser.add_argument("--sqlite", action="store_true", help="the library is an SQLite database")
+
+    args = parser.parse_args(argv)
+    try:
+        return args.run(args)
+    except RecipeParseError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
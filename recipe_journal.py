@@ -0,0 +1,412 @@
+##-----------------------------------------------------------------------
+## File : recipe_journal.py
+##
+## Description: Append-only change journal that sits next to recipes.txt
+##              (as recipes.txt.journal). Every add, update and delete is
+##              written as one line and synced to disk straight away, so a
+##              single edit no longer rewrites the whole recipes file. The
+##              journal is replayed on top of recipes.txt at startup and
+##              emptied whenever recipes.txt is rewritten.
+##-----------------------------------------------------------------------
+
+import json
+import os
+
+from recipe import Recipe
+from recipe_parser import ENCODING
+
+JOURNAL_SUFFIX = ".journal"
+
+
+## journal_path(filename)
+##
+## Summary of the path helper:
+##
+## Returns where the journal for a recipes file is stored.
+##
+## Parameters : filename - path to the recipes text file
+##
+## Return Value : path of the journal file
+##
+## Description:
+##
+## The journal keeps the full text file name and adds ".journal".
+
+def journal_path(filename):
+    return filename + JOURNAL_SUFFIX
+
+
+## file_stamp(filename)
+##
+## Summary of the file stamp helper:
+##
+## Returns [size, mtime in nanoseconds] for a file, or None if it is
+## missing.
+##
+## Parameters : filename - path to the file
+##
+## Return Value : list [size, mtime_ns] or None
+##
+## Description:
+##
+## A list rather than a tuple so it compares equal to the value read
+## back from the journal header JSON.
+
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+## recipe_fields(recipe_object)
+##
+## Summary of the serialisation helper:
+##
+## Turns a Recipe into a JSON friendly list of its fields.
+##
+## Parameters : recipe_object - the recipe to serialise
+##
+## Return Value : list [name, photo_name, tags, ingredients, description]
+##
+## Description:
+##
+## Ingredient tuples become two item lists; fields_recipe turns them back.
+
+def recipe_fields(recipe_object):
+    return [recipe_object.name, recipe_object.photo_name, list(recipe_object.tags), [list(pair) for pair in recipe_object.ingredients], recipe_object.description]
+
+
+## fields_recipe(fields)
+##
+## Summary of the deserialisation helper:
+##
+## Builds a Recipe from a list made by recipe_fields.
+##
+## Parameters : fields - list [name, photo_name, tags, ingredients, description]
+##
+## Return Value : Recipe
+##
+## Description:
+##
+## Restores the (ingredient, amount) tuples the rest of the code expects.
+
+def fields_recipe(fields):
+    name, photo_name, tags, ingredients, description = fields
+    return Recipe(name, photo_name, list(tags), [tuple(pair) for pair in ingredients], description)
+
+
+## change_entry(op, name, recipe_object)
+##
+## Summary of the change record builder:
+##
+## Builds the journal record for one change.
+##
+## Parameters :
+##    op - "add", "update" or "delete"
+##    name - recipe name (the old name for an update)
+##    recipe_object - the recipe that changed (unused for a delete)
+##
+## Return Value : dictionary ready for json.dumps
+##
+## Description:
+##
+## Several records can be wrapped in one {"op": "batch", "changes": [...]}
+## record, which is replayed as all of its changes in order. Being one
+## line, a batch is either replayed whole or, if a crash cut it off, not
+## at all.
+
+def change_entry(op, name, recipe_object):
+    if op == "add":
+        return {"op": "add", "recipe": recipe_fields(recipe_object)}
+    if op == "update":
+        return {"op": "update", "name": name, "recipe": recipe_fields(recipe_object)}
+    return {"op": "delete", "name": name}
+
+
+## read_journal(filename)
+##
+## Summary of the journal reader:
+##
+## Returns the journal entries that still apply to a recipes file.
+##
+## Parameters : filename - path to the recipes text file
+##
+## Return Value : list of entry dictionaries
+##
+## Description:
+##
+## The first line of a journal records the size and mtime of the
+## recipes file it was started against. If recipes.txt no longer matches
+## that stamp the journal has already been folded into it (or the file
+## was replaced), so nothing is replayed. A last line cut off by a crash
+## is ignored.
+
+def read_journal(filename):
+    try:
+        with open(journal_path(filename), "r", encoding=ENCODING) as file:
+            lines = file.read().split("\n")
+    except FileNotFoundError:
+        return []
+
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return []
+    if header.get("base") != file_stamp(filename):
+        return []
+
+    entries = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            break
+    return entries
+
+
+## valid_length(path)
+##
+## Summary of the torn record finder:
+##
+## Returns how many bytes at the start of a journal file read_journal can
+## use.
+##
+## Parameters : path - path of the journal file
+##
+## Return Value : tuple (byte length, True if the last kept line has no
+##                line ending)
+##
+## Description:
+##
+## Counts the header and then every line up to the first one that is not
+## valid JSON, which is where read_journal stops. A line that parses but
+## was cut off before its "\n" still counts, since read_journal replays
+## it.
+
+def valid_length(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    length = 0
+    for line in data.split(b"\n"):
+        if line:
+            try:
+                json.loads(line)
+            except ValueError:
+                return length, False
+        length += len(line) + 1
+    return len(data), not data.endswith(b"\n")
+
+
+## expand_batches(entries)
+##
+## Summary of the batch record expander:
+##
+## Replaces each batch record of a journal with the changes inside it.
+##
+## Parameters : entries - list from read_journal
+##
+## Return Value : generator of add, update and delete records
+
+def expand_batches(entries):
+    for entry in entries:
+        if entry["op"] == "batch":
+            yield from entry["changes"]
+        else:
+            yield entry
+
+
+## class recipe_journal
+##
+## Description:
+##
+##   Appends change records to the journal file of one recipes file and
+##   syncs each one to disk before returning.
+##
+## Data members:
+##
+##   filename : Path of the recipes text file the journal belongs to.
+##   path : Path of the journal file.
+##   file : Open journal file, or None before start/after close.
+##   size : Current journal size in bytes.
+##   entries : Number of change records since the journal was started.
+##
+## Methods:
+##
+##   __init__ - remember which recipes file the journal belongs to.
+##   start - begin a fresh journal against the current recipes file.
+##   resume - keep appending to an existing journal.
+##   append - write and fsync one change record.
+##   log_add / log_update / log_delete - helpers for each change type.
+##   close - close the journal file.
+
+class recipe_journal:
+
+    ## __init__(self, filename)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Sets up a journal for the given recipes file without opening it.
+    ##
+    ## Parameters : filename - path to the recipes text file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Call start or resume before appending.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = journal_path(filename)
+        self.file = None
+        self.size = 0
+        self.entries = 0
+
+    ## start(self)
+    ##
+    ## Summary of the start function:
+    ##
+    ## Replaces the journal with an empty one stamped with the current
+    ## size and mtime of the recipes file.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called after recipes.txt has been rewritten, which makes every
+    ## earlier record obsolete. The header is written to a temporary file
+    ## and renamed into place so a crash leaves either the old journal
+    ## (which no longer matches recipes.txt and is ignored) or the new one.
+
+    def start(self):
+        self.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding=ENCODING) as file:
+            file.write(json.dumps({"base": file_stamp(self.filename)}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "a", encoding=ENCODING)
+        self.size = self.file.tell()
+        self.entries = 0
+
+    ## resume(self, entries)
+    ##
+    ## Summary of the resume function:
+    ##
+    ## Reopens an existing journal for appending.
+    ##
+    ## Parameters : entries - number of records already in it (from
+    ##              read_journal)
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Falls back to start when there is nothing valid to resume, so the
+    ## header always matches the current recipes file. A last record torn
+    ## by a crash is cut off first (see valid_length); otherwise new
+    ## records would follow the torn bytes on the same line, and
+    ## read_journal, which stops at the first bad line, would never see
+    ## them.
+
+    def resume(self, entries):
+        if entries == 0:
+            self.start()
+            return
+        self.close()
+        length, unterminated = valid_length(self.path)
+        with open(self.path, "r+b") as file:
+            file.truncate(length)
+            if unterminated:
+                file.seek(length)
+                file.write(b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.file = open(self.path, "a", encoding=ENCODING)
+        self.size = self.file.tell()
+        self.entries = entries
+
+    ## append(self, entry)
+    ##
+    ## Summary of the append function:
+    ##
+    ## Writes one change record and waits for it to reach the disk.
+    ##
+    ## Parameters : entry - dictionary describing the change
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Each record is one line of JSON, flushed and fsync'd before
+    ## returning so the change survives a crash straight after.
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size = self.file.tell()
+        self.entries += 1
+
+    ## log_add(self, recipe_object)
+    ##
+    ## Summary of the add record helper:
+    ##
+    ## Journals a newly added recipe.
+    ##
+    ## Parameters : recipe_object - the recipe that was added
+    ##
+    ## Return Value : none
+
+    def log_add(self, recipe_object):
+        self.append(change_entry("add", recipe_object.name, recipe_object))
+
+    ## log_update(self, old_name, recipe_object)
+    ##
+    ## Summary of the update record helper:
+    ##
+    ## Journals the new values of an edited recipe.
+    ##
+    ## Parameters :
+    ##    old_name - the recipe's name before the edit
+    ##    recipe_object - the recipe after the edit
+    ##
+    ## Return Value : none
+
+    def log_update(self, old_name, recipe_object):
+        self.append(change_entry("update", old_name, recipe_object))
+
+    ## log_delete(self, recipe_name)
+    ##
+    ## Summary of the delete record helper:
+    ##
+    ## Journals a deleted recipe.
+    ##
+    ## Parameters : recipe_name - name of the recipe that was deleted
+    ##
+    ## Return Value : none
+
+    def log_delete(self, recipe_name):
+        self.append(change_entry("delete", recipe_name, None))
+
+    ## close(self)
+    ##
+    ## Summary of the close function:
+    ##
+    ## Closes the journal file if it is open.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
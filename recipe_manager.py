@@ -9,7 +9,15 @@
 ##              so that the same recipes are available across multiple runs.
 ##-----------------------------------------------------------------------
 
-from recipe import Recipe
+from bisect import bisect_left
+from collections import OrderedDict
+
+from ingredient_index import ingredient_index, normalize_pantry
+from recipe_batch import recipe_batch
+from recipe_storage import text_storage
+from search_index import SEARCH_LIMIT, search_index
+
+QUERY_CACHE_SIZE = 64
 
 ## class recipe_manager
 ##
@@ -22,40 +30,124 @@ from recipe import Recipe
 ##
 ## Data members:
 ##
+##   storage : Backend that loads, saves and persists changes
+##             (text_storage or sqlite_storage from recipe_storage).
 ##   recipe_list : In-memory list of recipes.
-##   all_tags : Master list of tags currently in use.
+##   recipe_index : Mapping recipe name -> Recipe for constant time lookup.
+##   name_counts : Mapping recipe name -> number of recipes with that name.
+##   all_tags : Master list of tags currently in use, in the order
+##              they were first introduced.
+##   tag_counts : Mapping tag -> number of recipes using it.
+##   tag_bits : Mapping tag -> bytearray bitset of the recipe ids using it.
+##   tag_masks : Cache of tag_bits converted to ints for filtering.
+##   recipe_ids : Mapping Recipe -> integer id (its bit position).
+##   id_recipes : Mapping integer id -> Recipe.
+##   next_id : Next id to hand out.
+##   live_bits : bytearray bitset of the ids of recipes in recipe_list.
+##   live_mask : Cached int form of live_bits.
+##   text_index : search_index over names, ingredients and descriptions,
+##                or None until the first full text search.
+##   pantry_index : ingredient_index of normalized ingredients, or None
+##                  until the first pantry search.
+##   query_cache : OrderedDict of recent tag_query results keyed by the
+##                 frozen tag sets, oldest use first.
+##   tag_listeners : Functions told which tags came into or went out of
+##                   use after each change.
+##   active_batch : The recipe_batch changes are currently grouped in, or
+##                  None.
 ##
 ## Methods:
 ##
 ##   __init__ - prepare empty containers for recipes and tags.
+##   get_recipe - look up a Recipe by name.
 ##   add_recipe - append a Recipe and register its tags.
 ##   delete_recipe - remove a Recipe by name and remove tags.
 ##   update_recipe - update a Recipe instance and refresh tags.
-##   add_subtract_tags - add or remove tags from the master list.
+##   index_name - add a Recipe to the name index.
+##   unindex_name - drop a Recipe from the name index.
+##   add_subtract_tags - register or unregister a recipe's tags.
 ##   update_tags - make tag changes after a recipe edit.
-##   load_recipes - read recipes from the plain-text file format.
-##   save_recipes - write recipes back to disk in the same format.
+##   add_tag_listener - ask to be told about tags being added or removed.
+##   notify_tags - tell the tag listeners about added and removed tags.
+##   batch - group several changes into one that can be rolled back.
+##   assign_id - give a new Recipe its bit position.
+##   release_id - forget the bit position of a deleted Recipe.
+##   forget_queries - drop cached tag_query results after an index change.
+##   set_bit - set or clear one bit of a bitset.
+##   has_bit - read one bit of a bitset.
+##   tag_mask - int bitset of the recipes using a tag.
+##   filter_bits - evaluate an AND/OR/NOT tag query as a bitset.
+##   filter_recipes - evaluate a tag query as a list of Recipes.
+##   recipes_from_bits - convert a bitset into Recipes in list order.
+##   count_tags - per-tag counts for a result bitset.
+##   tag_query - recipes and tag counts for a query, pushed down to the
+##               storage backend when it supports it.
+##   search_recipes - BM25 ranked full text search.
+##   what_can_i_cook - recipes that can be made from a set of ingredients.
+##   load_recipes - read recipes from storage.
+##   open_journal - start persisting each change as it happens.
+##   log_change - pass one change to the storage backend.
+##   close_journal - store everything and stop persisting changes.
+##   save_recipes - write all recipes to storage.
 
 class recipe_manager:
 
-    ## __init__(self)
+    ## __init__(self, storage=None)
     ##
     ## Summary of the constructor function:
     ##
     ## Initializes the manager and sets up empty containers for recipes
     ## and tags.
     ##
-    ## Parameters : none
+    ## Parameters : storage - storage backend (defaults to text_storage)
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
-    ## Prepares recipe_list and all_tags for use by other methods.
+    ## Prepares recipe_list, recipe_index and the tag containers for use
+    ## by other methods.
 
-    def __init__(self):
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else text_storage()
         self.recipe_list = []
+        self.recipe_index = {}
+        self.name_counts = {}
         self.all_tags = []
+        self.tag_counts = {}
+        self.tag_bits = {}
+        self.tag_masks = {}
+        self.recipe_ids = {}
+        self.id_recipes = {}
+        self.next_id = 0
+        self.live_bits = bytearray()
+        self.live_mask = None
+        self.text_index = None
+        self.pantry_index = None
+        self.query_cache = OrderedDict()
+        self.tag_listeners = []
+        self.active_batch = None
+
+    ## get_recipe(self, name)
+    ##
+    ## Summary of the lookup function:
+    ##
+    ## Returns the Recipe with the given name, or None if there is no
+    ## recipe by that name.
+    ##
+    ## Parameters : name - name of the recipe to find
+    ##
+    ## Return Value : Recipe or None
+    ##
+    ## Description:
+    ##
+    ## Reads recipe_index instead of scanning recipe_list, so the cost
+    ## does not grow with the size of the library. When two recipes share
+    ## a name the first one in recipe_list is returned, matching the old
+    ## linear scans.
+
+    def get_recipe(self, name):
+        return self.recipe_index.get(name)
 
     ## add_recipe(self, recipe_object)
     ##
@@ -70,12 +162,24 @@ class recipe_manager:
     ##
     ## Description:
     ##
-    ## Appends to recipe_list and calls add_subtract_tags to register
-    ## any tags that are not already tracked.
+    ## Appends to recipe_list, assigns the recipe an id, registers the
+    ## name in recipe_index and calls add_subtract_tags to register any
+    ## tags that are not already tracked. The full text and ingredient
+    ## indexes are updated if they have been built, and the change is
+    ## passed to the storage backend.
 
     def add_recipe(self, recipe_object):
+        if self.active_batch is not None:
+            self.active_batch.save(recipe_object, (recipe_object.name,), recipe_object.tags)
         self.recipe_list.append(recipe_object)
-        self.add_subtract_tags(" ".join(recipe_object.tags), 1)
+        self.assign_id(recipe_object)
+        self.index_name(recipe_object, recipe_object.name)
+        self.add_subtract_tags(recipe_object, recipe_object.tags, 1)
+        if self.text_index is not None:
+            self.text_index.add(recipe_object)
+        if self.pantry_index is not None:
+            self.pantry_index.add(self.recipe_ids[recipe_object], recipe_object.ingredients, self.set_bit)
+        self.log_change("add", recipe_object.name, recipe_object)
 
     ## delete_recipe(self, recipe_name)
     ##
@@ -90,15 +194,29 @@ class recipe_manager:
     ##
     ## Description:
     ##
-    ## Iterates recipe_list to find the first match, deletes it, then
-    ## calls add_subtract_tags with check=0 to remove unused tags.
+    ## Looks the recipe up in recipe_index, removes it from recipe_list
+    ## and the index, calls add_subtract_tags with check=0 to remove
+    ## unused tags, then releases the recipe's id and drops it from the
+    ## full text and ingredient indexes. The change is passed to the
+    ## storage backend. recipe_list is always in id order, so the
+    ## recipe's position is found by bisecting on ids rather than
+    ## comparing every entry.
 
     def delete_recipe(self, recipe_name):
-        for index, entry in enumerate(self.recipe_list):
-            if entry.name == recipe_name:
-                del self.recipe_list[index]
-                self.add_subtract_tags(" ".join(entry.tags), 0)
-                break
+        entry = self.recipe_index.get(recipe_name)
+        if entry is None:
+            return
+        if self.active_batch is not None:
+            self.active_batch.save(entry, (recipe_name,), entry.tags)
+        del self.recipe_list[bisect_left(self.recipe_list, self.recipe_ids[entry], key=self.recipe_ids.__getitem__)]
+        self.unindex_name(entry, recipe_name)
+        self.add_subtract_tags(entry, entry.tags, 0)
+        if self.pantry_index is not None:
+            self.pantry_index.remove(self.recipe_ids[entry], self.set_bit)
+        self.release_id(entry)
+        if self.text_index is not None:
+            self.text_index.remove(entry)
+        self.log_change("delete", recipe_name, entry)
 
     ## update_recipe(self, recipe_object, name, photo_name, tags, ingredients, description)
     ##
@@ -119,47 +237,207 @@ class recipe_manager:
     ##
     ## Description:
     ##
-    ## Saves the old tags, updates the Recipe via set_values, then calls
-    ## update_tags to add new tags and remove unused ones.
+    ## Keeps the old tags (a tuple, so set_values cannot change it),
+    ## updates the Recipe via set_values, moves the recipe_index entry if
+    ## the recipe was renamed, then calls update_tags to add new tags and
+    ## remove unused ones, and re-indexes the recipe's text and
+    ## ingredients. The change is passed to the storage backend.
 
     def update_recipe(self, recipe_object, name, photo_name, tags, ingredients, description):
-        old_tags = recipe_object.tags.copy()
+        old_name = recipe_object.name
+        old_tags = recipe_object.tags
+        if self.active_batch is not None:
+            self.active_batch.save(recipe_object, (old_name, name), tuple(old_tags) + tuple(tags), values=True)
         recipe_object.set_values(name, photo_name, tags, ingredients, description)
-        self.update_tags(old_tags, tags)
+        if old_name != name:
+            self.unindex_name(recipe_object, old_name)
+            self.index_name(recipe_object, name)
+            self.forget_queries()
+        self.update_tags(recipe_object, old_tags, tags)
+        if self.text_index is not None:
+            self.text_index.update(recipe_object)
+        if self.pantry_index is not None:
+            recipe_id = self.recipe_ids[recipe_object]
+            self.pantry_index.remove(recipe_id, self.set_bit)
+            self.pantry_index.add(recipe_id, ingredients, self.set_bit)
+        self.log_change("update", old_name, recipe_object)
 
-    ## add_subtract_tags(self, tags_string, check)
+    ## index_name(self, recipe_object, name)
+    ##
+    ## Summary of the name index helper:
+    ##
+    ## Adds recipe_object to recipe_index under the given name.
+    ##
+    ## Parameters :
+    ##    recipe_object - the recipe entering the index
+    ##    name - the name to index it under
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Keeps whichever recipe carrying the name comes first in
+    ## recipe_list, so get_recipe matches the old linear scans. A renamed
+    ## recipe can sit before the one already indexed; recipe_list is in id
+    ## order, so comparing the two ids tells which comes first without a
+    ## scan. Duplicates are counted in name_counts so unindex_name knows
+    ## when a scan for a replacement is needed.
+
+    def index_name(self, recipe_object, name):
+        current = self.recipe_index.get(name)
+        if current is None or self.recipe_ids[recipe_object] < self.recipe_ids[current]:
+            self.recipe_index[name] = recipe_object
+        self.name_counts[name] = self.name_counts.get(name, 0) + 1
+
+    ## unindex_name(self, recipe_object, name)
+    ##
+    ## Summary of the name index helper:
+    ##
+    ## Removes recipe_object from recipe_index under the given name.
+    ##
+    ## Parameters :
+    ##    recipe_object - the recipe leaving the index
+    ##    name - the name it was indexed under
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Drops the name from recipe_index once no recipe carries it. If
+    ## recipe_object held the slot and a duplicate still carries the
+    ## name, the duplicate takes over the slot. That needs a scan, but
+    ## only happens for duplicate names.
+
+    def unindex_name(self, recipe_object, name):
+        self.name_counts[name] -= 1
+        if self.name_counts[name] == 0:
+            del self.name_counts[name]
+            del self.recipe_index[name]
+            return
+        if self.recipe_index[name] is not recipe_object:
+            return
+        for entry in self.recipe_list:
+            if entry.name == name and entry is not recipe_object:
+                self.recipe_index[name] = entry
+                break
+
+    ## add_subtract_tags(self, recipe_object, tags, check)
     ##
     ## Summary of the tag maintenance function:
     ##
-    ## Adds tags to the master list or removes them if they are no
-    ## longer used by any recipe.
+    ## Registers or unregisters one recipe under each of its tags, adding
+    ## tags to the master list or removing them once no recipe uses them.
+    ##
+    ## Parameters :
+    ##    recipe_object - the recipe whose tags are changing
+    ##    tags - the tag names to register or unregister
+    ##    check - 1 to add, 0 to remove
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Each tag keeps a bitset of the recipe ids that use it in tag_bits
+    ## and a reference count in tag_counts. A tag is appended to all_tags
+    ## when its count goes from 0 to 1 and removed when it drops back to
+    ## 0, so no recipe list scan is needed. The tags that came into or
+    ## went out of use are then passed to notify_tags.
+
+    def add_subtract_tags(self, recipe_object, tags, check):
+        recipe_id = self.recipe_ids[recipe_object]
+        added = []
+        removed = []
+        for tag in dict.fromkeys(tag.strip() for tag in tags):
+            if not tag:
+                continue
+            if check == 1:
+                bits = self.tag_bits.setdefault(tag, bytearray())
+                if self.has_bit(bits, recipe_id):
+                    continue
+                self.set_bit(bits, recipe_id, 1)
+                self.tag_masks.pop(tag, None)
+                self.forget_queries()
+                self.tag_counts[tag] = self.tag_counts.get(tag, 0) + 1
+                if self.tag_counts[tag] == 1:
+                    self.all_tags.append(tag)
+                    added.append(tag)
+            elif check == 0:
+                bits = self.tag_bits.get(tag)
+                if bits is None or not self.has_bit(bits, recipe_id):
+                    continue
+                self.set_bit(bits, recipe_id, 0)
+                self.tag_masks.pop(tag, None)
+                self.forget_queries()
+                self.tag_counts[tag] -= 1
+                if self.tag_counts[tag] == 0:
+                    del self.tag_counts[tag]
+                    del self.tag_bits[tag]
+                    self.all_tags.remove(tag)
+                    removed.append(tag)
+        if added or removed:
+            self.notify_tags(added, removed)
+
+    ## add_tag_listener(self, listener)
+    ##
+    ## Summary of the tag listener function:
+    ##
+    ## Registers a function to be told when tags come into or go out of
+    ## use.
+    ##
+    ## Parameters : listener - function(added, removed) taking two lists
+    ##                         of tag names
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Lets the tag panel change only the rows that changed instead of
+    ## rebuilding itself from all_tags after every edit. Inside a batch
+    ## listeners are told once, about the whole batch, when it commits.
+
+    def add_tag_listener(self, listener):
+        self.tag_listeners.append(listener)
+
+    ## notify_tags(self, added, removed)
+    ##
+    ## Summary of the tag notification function:
+    ##
+    ## Passes tag changes to every tag listener.
     ##
     ## Parameters :
-    ##    tags_string - space-separated tag names
-    ##    check - 1 to add, 0 to remove unused tags
+    ##    added - tags that are now used by a recipe and were not before
+    ##    removed - tags no recipe uses any more
     ##
     ## Return Value : none
+
+    def notify_tags(self, added, removed):
+        if self.active_batch is not None:
+            return
+        for listener in self.tag_listeners:
+            listener(added, removed)
+
+    ## batch(self)
+    ##
+    ## Summary of the batch function:
+    ##
+    ## Groups the changes made inside a with block into one.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : recipe_batch to use as "with manager.batch():"
     ##
     ## Description:
     ##
-    ## Splits the incoming string and either appends new tags to
-    ## all_tags or removes tags that are not present in any recipe.
-
-    def add_subtract_tags(self, tags_string, check):
-        tag_list = tags_string.split()
-        if check == 1:
-            for tag in tag_list:
-                clean_tag = tag.strip()
-                if clean_tag not in self.all_tags:
-                    self.all_tags.append(clean_tag)
-        elif check == 0:
-            for tag in tag_list:
-                clean_tag = tag.strip()
-                still_used = any(clean_tag in entry.tags for entry in self.recipe_list)
-                if not still_used and clean_tag in self.all_tags:
-                    self.all_tags.remove(clean_tag)
-
-    ## update_tags(self, old_tags, new_tags)
+    ## Inside the block add_recipe, update_recipe and delete_recipe work
+    ## as usual, but the search and pantry indexes are brought up to date,
+    ## the changes are stored and the tag listeners are told only once,
+    ## when the block ends. If the block raises, every change made in it
+    ## is undone and nothing is stored.
+
+    def batch(self):
+        return recipe_batch(self)
+
+    ## update_tags(self, recipe_object, old_tags, new_tags)
     ##
     ## Summary of the update tags function:
     ##
@@ -167,6 +445,7 @@ class recipe_manager:
     ## longer present in any recipe.
     ##
     ## Parameters :
+    ##    recipe_object - the recipe that was edited
     ##    old_tags - previous tag list for the recipe
     ##    new_tags - updated tag list for the recipe
     ##
@@ -174,24 +453,363 @@ class recipe_manager:
     ##
     ## Description:
     ##
-    ## Ensures all_tags contains the union of tags currently used by
-    ## recipes and removes tags that have become unused.
+    ## Only the tags that differ between the old and new lists are passed
+    ## to add_subtract_tags, so the cost depends on the size of the edit
+    ## rather than the size of the library.
+
+    def update_tags(self, recipe_object, old_tags, new_tags):
+        old_set = set(old_tags)
+        new_set = set(new_tags)
+        removed = [tag for tag in old_tags if tag not in new_set]
+        added = [tag for tag in new_tags if tag not in old_set]
+        self.add_subtract_tags(recipe_object, removed, 0)
+        self.add_subtract_tags(recipe_object, added, 1)
+
+    ## assign_id(self, recipe_object)
+    ##
+    ## Summary of the id assignment function:
+    ##
+    ## Gives a recipe the next integer id used as its bit position in the
+    ## tag bitsets.
+    ##
+    ## Parameters : recipe_object - the recipe being added
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Ids only ever increase and recipes are only ever appended, so
+    ## ascending id order is the same as recipe_list order. Deleted ids
+    ## are left as empty bits rather than reused.
+
+    def assign_id(self, recipe_object):
+        recipe_id = self.next_id
+        self.next_id += 1
+        self.recipe_ids[recipe_object] = recipe_id
+        self.id_recipes[recipe_id] = recipe_object
+        self.set_bit(self.live_bits, recipe_id, 1)
+        self.live_mask = None
+        self.forget_queries()
+
+    ## release_id(self, recipe_object)
+    ##
+    ## Summary of the id release function:
+    ##
+    ## Forgets the id of a deleted recipe.
+    ##
+    ## Parameters : recipe_object - the recipe being deleted
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Clears the recipe's bit in live_bits so filters no longer return
+    ## it. The tag bits must already have been cleared by
+    ## add_subtract_tags.
 
-    def update_tags(self, old_tags, new_tags):
-        for tag in new_tags:
-            if tag not in self.all_tags:
-                self.all_tags.append(tag)
-        for tag in old_tags:
-            still_used = any(tag in entry.tags for entry in self.recipe_list)
-            if not still_used and tag in self.all_tags:
-                self.all_tags.remove(tag)
+    def release_id(self, recipe_object):
+        recipe_id = self.recipe_ids.pop(recipe_object)
+        del self.id_recipes[recipe_id]
+        self.set_bit(self.live_bits, recipe_id, 0)
+        self.live_mask = None
+        self.forget_queries()
+
+    ## forget_queries(self)
+    ##
+    ## Summary of the query cache reset:
+    ##
+    ## Drops every cached tag_query result.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called whenever a recipe id, a tag bit or a recipe name changes.
+    ## Edits that only touch photos, ingredients or descriptions leave the
+    ## cache alone.
+
+    def forget_queries(self):
+        if self.query_cache:
+            self.query_cache.clear()
+
+    ## set_bit(self, bits, index, value)
+    ##
+    ## Summary of the bit writer:
+    ##
+    ## Sets or clears one bit of a bytearray bitset, growing it if needed.
+    ##
+    ## Parameters :
+    ##    bits - the bytearray to change
+    ##    index - bit position (a recipe id)
+    ##    value - 1 to set, 0 to clear
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Bitsets are kept as bytearrays while they are being edited so a
+    ## single add or delete is constant time. Python ints would have to be
+    ## copied in full on every change.
+
+    def set_bit(self, bits, index, value):
+        byte = index >> 3
+        if byte >= len(bits):
+            bits.extend(bytes(byte - len(bits) + 1))
+        if value:
+            bits[byte] |= 1 << (index & 7)
+        else:
+            bits[byte] &= ~(1 << (index & 7)) & 0xFF
+
+    ## has_bit(self, bits, index)
+    ##
+    ## Summary of the bit reader:
+    ##
+    ## Checks whether one bit of a bytearray bitset is set.
+    ##
+    ## Parameters :
+    ##    bits - the bytearray to read
+    ##    index - bit position (a recipe id)
+    ##
+    ## Return Value : True if the bit is set, otherwise False
+    ##
+    ## Description:
+    ##
+    ## Bits past the end of the bytearray count as cleared.
+
+    def has_bit(self, bits, index):
+        byte = index >> 3
+        return byte < len(bits) and bool(bits[byte] & (1 << (index & 7)))
+
+    ## tag_mask(self, tag)
+    ##
+    ## Summary of the tag mask function:
+    ##
+    ## Returns the bitset of recipes using a tag as a Python int.
+    ##
+    ## Parameters : tag - the tag name
+    ##
+    ## Return Value : int bitset (0 for unknown tags)
+    ##
+    ## Description:
+    ##
+    ## The int form is what the filters AND and OR together. It is built
+    ## from the bytearray on first use and cached in tag_masks until the
+    ## tag's bits change again.
+
+    def tag_mask(self, tag):
+        mask = self.tag_masks.get(tag)
+        if mask is None:
+            bits = self.tag_bits.get(tag)
+            if bits is None:
+                return 0
+            mask = int.from_bytes(bits, "little")
+            self.tag_masks[tag] = mask
+        return mask
+
+    ## filter_bits(self, match_all=(), match_any=(), match_none=())
+    ##
+    ## Summary of the tag query function:
+    ##
+    ## Evaluates a tag query and returns the matching recipes as a bitset.
+    ##
+    ## Parameters :
+    ##    match_all - tags every result must have (AND)
+    ##    match_any - tags of which a result must have at least one (OR)
+    ##    match_none - tags no result may have (NOT)
+    ##
+    ## Return Value : int bitset of recipe ids
+    ##
+    ## Description:
+    ##
+    ## Starts from the set of live recipes and combines one tag mask per
+    ## tag in the query, so the cost is a handful of bitwise operations
+    ## rather than a membership test per recipe. An empty query matches
+    ## every recipe.
+
+    def filter_bits(self, match_all=(), match_any=(), match_none=()):
+        if self.live_mask is None:
+            self.live_mask = int.from_bytes(self.live_bits, "little")
+        result = self.live_mask
+        for tag in match_all:
+            result &= self.tag_mask(tag)
+        if match_any:
+            any_bits = 0
+            for tag in match_any:
+                any_bits |= self.tag_mask(tag)
+            result &= any_bits
+        for tag in match_none:
+            result &= ~self.tag_mask(tag)
+        return result
+
+    ## filter_recipes(self, match_all=(), match_any=(), match_none=())
+    ##
+    ## Summary of the tag filter function:
+    ##
+    ## Returns the recipes matching a tag query in recipe_list order.
+    ##
+    ## Parameters :
+    ##    match_all - tags every result must have (AND)
+    ##    match_any - tags of which a result must have at least one (OR)
+    ##    match_none - tags no result may have (NOT)
+    ##
+    ## Return Value : list of Recipe
+    ##
+    ## Description:
+    ##
+    ## Runs filter_bits and converts the resulting bitset back into
+    ## Recipe objects with recipes_from_bits.
+
+    def filter_recipes(self, match_all=(), match_any=(), match_none=()):
+        return self.recipes_from_bits(self.filter_bits(match_all, match_any, match_none))
+
+    ## recipes_from_bits(self, bits)
+    ##
+    ## Summary of the bitset conversion function:
+    ##
+    ## Turns a bitset of recipe ids into the matching Recipe objects.
+    ##
+    ## Parameters : bits - int bitset of recipe ids
+    ##
+    ## Return Value : list of Recipe in recipe_list order
+    ##
+    ## Description:
+    ##
+    ## Writes the bitset out as a binary string once and uses str.find to
+    ## jump between set bits, which is linear in the number of recipe ids
+    ## instead of shifting a large int once per result.
+
+    def recipes_from_bits(self, bits):
+        found = []
+        binary = format(bits, "b")[::-1]
+        position = binary.find("1")
+        while position != -1:
+            found.append(self.id_recipes[position])
+            position = binary.find("1", position + 1)
+        return found
+
+    ## count_tags(self, bits)
+    ##
+    ## Summary of the result count function:
+    ##
+    ## Counts how many recipes in a result set carry each tag.
+    ##
+    ## Parameters : bits - int bitset of recipe ids (from filter_bits)
+    ##
+    ## Return Value : dictionary tag -> count
+    ##
+    ## Description:
+    ##
+    ## One AND and popcount per tag in all_tags. Used by the tag panel to
+    ## show how many of the current results each tag would keep.
+
+    def count_tags(self, bits):
+        return {tag: (self.tag_mask(tag) & bits).bit_count() for tag in self.all_tags}
+
+    ## tag_query(self, match_all=(), match_any=(), match_none=())
+    ##
+    ## Summary of the tag query function:
+    ##
+    ## Returns the recipes matching a tag query along with the per-tag
+    ## counts of the result.
+    ##
+    ## Parameters :
+    ##    match_all - tags every result must have (AND)
+    ##    match_any - tags of which a result must have at least one (OR)
+    ##    match_none - tags no result may have (NOT)
+    ##
+    ## Return Value : (list of Recipe in recipe_list order, dictionary
+    ##                tag -> count); shared with the cache, so it must not
+    ##                be changed
+    ##
+    ## Description:
+    ##
+    ## Results are cached per frozen set of tags, so asking the same
+    ## question again returns the very same tuple until forget_queries is
+    ## called. Otherwise the storage backend gets the chance to answer the
+    ## query itself (sqlite_storage runs it as SQL) before filter_bits,
+    ## recipes_from_bits and count_tags are used. Inside a batch storage
+    ## has not seen the changes yet, so the bitsets always answer.
+
+    def tag_query(self, match_all=(), match_any=(), match_none=()):
+        key = (frozenset(match_all), frozenset(match_any), frozenset(match_none))
+        result = self.query_cache.get(key)
+        if result is not None:
+            self.query_cache.move_to_end(key)
+            return result
+        result = self.storage.tag_query(self, match_all, match_any, match_none) if self.active_batch is None else None
+        if result is None:
+            bits = self.filter_bits(match_all, match_any, match_none)
+            result = self.recipes_from_bits(bits), self.count_tags(bits)
+        self.query_cache[key] = result
+        if len(self.query_cache) > QUERY_CACHE_SIZE:
+            self.query_cache.popitem(last=False)
+        return result
+
+    ## search_recipes(self, query, limit=SEARCH_LIMIT)
+    ##
+    ## Summary of the full text search function:
+    ##
+    ## Finds recipes whose name, ingredients or description contain the
+    ## words of a query.
+    ##
+    ## Parameters :
+    ##    query - words to search for
+    ##    limit - most results to return
+    ##
+    ## Return Value : list of (Recipe, score), best match first
+    ##
+    ## Description:
+    ##
+    ## The search_index is built from recipe_list on the first search and
+    ## kept up to date by add_recipe, update_recipe and delete_recipe after
+    ## that, so startup does not pay for it.
+
+    def search_recipes(self, query, limit=SEARCH_LIMIT):
+        if self.text_index is None:
+            self.text_index = search_index(self.recipe_list)
+        return self.text_index.search(query, limit)
+
+    ## what_can_i_cook(self, pantry, max_missing=0)
+    ##
+    ## Summary of the pantry search function:
+    ##
+    ## Finds the recipes that can be made from the ingredients on hand,
+    ## or that are only a few ingredients short.
+    ##
+    ## Parameters :
+    ##    pantry - ingredient names the user has, e.g. ["Large eggs", "milk"]
+    ##    max_missing - most ingredients a result may be missing
+    ##
+    ## Return Value : list of (Recipe, list of missing ingredient names),
+    ##                fewest missing first, then recipe_list order
+    ##
+    ## Description:
+    ##
+    ## The ingredient_index is built on the first call and kept up to
+    ## date by add_recipe, update_recipe and delete_recipe after that.
+    ## The pantry is normalized once, and matching is done on bitsets, so
+    ## only the recipes that are returned are looked at one by one.
+
+    def what_can_i_cook(self, pantry, max_missing=0):
+        if self.pantry_index is None:
+            self.pantry_index = ingredient_index()
+            for recipe_object in self.recipe_list:
+                self.pantry_index.add(self.recipe_ids[recipe_object], recipe_object.ingredients, self.set_bit)
+        pantry = normalize_pantry(pantry)
+        results = []
+        for bits in self.pantry_index.match(pantry, max_missing):
+            for recipe_object in self.recipes_from_bits(bits):
+                results.append((recipe_object, self.pantry_index.missing(self.recipe_ids[recipe_object], pantry)))
+        return results
 
     ## load_recipes(self, filename="recipes.txt")
     ##
     ## Summary of the load function:
     ##
-    ## Reads recipes from a text file using the project's plain-text
-    ## format and populates the internal recipe list and tag index.
+    ## Reads recipes from storage and populates the internal recipe list
+    ## and tag index.
     ##
     ## Parameters : filename - path to the recipes file "recipes.txt"
     ##
@@ -199,58 +817,102 @@ class recipe_manager:
     ##
     ## Description:
     ##
-    ## The expected file format is five blocks per recipe separated by
-    ## blank lines: name, photo_name, tags (space separated), ingredients
-    ## block (one per line) and description. Missing file is handled
-    ## silently.
+    ## Hands the work to the storage backend, which adds each stored
+    ## recipe through add_recipe. With text_storage a missing file is
+    ## handled silently and a malformed record raises RecipeParseError
+    ## after every recipe before it has been added.
 
     def load_recipes(self, filename="recipes.txt"):
-        try:
-            with open(filename, "r") as file:
-                content = file.read()
-        except FileNotFoundError:
+        self.storage.load(self, filename)
+
+    ## load_steps(self, filename="recipes.txt")
+    ##
+    ## Summary of the stepped load function:
+    ##
+    ## Loads like load_recipes, a piece at a time.
+    ##
+    ## Parameters : filename - path to the recipes file "recipes.txt"
+    ##
+    ## Return Value : generator of the fraction loaded so far (0 to 1)
+    ##
+    ## Description:
+    ##
+    ## The recipes loaded so far are in recipe_list whenever the generator
+    ## stops, so a window can show them while the rest loads. Raises the
+    ## same errors as load_recipes when the step that hits them runs.
+
+    def load_steps(self, filename="recipes.txt"):
+        return self.storage.load_steps(self, filename)
+
+    ## open_journal(self, filename="recipes.txt")
+    ##
+    ## Summary of the journal open function:
+    ##
+    ## Starts persisting every add, update and delete as it happens
+    ## instead of requiring a full save after each change.
+    ##
+    ## Parameters : filename - path to the recipes file "recipes.txt"
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Call after load_recipes. text_storage appends to the file's
+    ## journal and sqlite_storage writes straight to the database.
+
+    def open_journal(self, filename="recipes.txt"):
+        self.storage.open(self, filename)
+
+    ## log_change(self, op, name, recipe_object)
+    ##
+    ## Summary of the change logging function:
+    ##
+    ## Passes one change to the storage backend.
+    ##
+    ## Parameters :
+    ##    op - "add", "update" or "delete"
+    ##    name - recipe name (the old name for an update)
+    ##    recipe_object - the recipe that changed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The backend ignores changes until open_journal has been called.
+    ## Inside a batch the change is left for the batch to store when it
+    ## commits.
+
+    def log_change(self, op, name, recipe_object):
+        if self.active_batch is not None:
+            if op == "update":
+                self.active_batch.edited(recipe_object)
             return
+        self.storage.record(self, op, name, recipe_object)
 
-        blocks = content.strip().split("\n\n")
-        recipe_blocks = []
-
-        for index in range(0, len(blocks), 5):
-            object = blocks[index : index + 5]
-            if len(object) == 5:
-                recipe_blocks.append(object)
-        
-        for block in recipe_blocks:
-            name, photo_name, tags_line, ingredients_block, description = block
-
-            name = name.strip()
-            photo_name = photo_name.strip()
-            description = description.strip()
-
-            if tags_line.strip():
-                tags = tags_line.split()
-            else:
-                tags = []
-            
-            ingredients = []
-            for line in ingredients_block.splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                if "," in line:
-                    ingredient, amount = line.split(",", 1)
-                    ingredients.append((ingredient.strip(), amount.strip()))
-                else:
-                    ingredients.append((line, ""))
-            
-            self.add_recipe(Recipe(name, photo_name, tags, ingredients, description))
+    ## close_journal(self)
+    ##
+    ## Summary of the journal close function:
+    ##
+    ## Makes sure every change is stored and stops persisting changes one
+    ## at a time.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called when the application exits so the next start has nothing to
+    ## replay.
 
+    def close_journal(self):
+        self.storage.close(self)
 
     ## save_recipes(self, filename="recipes.txt")
     ##
     ## Summary of the save function:
     ##
-    ## Persists all recipes to a plain-text file in the project's
-    ## readable format, overwriting existing contents.
+    ## Persists all recipes, overwriting existing contents.
     ##
     ## Parameters : filename - path to write to "recipes.txt"
     ##
@@ -258,23 +920,8 @@ class recipe_manager:
     ##
     ## Description:
     ##
-    ## Iterates recipe_list writing name, photo, tags, ingredients and
-    ## description blocks separated by blank lines so the file can be
-    ## reloaded by load_recipes.
+    ## text_storage writes the plain-text format atomically (plus its
+    ## snapshot) and sqlite_storage rewrites the database tables.
 
     def save_recipes(self, filename="recipes.txt"):
-        with open(filename, "w") as file:
-            for entry in self.recipe_list:
-                file.write(f"{entry.name}\n\n")
-                file.write(f"{entry.photo_name}\n\n")
-                file.write(f"{' '.join(entry.tags)}\n\n")
-                for ingredient, amount in entry.ingredients:
-                    if amount:
-                        file.write(f"{ingredient}, {amount}\n")
-                    else:
-                        file.write(f"{ingredient}\n")
-                file.write("\n")
-                if entry.description.strip():
-                    file.write(f"{entry.description}\n\n")
-                else:
-                    file.write("\n")
\ No newline at end of file
+        self.storage.save(self, filename)
\ No newline at end of file
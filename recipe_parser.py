@@ -0,0 +1,284 @@
+##-----------------------------------------------------------------------
+## File : recipe_parser.py
+##
+## Description: Reads and writes the plain-text recipes.txt format. Each
+##              recipe is five blocks separated by blank lines: name,
+##              photo name, tags, ingredients (one per line) and
+##              description. The reader streams the file line by line and
+##              hands back one recipe at a time, so nothing has to hold the
+##              whole file in memory.
+##-----------------------------------------------------------------------
+
+from recipe import Recipe
+
+ENCODING = "utf-8"
+BLOCKS_PER_RECIPE = 5
+
+
+## class RecipeParseError
+##
+## Description:
+##
+##   Raised when recipes.txt contains a record that cannot be read, such
+##   as a recipe cut off before all five of its blocks.
+##
+## Data members:
+##
+##   offset : Byte offset in the file where the bad record starts.
+##   record_number : 1-based number of the bad record in the file.
+
+class RecipeParseError(ValueError):
+
+    ## __init__(self, message, offset, record_number)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Stores where the problem was found and builds the error message.
+    ##
+    ## Parameters :
+    ##    message - what was wrong with the record
+    ##    offset - byte offset of the record
+    ##    record_number - 1-based record number
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The location is added to the message so printing the error is
+    ## enough to find the record in the file.
+
+    def __init__(self, message, offset, record_number):
+        super().__init__(f"record {record_number} at byte {offset}: {message}")
+        self.offset = offset
+        self.record_number = record_number
+
+
+## iter_records(filename)
+##
+## Summary of the record reader:
+##
+## Reads a recipes file line by line and yields each record as soon as
+## its fifth block is complete.
+##
+## Parameters : filename - path to the recipes file
+##
+## Return Value : generator of (record_number, offset, length, blocks)
+##
+## Description:
+##
+## Opens the file and hands its lines to read_records.
+
+def iter_records(filename):
+    with open(filename, "rb") as file:
+        yield from read_records(file)
+
+
+## read_records(lines, offset=0, record_number=0)
+##
+## Summary of the line based record reader:
+##
+## Splits lines of a recipes file into records.
+##
+## Parameters :
+##    lines - iterable of the file's lines as bytes, line endings kept
+##    offset - byte offset of the first line in the file
+##    record_number - number of records before the first line
+##
+## Return Value : generator of (record_number, offset, length, blocks)
+##
+## Description:
+##
+## offset and record_number let record_index hand over just the end of
+## a file, after the records it has already found itself. Blank lines are
+## only skipped before the first record of the file.
+##
+## A block ends at the first empty line after it starts, and the next
+## block starts on the line after that, which is the same split the old
+## content.split("\n\n") produced. Blank lines before the first record and
+## whitespace-only blocks at the end of the file are skipped the way
+## content.strip() used to, which means a record whose description is
+## blank is held back until something other than whitespace follows it,
+## since it would lose that block if the file ended there. offset and
+## length are in bytes and cover the record from the start of its name
+## to the end of its description.
+## A record left with fewer than five blocks at the end of the file
+## raises RecipeParseError instead of being dropped.
+
+def read_records(lines, offset=0, record_number=0):
+    record_start = offset
+    record_end = offset
+    blocks = []
+    current = None
+    pending = []
+
+    for raw in lines:
+        line_start = offset
+        offset += len(raw)
+        if raw.endswith(b"\n"):
+            raw = raw[:-1]
+        if raw.endswith(b"\r"):
+            raw = raw[:-1]
+        line = raw.decode(ENCODING)
+
+        if pending and line.strip():
+            for record in pending:
+                record_number += 1
+                yield (record_number,) + record
+            pending = []
+
+        if current is None:
+            if not blocks and record_number == 0 and not pending and not line.strip():
+                continue
+            if not blocks:
+                record_start = line_start
+            current = [line]
+            record_end = line_start + len(raw)
+            continue
+
+        if line == "":
+            blocks.append("\n".join(current))
+            current = None
+            if len(blocks) == BLOCKS_PER_RECIPE:
+                record = (record_start, record_end - record_start, blocks)
+                blocks = []
+                if record[2][-1].strip() and not pending:
+                    record_number += 1
+                    yield (record_number,) + record
+                else:
+                    pending.append(record)
+            continue
+
+        current.append(line)
+        record_end = line_start + len(raw)
+
+    if current is not None:
+        blocks.append("\n".join(current))
+    if blocks:
+        pending.append((record_start, record_end - record_start, blocks))
+    while pending:
+        record_start, length, blocks = pending[-1]
+        while blocks and not blocks[-1].strip():
+            blocks.pop()
+        if blocks:
+            break
+        pending.pop()
+    for record_start, length, blocks in pending:
+        record_number += 1
+        if len(blocks) != BLOCKS_PER_RECIPE:
+            raise RecipeParseError(f"expected {BLOCKS_PER_RECIPE} blocks, found {len(blocks)}", record_start, record_number)
+        yield record_number, record_start, length, blocks
+
+
+## parse_record(blocks)
+##
+## Summary of the record parser:
+##
+## Builds a Recipe from the five text blocks of one record.
+##
+## Parameters : blocks - name, photo, tags, ingredients and description
+##
+## Return Value : Recipe
+##
+## Description:
+##
+## Tags are split on whitespace. Each ingredient line is split on its
+## first comma into (ingredient, amount); lines without a comma get an
+## empty amount and blank lines are ignored.
+
+def parse_record(blocks):
+    name, photo_name, tags_line, ingredients_block, description = blocks
+
+    tags = tags_line.split()
+
+    ingredients = []
+    for line in ingredients_block.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if "," in line:
+            ingredient, amount = line.split(",", 1)
+            ingredients.append((ingredient.strip(), amount.strip()))
+        else:
+            ingredients.append((line, ""))
+
+    return Recipe(name.strip(), photo_name.strip(), tags, ingredients, description.strip())
+
+
+## split_record(data)
+##
+## Summary of the record splitter:
+##
+## Splits the bytes of one record back into its five blocks.
+##
+## Parameters : data - bytes (or a memoryview) of a record, as located
+##                     by iter_records' offset and length (trailing blank
+##                     lines allowed)
+##
+## Return Value : list of five block strings
+##
+## Description:
+##
+## Gives the same blocks iter_records produced for the record, so a
+## body can be read again from the file with one seek. Blank lines past
+## the fourth block belong to the description, and missing blocks are
+## empty.
+
+def split_record(data):
+    lines = str(data, ENCODING).split("\n")
+    blocks = "\n".join(line[:-1] if line.endswith("\r") else line for line in lines).split("\n\n")
+    if len(blocks) < BLOCKS_PER_RECIPE:
+        blocks.extend([""] * (BLOCKS_PER_RECIPE - len(blocks)))
+    return blocks[:BLOCKS_PER_RECIPE - 1] + ["\n\n".join(blocks[BLOCKS_PER_RECIPE - 1:])]
+
+
+## iter_recipes(filename)
+##
+## Summary of the streaming loader:
+##
+## Yields a Recipe for each complete record in a recipes file.
+##
+## Parameters : filename - path to the recipes file
+##
+## Return Value : generator of Recipe
+##
+## Description:
+##
+## Thin wrapper around iter_records and parse_record. Raises
+## FileNotFoundError when the file is missing and RecipeParseError on a
+## malformed record, after every record before it has been yielded.
+
+def iter_recipes(filename):
+    for record_number, offset, length, blocks in iter_records(filename):
+        yield parse_record(blocks)
+
+
+## format_recipe(recipe_object)
+##
+## Summary of the record writer:
+##
+## Formats one Recipe as a record of the plain-text file format.
+##
+## Parameters : recipe_object - the recipe to format
+##
+## Return Value : string ending in the blank line that separates it from
+##                the next record
+##
+## Description:
+##
+## Writes name, photo, tags, ingredients and description blocks
+## separated by blank lines so the text can be read back by
+## iter_records.
+
+def format_recipe(recipe_object):
+    parts = [f"{recipe_object.name}\n\n", f"{recipe_object.photo_name}\n\n", f"{' '.join(recipe_object.tags)}\n\n"]
+    for ingredient, amount in recipe_object.ingredients:
+        if amount:
+            parts.append(f"{ingredient}, {amount}\n")
+        else:
+            parts.append(f"{ingredient}\n")
+    parts.append("\n")
+    if recipe_object.description.strip():
+        parts.append(f"{recipe_object.description}\n\n")
+    else:
+        parts.append("\n")
+    return "".join(parts)
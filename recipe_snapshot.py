@@ -0,0 +1,311 @@
+##-----------------------------------------------------------------------
+## File : recipe_snapshot.py
+##
+## Description: Reads and writes a compact binary snapshot of a recipes
+##              file. The snapshot sits next to recipes.txt (as
+##              recipes.txt.snap) and lets startup skip the text parser
+##              while the text file has not changed since the snapshot was
+##              written. Run this file directly to convert between the two
+##              formats.
+##-----------------------------------------------------------------------
+
+import argparse
+import os
+import struct
+import sys
+
+from recipe import Recipe
+from recipe_parser import ENCODING, format_recipe, iter_recipes
+
+SNAPSHOT_MAGIC = b"RCPSNAP1"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snap"
+
+## Header layout: magic, version, source size, source mtime (ns),
+## string count, record count.
+HEADER = struct.Struct("<8sHQqII")
+LENGTH = struct.Struct("<I")
+COUNT = struct.Struct("<H")
+
+
+## class SnapshotError
+##
+## Description:
+##
+##   Raised when a snapshot file is truncated, has the wrong magic bytes
+##   or was written by an unknown version. Callers fall back to the text
+##   file when they see it.
+
+class SnapshotError(ValueError):
+    pass
+
+
+## snapshot_path(filename)
+##
+## Summary of the path helper:
+##
+## Returns where the snapshot for a recipes file is stored.
+##
+## Parameters : filename - path to the recipes text file
+##
+## Return Value : path of the snapshot file
+##
+## Description:
+##
+## The snapshot keeps the full text file name and adds ".snap" so it is
+## obvious which file it belongs to.
+
+def snapshot_path(filename):
+    return filename + SNAPSHOT_SUFFIX
+
+
+## source_stamp(filename)
+##
+## Summary of the file stamp helper:
+##
+## Returns the (size, mtime in nanoseconds) of a recipes text file.
+##
+## Parameters : filename - path to the recipes text file
+##
+## Return Value : tuple (size, mtime_ns)
+##
+## Description:
+##
+## Stored in the snapshot header so the loader can tell whether the text
+## file has changed since the snapshot was written.
+
+def source_stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+## snapshot_is_current(filename)
+##
+## Summary of the freshness check:
+##
+## Decides whether the snapshot next to a recipes file can be used in
+## place of the text file.
+##
+## Parameters : filename - path to the recipes text file
+##
+## Return Value : True if the snapshot can be loaded, otherwise False
+##
+## Description:
+##
+## The snapshot must exist, be at least as new as the text file and
+## record the text file's current size and mtime in its header. Anything
+## else (missing files, an edited text file, an unreadable header) means
+## the text parser has to be used.
+
+def snapshot_is_current(filename):
+    path = snapshot_path(filename)
+    try:
+        stamp = source_stamp(filename)
+        if os.stat(path).st_mtime_ns < stamp[1]:
+            return False
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+    except OSError:
+        return False
+    if len(header) < HEADER.size:
+        return False
+    magic, version, size, mtime_ns, string_count, record_count = HEADER.unpack(header)
+    return magic == SNAPSHOT_MAGIC and version == SNAPSHOT_VERSION and (size, mtime_ns) == stamp
+
+
+## write_snapshot(recipes, path, stamp=(0, 0))
+##
+## Summary of the snapshot writer:
+##
+## Writes recipes to a binary snapshot file.
+##
+## Parameters :
+##    recipes - list of Recipe objects to write
+##    path - snapshot file to create
+##    stamp - (size, mtime_ns) of the text file the snapshot mirrors
+##
+## Return Value : none
+##
+## Description:
+##
+## Every tag and ingredient name is written once to a string table and
+## records refer to it by index. Other strings are stored inline with a
+## 4-byte length prefix. The file is written to a temporary name and then
+## renamed so a reader never sees half a snapshot.
+
+def write_snapshot(recipes, path, stamp=(0, 0)):
+    strings = {}
+    for entry in recipes:
+        for tag in entry.tags:
+            strings.setdefault(tag, len(strings))
+        for ingredient, amount in entry.ingredients:
+            strings.setdefault(ingredient, len(strings))
+
+    parts = [HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, stamp[0], stamp[1], len(strings), len(recipes))]
+
+    def add_text(text):
+        data = text.encode(ENCODING)
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+
+    for text in strings:
+        add_text(text)
+    for entry in recipes:
+        add_text(entry.name)
+        add_text(entry.photo_name)
+        parts.append(COUNT.pack(len(entry.tags)))
+        parts.append(struct.pack(f"<{len(entry.tags)}I", *[strings[tag] for tag in entry.tags]))
+        parts.append(LENGTH.pack(len(entry.ingredients)))
+        for ingredient, amount in entry.ingredients:
+            parts.append(LENGTH.pack(strings[ingredient]))
+            add_text(amount)
+        add_text(entry.description)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(b"".join(parts))
+    os.replace(temp_path, path)
+
+
+## read_snapshot(path)
+##
+## Summary of the snapshot reader:
+##
+## Reads every Recipe stored in a snapshot file.
+##
+## Parameters : path - snapshot file to read
+##
+## Return Value : list of Recipe in the order they were written
+##
+## Description:
+##
+## Reads the file in one go and walks it with struct.unpack_from. Tag and
+## ingredient names come from the string table, so equal names share one
+## str object. Raises SnapshotError if the file is not a valid snapshot.
+
+def read_snapshot(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    try:
+        magic, version, size, mtime_ns, string_count, record_count = HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"{path} is not a version {SNAPSHOT_VERSION} recipe snapshot")
+        position = HEADER.size
+
+        def read_text():
+            nonlocal position
+            (length,) = LENGTH.unpack_from(data, position)
+            start = position + LENGTH.size
+            position = start + length
+            if position > len(data):
+                raise SnapshotError(f"{path} is truncated")
+            return data[start:position].decode(ENCODING)
+
+        strings = [read_text() for index in range(string_count)]
+        recipes = []
+        for index in range(record_count):
+            name = read_text()
+            photo_name = read_text()
+            (tag_count,) = COUNT.unpack_from(data, position)
+            position += COUNT.size
+            tag_ids = struct.unpack_from(f"<{tag_count}I", data, position)
+            position += 4 * tag_count
+            tags = [strings[tag_id] for tag_id in tag_ids]
+            (ingredient_count,) = LENGTH.unpack_from(data, position)
+            position += LENGTH.size
+            ingredients = []
+            for item in range(ingredient_count):
+                (string_id,) = LENGTH.unpack_from(data, position)
+                position += LENGTH.size
+                ingredients.append((strings[string_id], read_text()))
+            description = read_text()
+            recipes.append(Recipe(name, photo_name, tags, ingredients, description))
+    except (struct.error, IndexError, UnicodeDecodeError) as error:
+        raise SnapshotError(f"{path} is damaged: {error}") from error
+    return recipes
+
+
+## text_to_snapshot(filename, path=None)
+##
+## Summary of the text to snapshot converter:
+##
+## Parses a recipes text file and writes its snapshot.
+##
+## Parameters :
+##    filename - recipes text file to read
+##    path - snapshot to write (defaults to snapshot_path(filename))
+##
+## Return Value : number of recipes converted
+##
+## Description:
+##
+## The snapshot is stamped with the text file's size and mtime so
+## recipe_manager.load_recipes will pick it up.
+
+def text_to_snapshot(filename, path=None):
+    recipes = list(iter_recipes(filename))
+    write_snapshot(recipes, path or snapshot_path(filename), source_stamp(filename))
+    return len(recipes)
+
+
+## snapshot_to_text(path, filename)
+##
+## Summary of the snapshot to text converter:
+##
+## Writes the recipes stored in a snapshot back out as a text file.
+##
+## Parameters :
+##    path - snapshot to read
+##    filename - recipes text file to write
+##
+## Return Value : number of recipes converted
+##
+## Description:
+##
+## Uses the same record format as recipe_manager.save_recipes.
+
+def snapshot_to_text(path, filename):
+    recipes = read_snapshot(path)
+    with open(filename, "w", encoding=ENCODING) as file:
+        for entry in recipes:
+            file.write(format_recipe(entry))
+    return len(recipes)
+
+
+## main(argv=None)
+##
+## Summary of the converter entry point:
+##
+## Command line front end for the two converters.
+##
+## Parameters : argv - argument list (defaults to sys.argv[1:])
+##
+## Return Value : process exit status
+##
+## Description:
+##
+## "to-snapshot recipes.txt" writes recipes.txt.snap and
+## "to-text recipes.txt.snap recipes.txt" goes the other way. An optional
+## output path can be given to to-snapshot.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert between recipes.txt and its binary snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_snapshot = commands.add_parser("to-snapshot", help="write a snapshot from a recipes text file")
+    to_snapshot.add_argument("filename")
+    to_snapshot.add_argument("output", nargs="?")
+    to_text = commands.add_parser("to-text", help="write a recipes text file from a snapshot")
+    to_text.add_argument("snapshot")
+    to_text.add_argument("output")
+    args = parser.parse_args(argv)
+
+    if args.command == "to-snapshot":
+        count = text_to_snapshot(args.filename, args.output)
+    else:
+        count = snapshot_to_text(args.snapshot, args.output)
+    print(f"converted {count} recipes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1419 @@
+##-----------------------------------------------------------------------
+## File : recipe_storage.py
+##
+## Description: Storage backends for recipe_manager. The manager keeps
+##              the in-memory recipe list and indexes and hands loading,
+##              saving and change persistence to one of these classes:
+##              text_storage keeps the original recipes.txt format (with
+##              its snapshot and journal) and sqlite_storage keeps the
+##              recipes in an SQLite database.
+##-----------------------------------------------------------------------
+
+import os
+import sqlite3
+from collections import OrderedDict
+
+from recipe import Recipe
+from recipe_journal import change_entry, expand_batches, fields_recipe, read_journal, recipe_journal
+from recipe_parser import ENCODING, RecipeParseError, format_recipe, iter_recipes, parse_record
+from record_index import index_path, record_index
+from recipe_snapshot import SnapshotError, read_snapshot, snapshot_is_current, snapshot_path, source_stamp, write_snapshot
+
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+BODY_CACHE_SIZE = 256
+LOAD_STEP = 500
+
+
+## add_steps(manager, recipes, total)
+##
+## Summary of the stepped add helper:
+##
+## Adds recipes to a manager, pausing every LOAD_STEP recipes.
+##
+## Parameters :
+##    manager - the recipe_manager to fill
+##    recipes - iterable of Recipe
+##    total - how many recipes there are, for the progress
+##
+## Return Value : generator of the fraction of recipes added so far
+
+def add_steps(manager, recipes, total):
+    for number, recipe_object in enumerate(recipes, 1):
+        manager.add_recipe(recipe_object)
+        if number % LOAD_STEP == 0:
+            yield number / total
+
+
+## class recipe_storage
+##
+## Description:
+##
+##   Describes the interface every storage backend provides. The methods
+##   here do nothing so a backend only has to override what it supports.
+##
+## Methods:
+##
+##   load - add the stored recipes to a manager.
+##   load_steps - load a piece at a time, reporting progress.
+##   save - write every recipe in a manager to storage.
+##   open - start persisting each change as it happens.
+##   record - persist one add, update or delete.
+##   record_many - persist several changes at once.
+##   forget_body - stop treating a recipe's body as a copy of storage.
+##   external_change - bring changes another program made into a manager.
+##   close - stop persisting changes one at a time.
+##   tag_query - answer a tag filter query, or None to let the manager's
+##               in-memory bitsets answer it.
+##   stream - read the stored recipes one at a time without a manager.
+
+class recipe_storage:
+
+    ## load(self, manager, filename)
+    ##
+    ## Summary of the load function:
+    ##
+    ## Adds the stored recipes to manager with manager.add_recipe.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - where the recipes are stored
+    ##
+    ## Return Value : none
+
+    def load(self, manager, filename):
+        pass
+
+    ## load_steps(self, manager, filename)
+    ##
+    ## Summary of the stepped load function:
+    ##
+    ## Does what load does, stopping now and then so the caller can keep
+    ## a window responsive.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - where the recipes are stored
+    ##
+    ## Return Value : generator of the fraction loaded so far (0 to 1)
+    ##
+    ## Description:
+    ##
+    ## Loading is finished when the generator is exhausted, and raises
+    ## whatever load would have raised. This version loads everything in
+    ## one step.
+
+    def load_steps(self, manager, filename):
+        self.load(manager, filename)
+        yield 1.0
+
+    ## save(self, manager, filename)
+    ##
+    ## Summary of the save function:
+    ##
+    ## Writes every recipe in manager.recipe_list to storage.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to save
+    ##    filename - where to store the recipes
+    ##
+    ## Return Value : none
+
+    def save(self, manager, filename):
+        pass
+
+    ## open(self, manager, filename)
+    ##
+    ## Summary of the open function:
+    ##
+    ## Starts persisting each change passed to record.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager whose changes are persisted
+    ##    filename - where the recipes are stored
+    ##
+    ## Return Value : none
+
+    def open(self, manager, filename):
+        pass
+
+    ## record(self, manager, op, name, recipe_object)
+    ##
+    ## Summary of the change function:
+    ##
+    ## Persists one change made to manager.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager that changed
+    ##    op - "add", "update" or "delete"
+    ##    name - recipe name (the old name for an update)
+    ##    recipe_object - the recipe that changed
+    ##
+    ## Return Value : none
+
+    def record(self, manager, op, name, recipe_object):
+        pass
+
+    ## record_many(self, manager, changes)
+    ##
+    ## Summary of the multiple change function:
+    ##
+    ## Persists several changes made to manager, in order.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager that changed
+    ##    changes - list of (op, name, recipe_object) as record takes them
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Used when a recipe_batch commits. This version calls record for
+    ## each change; backends override it to store them all in one write.
+
+    def record_many(self, manager, changes):
+        for op, name, recipe_object in changes:
+            self.record(manager, op, name, recipe_object)
+
+    ## forget_body(self, recipe_object)
+    ##
+    ## Summary of the body release function:
+    ##
+    ## Stops treating a recipe's body as a copy of what is stored.
+    ##
+    ## Parameters : recipe_object - a recipe that was just edited
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## record already does this for every change. A recipe_batch calls it
+    ## straight after an edit, since it only calls record_many when it
+    ## commits and an edited body must not be unloaded before then.
+
+    def forget_body(self, recipe_object):
+        pass
+
+    ## external_change(self, manager, filename, stamp, apply)
+    ##
+    ## Summary of the outside change function:
+    ##
+    ## Applies changes that another program already made to the stored
+    ## recipes.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to change
+    ##    filename - where the recipes are stored
+    ##    stamp - (size, mtime_ns) of the file the changes were read from
+    ##    apply - function making the changes through the manager
+    ##
+    ## Return Value : whatever apply returns
+    ##
+    ## Description:
+    ##
+    ## The changes are already stored, so a backend must not store them a
+    ## second time. This version just runs apply.
+
+    def external_change(self, manager, filename, stamp, apply):
+        return apply()
+
+    ## close(self, manager)
+    ##
+    ## Summary of the close function:
+    ##
+    ## Makes sure every recorded change is stored and stops recording.
+    ##
+    ## Parameters : manager - the recipe_manager being closed
+    ##
+    ## Return Value : none
+
+    def close(self, manager):
+        pass
+
+    ## tag_query(self, manager, match_all, match_any, match_none)
+    ##
+    ## Summary of the tag query function:
+    ##
+    ## Answers a tag filter query inside the storage backend.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager being queried
+    ##    match_all - tags every result must have (AND)
+    ##    match_any - tags of which a result must have at least one (OR)
+    ##    match_none - tags no result may have (NOT)
+    ##
+    ## Return Value : (list of Recipe, dictionary tag -> count) or None
+    ##
+    ## Description:
+    ##
+    ## Returning None tells the manager to use its own bitsets.
+
+    def tag_query(self, manager, match_all, match_any, match_none):
+        return None
+
+    ## stream(self, filename)
+    ##
+    ## Summary of the stream function:
+    ##
+    ## Reads the stored recipes one at a time, in list order, without
+    ## keeping them.
+    ##
+    ## Parameters : filename - where the recipes are stored
+    ##
+    ## Return Value : iterator of complete Recipes, or None when the
+    ##                backend cannot stream this store
+    ##
+    ## Description:
+    ##
+    ## Used by the command line tools so a large library can be read
+    ## with constant memory. None means the caller has to load the
+    ## recipes into a recipe_manager instead.
+
+    def stream(self, filename):
+        return None
+
+
+## class text_storage
+##
+## Description:
+##
+##   Stores recipes in the plain-text recipes.txt format. Loads from the
+##   binary snapshot when it is current, otherwise reads the text through
+##   a memory map with its record index, journals changes one line at a
+##   time once open is called and rewrites recipes.txt atomically. In
+##   lazy mode only names, photo names and tags are loaded; each recipe's
+##   ingredients and description are read back from the file the first
+##   time they are used, and only the most recently used bodies are kept.
+##
+## Data members:
+##
+##   use_snapshot : Whether load/save use the binary snapshot.
+##   use_index : Whether load keeps the recipes.txt.idx record index.
+##   journal : recipe_journal recording changes, or None when changes
+##             are not being journaled.
+##   journal_limit : Journal size in bytes that triggers a compaction.
+##   lazy_bodies : Whether bodies are loaded on demand.
+##   body_limit : Most file-backed bodies kept in memory in lazy mode.
+##   body_filename : Recipes file the bodies are read from, or None.
+##   body_records : record_index mapping body_filename, or None.
+##   spans : Mapping Recipe -> (offset, length) of its record in
+##           body_filename, for recipes whose body matches the file.
+##   loaded_bodies : OrderedDict of recipes in spans with their body in
+##                   memory, least recently read first.
+##   written : Mapping filename -> (size, mtime_ns) of the file as save
+##             last wrote it, so a watcher can tell our own saves apart.
+##   partial : Recipes files whose load stopped at a malformed record.
+##             The recipes after it are only in the file, so it is never
+##             rewritten from memory and its journal keeps every record.
+##
+## Methods:
+##
+##   load, save, open, record, record_many, external_change, close,
+##   stream - see recipe_storage.
+##   replay_journal - apply journaled changes on top of loaded recipes.
+##   load_failed - replay the journal after a malformed record.
+##   compact - rewrite the recipes file once the journal is big enough.
+##   load_records - add the recipes of a mapped text file.
+##   load_headers - add recipes without their bodies (lazy mode).
+##   read_body - body loader that reads one record back from the file.
+##   remember_body - keep a body and unload the oldest past body_limit.
+##   forget_body - stop treating a recipe's body as file-backed.
+##   close_body_records - unmap the file used by read_body.
+
+class text_storage(recipe_storage):
+
+    ## __init__(self, use_snapshot=True, journal_limit=JOURNAL_COMPACT_BYTES, lazy_bodies=False, body_limit=BODY_CACHE_SIZE, use_index=True)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Sets up a text backend that is not journaling yet.
+    ##
+    ## Parameters :
+    ##    use_snapshot - whether to read and write recipes.txt.snap
+    ##    journal_limit - journal size in bytes that triggers a rewrite
+    ##    lazy_bodies - load ingredients and descriptions on demand
+    ##    body_limit - most file-backed bodies kept in memory when lazy
+    ##    use_index - whether to read and write recipes.txt.idx
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The snapshot holds every body, so lazy mode never reads or writes
+    ## it.
+
+    def __init__(self, use_snapshot=True, journal_limit=JOURNAL_COMPACT_BYTES, lazy_bodies=False, body_limit=BODY_CACHE_SIZE, use_index=True):
+        self.use_snapshot = use_snapshot and not lazy_bodies
+        self.use_index = use_index
+        self.journal = None
+        self.journal_limit = journal_limit
+        self.lazy_bodies = lazy_bodies
+        self.body_limit = max(1, body_limit)
+        self.body_filename = None
+        self.body_records = None
+        self.spans = {}
+        self.loaded_bodies = OrderedDict()
+        self.written = {}
+        self.partial = set()
+
+    ## load(self, manager, filename)
+    ##
+    ## Summary of the load function:
+    ##
+    ## Reads recipes from a text file (or its snapshot) and replays the
+    ## journal on top.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Runs load_steps to the end.
+
+    def load(self, manager, filename):
+        for fraction in self.load_steps(manager, filename):
+            pass
+
+    ## load_steps(self, manager, filename)
+    ##
+    ## Summary of the stepped load function:
+    ##
+    ## Reads recipes from a text file (or its snapshot) a few hundred at a
+    ## time and replays the journal on top.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : generator of the fraction loaded so far
+    ##
+    ## Description:
+    ##
+    ## If use_snapshot is set and the binary snapshot is current it is
+    ## loaded instead of parsing the text; a damaged snapshot falls back
+    ## to the text file. Otherwise recipes are read with load_records,
+    ## which parses each record as it is added. Any
+    ## changes journaled since the file was last written are replayed on
+    ## top. Missing file is handled silently. A malformed record raises
+    ## RecipeParseError after every recipe before it has been added and
+    ## the journal has been replayed (see load_failed). In lazy mode
+    ## load_headers is used instead of load_records.
+
+    def load_steps(self, manager, filename):
+        self.partial.discard(filename)
+        if self.lazy_bodies:
+            try:
+                yield from self.load_headers(manager, filename)
+            except FileNotFoundError:
+                pass
+            except RecipeParseError:
+                self.load_failed(manager, filename)
+                raise
+            self.replay_journal(manager, filename)
+            return
+
+        if self.use_snapshot and snapshot_is_current(filename):
+            try:
+                recipes = read_snapshot(snapshot_path(filename))
+            except (OSError, SnapshotError):
+                recipes = None
+            if recipes is not None:
+                yield from add_steps(manager, recipes, len(recipes))
+                self.replay_journal(manager, filename)
+                return
+
+        try:
+            yield from self.load_records(manager, filename)
+        except FileNotFoundError:
+            pass
+        except RecipeParseError:
+            self.load_failed(manager, filename)
+            raise
+        self.replay_journal(manager, filename)
+
+    ## load_failed(self, manager, filename)
+    ##
+    ## Summary of the failed load function:
+    ##
+    ## Replays the journal on top of a file that stopped loading at a
+    ## malformed record, and stops the file being rewritten.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager being filled
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The caller still sees the RecipeParseError, but the recipes it
+    ## shows include the journaled edits. Changes to recipes past the bad
+    ## record cannot be replayed yet, so the file goes into partial: the
+    ## journal is appended to but never folded into the file, and every
+    ## record in it is replayed again once the file is fixed.
+
+    def load_failed(self, manager, filename):
+        self.partial.add(filename)
+        self.replay_journal(manager, filename)
+
+    ## load_records(self, manager, filename)
+    ##
+    ## Summary of the mapped load function:
+    ##
+    ## Adds every recipe of a text file through a record_index.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : generator of the fraction loaded so far
+    ##
+    ## Description:
+    ##
+    ## The index gives the number of records up front, so the progress is
+    ## exact. The file is unmapped once every record has been added.
+
+    def load_records(self, manager, filename):
+        records = record_index(filename)
+        try:
+            records.build(self.use_index)
+            yield from add_steps(manager, records.recipes(), len(records.offsets))
+        finally:
+            records.close()
+
+    ## load_headers(self, manager, filename)
+    ##
+    ## Summary of the lazy load function:
+    ##
+    ## Adds every recipe in a text file without its body.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : generator of the fraction loaded so far
+    ##
+    ## Description:
+    ##
+    ## Keeps only the name, photo name and tags of each record plus its
+    ## offset and length, and gives the Recipe read_body as its
+    ## body_loader, so memory grows with the number of recipes rather
+    ## than the size of the file. The record index finds the records and
+    ## only their first three blocks are decoded; the mapping stays open
+    ## for read_body. A broken record raises RecipeParseError after the
+    ## records before it have been added.
+
+    def load_headers(self, manager, filename):
+        self.close_body_records()
+        self.spans = {}
+        self.loaded_bodies = OrderedDict()
+        self.body_filename = filename
+        records = record_index(filename)
+        self.body_records = records
+        records.build(self.use_index)
+        total = len(records.offsets)
+        for number, (offset, length) in enumerate(zip(records.offsets, records.lengths), 1):
+            name, photo_name, tags_line = records.headers(offset, length)
+            recipe_object = Recipe(name.strip(), photo_name.strip(), tags_line.split(), None, None, self.read_body)
+            self.spans[recipe_object] = (offset, length)
+            manager.add_recipe(recipe_object)
+            if number % LOAD_STEP == 0:
+                yield number / total
+        if records.error is not None:
+            raise records.error
+
+    ## read_body(self, recipe_object)
+    ##
+    ## Summary of the body loader:
+    ##
+    ## Reads a recipe's ingredients and description back from the file.
+    ##
+    ## Parameters : recipe_object - a recipe created by load_headers
+    ##
+    ## Return Value : tuple (ingredients, description)
+    ##
+    ## Description:
+    ##
+    ## The record is sliced out of the mapped file and parsed the same way
+    ## the loader would have. The body is then counted in loaded_bodies.
+
+    def read_body(self, recipe_object):
+        span = self.spans.get(recipe_object)
+        if span is None:
+            return [], ""
+        if self.body_records is None:
+            self.body_records = record_index(self.body_filename)
+        parsed = parse_record(self.body_records.blocks(*span))
+        self.remember_body(recipe_object)
+        return parsed.ingredients, parsed.description
+
+    ## remember_body(self, recipe_object)
+    ##
+    ## Summary of the body cache function:
+    ##
+    ## Marks a file-backed body as most recently used and unloads the
+    ## least recently used ones past body_limit.
+    ##
+    ## Parameters : recipe_object - recipe whose body is (being) loaded
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## An unloaded recipe keeps read_body as its body_loader, so it is
+    ## simply read again when it is next used.
+
+    def remember_body(self, recipe_object):
+        self.loaded_bodies[recipe_object] = None
+        self.loaded_bodies.move_to_end(recipe_object)
+        while len(self.loaded_bodies) > self.body_limit:
+            evicted, unused = self.loaded_bodies.popitem(last=False)
+            evicted.unload_body()
+
+    ## forget_body(self, recipe_object)
+    ##
+    ## Summary of the body release function:
+    ##
+    ## Stops treating a recipe's body as a copy of the file.
+    ##
+    ## Parameters : recipe_object - a recipe that was edited or deleted
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## An edited body only exists in memory (and the journal) until the
+    ## next save, so it must never be unloaded or read back from its old
+    ## offset.
+
+    def forget_body(self, recipe_object):
+        self.spans.pop(recipe_object, None)
+        self.loaded_bodies.pop(recipe_object, None)
+
+    ## close_body_records(self)
+    ##
+    ## Summary of the body file close function:
+    ##
+    ## Unmaps the file read_body uses. It is mapped again when needed.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def close_body_records(self):
+        if self.body_records is not None:
+            self.body_records.close()
+            self.body_records = None
+
+    ## replay_journal(self, manager, filename)
+    ##
+    ## Summary of the journal replay function:
+    ##
+    ## Applies the changes recorded in a recipes file's journal.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to apply them to
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Each add, update and delete record is applied in order through the
+    ## manager's add_recipe, update_recipe and delete_recipe methods, with
+    ## journaling switched off so replaying does not write the records a
+    ## second time. A batch record is replaced by the changes in it.
+
+    def replay_journal(self, manager, filename):
+        journal = self.journal
+        self.journal = None
+        try:
+            for entry in expand_batches(read_journal(filename)):
+                if entry["op"] == "add":
+                    manager.add_recipe(fields_recipe(entry["recipe"]))
+                elif entry["op"] == "delete":
+                    manager.delete_recipe(entry["name"])
+                elif entry["op"] == "update":
+                    recipe_object = manager.get_recipe(entry["name"])
+                    if recipe_object is not None:
+                        new_values = fields_recipe(entry["recipe"])
+                        manager.update_recipe(recipe_object, new_values.name, new_values.photo_name, new_values.tags, new_values.ingredients, new_values.description)
+        finally:
+            self.journal = journal
+
+    ## open(self, manager, filename)
+    ##
+    ## Summary of the journal open function:
+    ##
+    ## Starts recording every add, update and delete to the journal of a
+    ## recipes file.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager whose changes are journaled
+    ##    filename - path to the recipes file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Records already in a valid journal are kept and new ones are
+    ## appended after them.
+
+    def open(self, manager, filename):
+        self.journal = recipe_journal(filename)
+        self.journal.resume(len(read_journal(filename)))
+
+    ## record(self, manager, op, name, recipe_object)
+    ##
+    ## Summary of the change logging function:
+    ##
+    ## Journals one change and compacts the journal once it gets too big.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager that changed
+    ##    op - "add", "update" or "delete"
+    ##    name - recipe name (the old name for an update)
+    ##    recipe_object - the recipe that changed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Edited and deleted recipes stop being file-backed first. Otherwise
+    ## does nothing when no journal is open. When the journal reaches
+    ## journal_limit bytes the recipes file is rewritten with save, which
+    ## also empties the journal.
+
+    def record(self, manager, op, name, recipe_object):
+        if op != "add":
+            self.forget_body(recipe_object)
+        if self.journal is None:
+            return
+        if op == "add":
+            self.journal.log_add(recipe_object)
+        elif op == "update":
+            self.journal.log_update(name, recipe_object)
+        elif op == "delete":
+            self.journal.log_delete(name)
+        self.compact(manager)
+
+    ## record_many(self, manager, changes)
+    ##
+    ## Summary of the multiple change function:
+    ##
+    ## Journals several changes with one sync to the disk.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager that changed
+    ##    changes - list of (op, name, recipe_object)
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Works like record, except that more than one change is written as
+    ## a single batch record, so after a crash either all of them are
+    ## replayed or none are.
+
+    def record_many(self, manager, changes):
+        for op, name, recipe_object in changes:
+            if op != "add":
+                self.forget_body(recipe_object)
+        if self.journal is None or not changes:
+            return
+        entries = [change_entry(op, name, recipe_object) for op, name, recipe_object in changes]
+        self.journal.append(entries[0] if len(entries) == 1 else {"op": "batch", "changes": entries})
+        self.compact(manager)
+
+    ## compact(self, manager)
+    ##
+    ## Summary of the compaction function:
+    ##
+    ## Rewrites the recipes file with save once the journal reaches
+    ## journal_limit bytes, which also empties the journal.
+    ##
+    ## Parameters : manager - the recipe_manager being journaled
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## A file in partial is left alone and its journal keeps growing.
+
+    def compact(self, manager):
+        if self.journal.size >= self.journal_limit and self.journal.filename not in self.partial:
+            self.save(manager, self.journal.filename)
+
+    ## external_change(self, manager, filename, stamp, apply)
+    ##
+    ## Summary of the outside change function:
+    ##
+    ## Applies changes another program made to the recipes file without
+    ## journaling them, then makes the journal match the new file.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to change
+    ##    filename - path to the recipes file
+    ##    stamp - (size, mtime_ns) of the file the changes were read from
+    ##    apply - function making the changes through the manager
+    ##
+    ## Return Value : whatever apply returns
+    ##
+    ## Description:
+    ##
+    ## The journal's header names the old file, so its records would be
+    ## thrown away on the next start. With nothing journaled, and the file
+    ## still the one the changes came from, an empty journal is started
+    ## against the new file. Otherwise the recipes file is saved, which
+    ## writes our journaled changes and the outside ones together.
+    ## Nothing is applied to a file in partial, since the manager does not
+    ## hold all of it and saving would lose the rest.
+
+    def external_change(self, manager, filename, stamp, apply):
+        if filename in self.partial:
+            return None
+        journal = self.journal
+        pending = journal is not None and journal.entries > 0
+        self.journal = None
+        try:
+            result = apply()
+        finally:
+            self.journal = journal
+        if journal is not None and journal.filename == filename:
+            try:
+                current = source_stamp(filename)
+            except FileNotFoundError:
+                current = None
+            if pending or current != stamp:
+                self.save(manager, filename)
+            else:
+                journal.start()
+        return result
+
+    ## close(self, manager)
+    ##
+    ## Summary of the journal close function:
+    ##
+    ## Folds any journaled changes into the recipes file and stops
+    ## journaling.
+    ##
+    ## Parameters : manager - the recipe_manager being closed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called when the application exits so the next start has nothing to
+    ## replay. The journal is left alone if it is already empty, or if the
+    ## file is in partial, in which case it is replayed again next time.
+
+    def close(self, manager):
+        self.close_body_records()
+        if self.journal is None:
+            return
+        if self.journal.entries and self.journal.filename not in self.partial:
+            self.save(manager, self.journal.filename)
+        self.journal.close()
+        self.journal = None
+
+    ## save(self, manager, filename)
+    ##
+    ## Summary of the save function:
+    ##
+    ## Persists all recipes to a plain-text file in the project's
+    ## readable format, overwriting existing contents.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to save
+    ##    filename - path to write to
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Writes each recipe with recipe_parser.format_recipe. The text goes
+    ## to a temporary file that is synced and then renamed over the old
+    ## one, so a crash part way through leaves the previous file intact.
+    ## When use_snapshot is set the binary snapshot is rewritten
+    ## afterwards, and if the file has a journal open the journal is
+    ## started again from empty. The record index no longer matches the
+    ## file, so it is removed.
+    ## In lazy mode, saving over the file the bodies come from records
+    ## where each recipe landed in the new file, so every recipe is file
+    ## backed again afterwards and edited bodies can be unloaded too.
+    ## Bodies that are not loaded are read from the old file as it is
+    ## being replaced, and the new file is mapped straight away so the
+    ## recorded offsets keep pointing into it even if another program
+    ## replaces it later.
+    ## The new file's size and mtime are kept in written, and the file is
+    ## no longer partial since it now holds exactly what is in memory.
+
+    def save(self, manager, filename):
+        temp_path = filename + ".tmp"
+        track = self.lazy_bodies and (self.body_filename is None or self.body_filename == filename)
+        spans = {}
+        position = 0
+        newline_bytes = len(os.linesep.encode(ENCODING)) - 1
+        with open(temp_path, "w", encoding=ENCODING) as file:
+            for entry in manager.recipe_list:
+                text = format_recipe(entry)
+                file.write(text)
+                if track:
+                    size = len(text.encode(ENCODING)) + newline_bytes * text.count("\n")
+                    spans[entry] = (position, size)
+                    position += size
+            file.flush()
+            os.fsync(file.fileno())
+        if track:
+            self.close_body_records()
+        os.replace(temp_path, filename)
+        try:
+            os.remove(index_path(filename))
+        except FileNotFoundError:
+            pass
+        self.written[filename] = source_stamp(filename)
+        self.partial.discard(filename)
+        if track:
+            self.body_filename = filename
+            self.body_records = record_index(filename)
+            self.spans = spans
+            self.loaded_bodies = OrderedDict()
+            for entry in manager.recipe_list:
+                entry.body_loader = self.read_body
+                if entry.body_loaded():
+                    self.remember_body(entry)
+        if self.use_snapshot:
+            write_snapshot(manager.recipe_list, snapshot_path(filename), source_stamp(filename))
+        if self.journal is not None and self.journal.filename == filename:
+            self.journal.start()
+
+    ## stream(self, filename)
+    ##
+    ## Summary of the stream function:
+    ##
+    ## Reads the recipes of a text file one at a time.
+    ##
+    ## Parameters : filename - path to the recipes file
+    ##
+    ## Return Value : iterator of Recipe, or None
+    ##
+    ## Description:
+    ##
+    ## Streams recipe_parser.iter_recipes. A file whose journal still has
+    ## changes to replay cannot be streamed (the changes can refer to any
+    ## recipe), so None is returned for it. A missing file has no recipes.
+
+    def stream(self, filename):
+        if read_journal(filename):
+            return None
+        if not os.path.exists(filename):
+            return iter(())
+        return iter_recipes(filename)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    photo_name TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recipes_by_name ON recipes (name);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS recipe_tags (
+    recipe_id INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (recipe_id, tag_id)
+);
+CREATE INDEX IF NOT EXISTS recipe_tags_by_tag ON recipe_tags (tag_id, recipe_id);
+CREATE TABLE IF NOT EXISTS ingredients (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    recipe_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    ingredient_id INTEGER NOT NULL,
+    amount TEXT NOT NULL,
+    PRIMARY KEY (recipe_id, position)
+);
+CREATE INDEX IF NOT EXISTS recipe_ingredients_by_ingredient ON recipe_ingredients (ingredient_id);
+"""
+
+
+## class sqlite_storage
+##
+## Description:
+##
+##   Stores recipes in an SQLite database with separate recipe, tag and
+##   ingredient tables. Only names, photo names and tags are loaded at
+##   startup; ingredients and description are read the first time a
+##   recipe's body is used. Tag filters run as SQL against the indexed
+##   recipe_tags table.
+##
+## Data members:
+##
+##   filename : Path of the open database, or None.
+##   connection : sqlite3 connection, or None before load/open.
+##   row_ids : Mapping Recipe -> recipes.id.
+##   row_recipes : Mapping recipes.id -> Recipe.
+##   loading : True while load is adding recipes to the manager.
+##   recording : True once open is called; each change is written
+##               through to the database.
+##   in_sync : False once the manager has changes the database lacks.
+##
+## Methods:
+##
+##   load, save, open, record, record_many, close, tag_query - see
+##   recipe_storage.
+##   apply_change - write one change inside an open transaction.
+##   connect - open a database and create the schema.
+##   read_body - body loader for recipes loaded without ingredients.
+##   write_recipe - insert one recipe's rows.
+##   rewrite_recipe - replace one recipe's rows after an edit.
+##   delete_rows - remove one recipe's rows.
+##   stream - read every recipe with its body in one pass.
+##   stream_rows - generator behind stream.
+
+class sqlite_storage(recipe_storage):
+
+    ## __init__(self)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Sets up a backend with no database open yet.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def __init__(self):
+        self.filename = None
+        self.connection = None
+        self.row_ids = {}
+        self.row_recipes = {}
+        self.loading = False
+        self.recording = False
+        self.in_sync = False
+
+    ## connect(self, filename)
+    ##
+    ## Summary of the connect function:
+    ##
+    ## Opens a database file, creating it and its schema if needed.
+    ##
+    ## Parameters : filename - path to the database
+    ##
+    ## Return Value : sqlite3 connection
+    ##
+    ## Description:
+    ##
+    ## Switches the database to WAL mode so reads are not blocked while a
+    ## change is being committed.
+
+    def connect(self, filename):
+        connection = sqlite3.connect(filename)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SQLITE_SCHEMA)
+        return connection
+
+    ## load(self, manager, filename)
+    ##
+    ## Summary of the load function:
+    ##
+    ## Adds every recipe in the database to manager without its body.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to fill
+    ##    filename - path to the database
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Reads tags with one query and names/photo names with another, in
+    ## recipes.id order, and creates each Recipe with read_body as its
+    ## body_loader.
+
+    def load(self, manager, filename):
+        if self.connection is not None and self.filename != filename:
+            self.connection.close()
+            self.connection = None
+        if self.connection is None:
+            self.connection = self.connect(filename)
+            self.filename = filename
+
+        tags_by_recipe = {}
+        for recipe_id, tag in self.connection.execute("SELECT rt.recipe_id, t.name FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id ORDER BY rt.recipe_id, rt.position"):
+            tags_by_recipe.setdefault(recipe_id, []).append(tag)
+
+        self.loading = True
+        try:
+            for recipe_id, name, photo_name in self.connection.execute("SELECT id, name, photo_name FROM recipes ORDER BY id"):
+                recipe_object = Recipe(name, photo_name, tags_by_recipe.get(recipe_id, []), None, None, self.read_body)
+                self.row_ids[recipe_object] = recipe_id
+                self.row_recipes[recipe_id] = recipe_object
+                manager.add_recipe(recipe_object)
+        finally:
+            self.loading = False
+        self.in_sync = True
+
+    ## read_body(self, recipe_object)
+    ##
+    ## Summary of the body loader:
+    ##
+    ## Reads a recipe's ingredients and description from the database.
+    ##
+    ## Parameters : recipe_object - a recipe created by load
+    ##
+    ## Return Value : tuple (ingredients, description)
+    ##
+    ## Description:
+    ##
+    ## Two indexed lookups by recipe id.
+
+    def read_body(self, recipe_object):
+        recipe_id = self.row_ids.get(recipe_object)
+        if recipe_id is None:
+            return [], ""
+        row = self.connection.execute("SELECT description FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        ingredients = self.connection.execute("SELECT i.name, ri.amount FROM recipe_ingredients ri JOIN ingredients i ON i.id = ri.ingredient_id WHERE ri.recipe_id = ? ORDER BY ri.position", (recipe_id,)).fetchall()
+        return ingredients, row[0] if row else ""
+
+    ## write_recipe(self, connection, recipe_object, recipe_id=None)
+    ##
+    ## Summary of the row writer:
+    ##
+    ## Inserts the rows for one recipe.
+    ##
+    ## Parameters :
+    ##    connection - database to write to
+    ##    recipe_object - the recipe to write
+    ##    recipe_id - id to use, or None to let SQLite pick the next one
+    ##
+    ## Return Value : the recipe's id
+    ##
+    ## Description:
+    ##
+    ## Tag and ingredient names are shared between recipes through the
+    ## tags and ingredients tables. A tag repeated on the same recipe is
+    ## stored once.
+
+    def write_recipe(self, connection, recipe_object, recipe_id=None):
+        cursor = connection.execute("INSERT INTO recipes (id, name, photo_name, description) VALUES (?, ?, ?, ?)", (recipe_id, recipe_object.name, recipe_object.photo_name, recipe_object.description))
+        recipe_id = cursor.lastrowid
+        for position, tag in enumerate(recipe_object.tags):
+            connection.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag,))
+            connection.execute("INSERT OR IGNORE INTO recipe_tags (recipe_id, tag_id, position) SELECT ?, id, ? FROM tags WHERE name = ?", (recipe_id, position, tag))
+        for position, (ingredient, amount) in enumerate(recipe_object.ingredients):
+            connection.execute("INSERT OR IGNORE INTO ingredients (name) VALUES (?)", (ingredient,))
+            connection.execute("INSERT INTO recipe_ingredients (recipe_id, position, ingredient_id, amount) SELECT ?, ?, id, ? FROM ingredients WHERE name = ?", (recipe_id, position, amount, ingredient))
+        return recipe_id
+
+    ## delete_rows(self, connection, recipe_id)
+    ##
+    ## Summary of the row remover:
+    ##
+    ## Deletes the rows for one recipe.
+    ##
+    ## Parameters :
+    ##    connection - database to change
+    ##    recipe_id - id of the recipe
+    ##
+    ## Return Value : none
+
+    def delete_rows(self, connection, recipe_id):
+        connection.execute("DELETE FROM recipe_tags WHERE recipe_id = ?", (recipe_id,))
+        connection.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", (recipe_id,))
+        connection.execute("DELETE FROM recipes WHERE id = ?", (recipe_id,))
+
+    ## rewrite_recipe(self, connection, recipe_object)
+    ##
+    ## Summary of the row updater:
+    ##
+    ## Replaces the stored rows of an edited recipe.
+    ##
+    ## Parameters :
+    ##    connection - database to change
+    ##    recipe_object - the recipe after the edit
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Keeps the recipe's id so its position in recipe order is unchanged.
+
+    def rewrite_recipe(self, connection, recipe_object):
+        recipe_id = self.row_ids[recipe_object]
+        self.delete_rows(connection, recipe_id)
+        self.write_recipe(connection, recipe_object, recipe_id)
+
+    ## open(self, manager, filename)
+    ##
+    ## Summary of the open function:
+    ##
+    ## Starts writing each change straight through to the database.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager whose changes are stored
+    ##    filename - path to the database
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## If the manager was changed before open was called the database is
+    ## rewritten first so the two agree.
+
+    def open(self, manager, filename):
+        if self.connection is None or self.filename != filename or not self.in_sync:
+            self.save(manager, filename)
+        self.recording = True
+
+    ## record(self, manager, op, name, recipe_object)
+    ##
+    ## Summary of the change function:
+    ##
+    ## Writes one change to the database in its own transaction.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager that changed
+    ##    op - "add", "update" or "delete"
+    ##    name - recipe name (the old name for an update)
+    ##    recipe_object - the recipe that changed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Changes made before open only mark the database as out of date;
+    ## save or open bring it up to date.
+
+    def record(self, manager, op, name, recipe_object):
+        self.record_many(manager, [(op, name, recipe_object)])
+
+    ## record_many(self, manager, changes)
+    ##
+    ## Summary of the multiple change function:
+    ##
+    ## Writes several changes to the database in one transaction.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager that changed
+    ##    changes - list of (op, name, recipe_object)
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Either every change is stored or, if one fails, none of them are.
+
+    def record_many(self, manager, changes):
+        if self.loading:
+            return
+        if not self.recording:
+            self.in_sync = False
+            return
+        with self.connection:
+            for op, name, recipe_object in changes:
+                self.apply_change(op, recipe_object)
+
+    ## apply_change(self, op, recipe_object)
+    ##
+    ## Summary of the change writer:
+    ##
+    ## Writes one change inside the caller's transaction.
+    ##
+    ## Parameters :
+    ##    op - "add", "update" or "delete"
+    ##    recipe_object - the recipe that changed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Rows are found through row_ids, so the old name of an edited
+    ## recipe is not needed.
+
+    def apply_change(self, op, recipe_object):
+        if op == "add":
+            recipe_id = self.write_recipe(self.connection, recipe_object)
+            self.row_ids[recipe_object] = recipe_id
+            self.row_recipes[recipe_id] = recipe_object
+        elif op == "update":
+            self.rewrite_recipe(self.connection, recipe_object)
+        elif op == "delete":
+            recipe_id = self.row_ids.pop(recipe_object)
+            del self.row_recipes[recipe_id]
+            self.delete_rows(self.connection, recipe_id)
+
+    ## close(self, manager)
+    ##
+    ## Summary of the close function:
+    ##
+    ## Stops writing changes through and checkpoints the WAL file.
+    ##
+    ## Parameters : manager - the recipe_manager being closed
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The connection stays open so bodies can still be loaded.
+
+    def close(self, manager):
+        self.recording = False
+        if self.connection is not None:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    ## save(self, manager, filename)
+    ##
+    ## Summary of the save function:
+    ##
+    ## Writes every recipe in the manager to a database.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager to save
+    ##    filename - path to the database
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Replaces the whole contents of the database in one transaction.
+    ## Saving to the database this backend loaded from makes it the open
+    ## database again and re-numbers the recipes in list order; saving
+    ## elsewhere leaves the open database alone. Every recipe body is
+    ## read before anything is deleted.
+
+    def save(self, manager, filename):
+        recipes = manager.recipe_list
+        for entry in recipes:
+            entry.ingredients
+
+        if self.connection is not None and self.filename == filename:
+            connection = self.connection
+        else:
+            connection = self.connect(filename)
+
+        with connection:
+            for table in ("recipe_tags", "recipe_ingredients", "recipes", "tags", "ingredients"):
+                connection.execute(f"DELETE FROM {table}")
+            recipe_ids = [self.write_recipe(connection, entry) for entry in recipes]
+
+        if connection is self.connection or self.connection is None:
+            self.connection = connection
+            self.filename = filename
+            self.row_ids = dict(zip(recipes, recipe_ids))
+            self.row_recipes = dict(zip(recipe_ids, recipes))
+            self.in_sync = True
+        else:
+            connection.close()
+
+    ## tag_query(self, manager, match_all, match_any, match_none)
+    ##
+    ## Summary of the tag query function:
+    ##
+    ## Runs a tag filter as SQL and counts the result's tags.
+    ##
+    ## Parameters :
+    ##    manager - the recipe_manager being queried
+    ##    match_all - tags every result must have (AND)
+    ##    match_any - tags of which a result must have at least one (OR)
+    ##    match_none - tags no result may have (NOT)
+    ##
+    ## Return Value : (list of Recipe, dictionary tag -> count) or None
+    ##
+    ## Description:
+    ##
+    ## Each part of the query becomes a sub-select on recipe_tags, which
+    ## is indexed by tag. Returns None (use the manager's bitsets) when
+    ## the database is missing changes the manager has.
+
+    def tag_query(self, manager, match_all, match_any, match_none):
+        if self.connection is None or not self.in_sync:
+            return None
+
+        tag_select = "SELECT rt.recipe_id FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id WHERE t.name IN ({})"
+        conditions = []
+        parameters = []
+        match_all = list(dict.fromkeys(match_all))
+        if match_all:
+            conditions.append("id IN (" + tag_select.format(", ".join("?" * len(match_all))) + f" GROUP BY rt.recipe_id HAVING COUNT(*) = {len(match_all)})")
+            parameters.extend(match_all)
+        if match_any:
+            conditions.append("id IN (" + tag_select.format(", ".join("?" * len(match_any))) + ")")
+            parameters.extend(match_any)
+        if match_none:
+            conditions.append("id NOT IN (" + tag_select.format(", ".join("?" * len(match_none))) + ")")
+            parameters.extend(match_none)
+        query = "SELECT id FROM recipes"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        recipes = [self.row_recipes[recipe_id] for (recipe_id,) in self.connection.execute(query + " ORDER BY id", parameters)]
+        counts = dict.fromkeys(manager.all_tags, 0)
+        for tag, count in self.connection.execute(f"SELECT t.name, COUNT(*) FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id WHERE rt.recipe_id IN ({query}) GROUP BY t.name", parameters):
+            counts[tag] = count
+        return recipes, counts
+
+    ## stream(self, filename)
+    ##
+    ## Summary of the stream function:
+    ##
+    ## Reads every recipe of a database, body included, one at a time.
+    ##
+    ## Parameters : filename - path to the database
+    ##
+    ## Return Value : iterator of Recipe
+    ##
+    ## Description:
+    ##
+    ## Uses its own connection so the open database is not disturbed.
+    ## The recipes, tags and ingredients are read with three queries
+    ## sorted by recipe id and merged as they go, instead of two lookups
+    ## per recipe. A missing database has no recipes.
+
+    def stream(self, filename):
+        if not os.path.exists(filename):
+            return iter(())
+        return self.stream_rows(filename)
+
+    ## stream_rows(self, filename)
+    ##
+    ## Summary of the streaming generator:
+    ##
+    ## Does the work of stream.
+    ##
+    ## Parameters : filename - path to an existing database
+    ##
+    ## Return Value : generator of Recipe
+
+    def stream_rows(self, filename):
+        connection = self.connect(filename)
+        try:
+            tag_rows = connection.execute("SELECT rt.recipe_id, t.name FROM recipe_tags rt JOIN tags t ON t.id = rt.tag_id ORDER BY rt.recipe_id, rt.position")
+            ingredient_rows = connection.execute("SELECT ri.recipe_id, i.name, ri.amount FROM recipe_ingredients ri JOIN ingredients i ON i.id = ri.ingredient_id ORDER BY ri.recipe_id, ri.position")
+            tag_row = next(tag_rows, None)
+            ingredient_row = next(ingredient_rows, None)
+            for recipe_id, name, photo_name, description in connection.execute("SELECT id, name, photo_name, description FROM recipes ORDER BY id"):
+                tags = []
+                while tag_row is not None and tag_row[0] <= recipe_id:
+                    if tag_row[0] == recipe_id:
+                        tags.append(tag_row[1])
+                    tag_row = next(tag_rows, None)
+                ingredients = []
+                while ingredient_row is not None and ingredient_row[0] <= recipe_id:
+                    if ingredient_row[0] == recipe_id:
+                        ingredients.append((ingredient_row[1], ingredient_row[2]))
+                    ingredient_row = next(ingredient_rows, None)
+                yield Recipe(name, photo_name, tags, ingredients, description)
+        finally:
+            connection.close()
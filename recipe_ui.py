@@ -8,16 +8,52 @@
 ##              required for the C++ version is not included.
 ##-----------------------------------------------------------------------
 
+import time
 import tkinter as tk
+from bisect import bisect_left
+from collections import Counter
 from tkinter import *
 from tkinter import ttk
-from PIL import Image, ImageTk
+from tkinter import messagebox
 
+from image_cache import image_cache
+from image_loader import image_loader
 from recipe import Recipe
+from recipe_browser import name_key, recipe_browser
 from recipe_manager import recipe_manager
+from recipe_parser import RecipeParseError
+from recipe_storage import text_storage
+from recipe_watcher import apply_changes, recipe_watcher
+from tracing import trace_callback
 
 TOTAL_WINDOW_WIDTH = 1200
 TOTAL_WINDOW_HEIGHT = 800
+SEARCH_DELAY_MS = 250
+PHOTO_BOX = (TOTAL_WINDOW_WIDTH//2, TOTAL_WINDOW_HEIGHT//2)
+PREFETCH_NEIGHBOURS = 2
+PREFETCH_RESULTS = 4
+LOAD_SLICE_SECONDS = 0.03
+BROWSER_RESET_CHANGES = 1000
+
+
+## photo_file(photo_name)
+##
+## Summary of the photo file helper:
+##
+## Returns the file a recipe's photo is stored in.
+##
+## Parameters : photo_name - photo name from a Recipe
+##
+## Return Value : photo_name with .png added if it is missing
+##
+## Description:
+##
+## Same rule show_photo applies, without changing the Recipe.
+
+def photo_file(photo_name):
+    if ".png" not in photo_name:
+        return photo_name + ".png"
+    return photo_name
 
 
 ## class menu_manager
@@ -33,40 +69,100 @@ TOTAL_WINDOW_HEIGHT = 800
 ##   root : Main Tkinter window.
 ##   recipe_menu : Add recipe Toplevel instance.
 ##   edit_menu : Edit menu Toplevel instance.
+##   pantry_menu : What Can I Cook Toplevel instance.
 ##   hold_true_tags : Formatted string of recipes matching tag filters.
 ##   tag_state : Mapping tag -> BooleanVar for filters.
+##   tag_options_list : Listbox of tags in the tag selector.
+##   tag_rows : Tag shown on each row of tag_options_list, in name_key
+##              order.
+##   tag_keys : name_key of each entry of tag_rows, for bisecting.
+##   tag_labels : Text currently shown on each row, including its count.
 ##   recipe_manager : Data manager for recipes.
+##   image_cache : Memory and thumbnail cache of resized photos.
+##   image_loader : Worker pool that loads photos off the Tk thread.
+##   tag_matches : Recipes matching the current tag filter.
+##   tag_result : tag_query result currently on screen, or None to force
+##                a redraw.
+##   tag_job : Pending after_idle id of a tag filter update, or None.
+##   search_var : Text in the full text search box.
+##   search_job : Pending after() id of a scheduled search, or None.
+##   hold_search_results : Formatted names of the last search's matches.
+##   sorted_text, tags_text, ingredients_text : Read-only Text widgets of
+##       the detail panels, with their containers.
+##   sorted_label, ingredients_label, description_label, description_text,
+##   photo_label : Persistent Labels of the detail panels.
 ##   recipe_list : list of recipes from the manager.
 ##   all_tags : tag list from the manager.
 ##   chosen_recipe : Currently selected recipe name.
+##   filename : Recipes file or database being shown.
+##   loading : recipe_manager.load_steps generator, or None once the
+##             library has loaded.
+##   load_job : Pending after() id of the next load step, or None.
+##   loaded_count : Recipes of recipe_list already in the browser.
+##   progress, progress_label : Progress bar shown while loading.
+##   change_buttons : Buttons that change recipes, disabled while loading.
+##   watch : Whether to watch recipes.txt for changes from other programs.
+##   watcher : recipe_watcher of the recipes file, or None.
+##   startup_report : Function given the startup timings, or None.
+##   startup_times : List of (phase, seconds) measured so far.
+##   startup_mark : perf_counter value when the window was built.
+##   parse_seconds : Time spent in load_steps so far.
+##   index_seconds : Time spent adding loaded recipes to the widgets.
 ##   Frame widgets: UI layout containers used across methods.
 ##
 ## Methods:
 ##
-##   __init__ - build UI layout, load recipes, and initialize state.
+##   __init__ - build UI layout, start loading recipes, and initialize
+##              state.
+##   load_step - load recipes for a few milliseconds at a time.
+##   show_loaded - add the recipes loaded so far to the browser.
+##   finish_loading - open the journal and enable editing once loaded.
+##   reload_changes - apply changes another program made to the file.
+##   close_window - save outstanding changes and close the application.
 ##   update_window - refresh recipe displays when selection changes.
 ##   new_recipe - open or reuse the add-recipe dialog and handle submission.
 ##   edit_recipe - open the edit dialog pre-filled with the selected recipe.
-##   clear_display - destroy existing detail widgets before redraw.
+##   pantry_search - open or reuse the What Can I Cook dialog.
+##   clear_display - hide the detail widgets.
+##   build_details - create the detail widgets once.
+##   scrolled_text - build a read-only Text widget with a scrollbar.
+##   set_text - replace the contents of a read-only Text widget.
+##   show_pane - pack a detail widget if it is hidden.
 ##   delete_recipe - remove the selected recipe and refresh UI/storage.
-##   toggle_tags - rebuild tag selector UI and attach trace callbacks.
+##   toggle_tags - build the tag selector UI.
+##   apply_tag_changes - add and remove tag rows as recipes change.
+##   insert_tag_row / delete_tag_row - change one row of the selector.
+##   schedule_tag_update - run update_tag_list once a burst of tag
+##                         changes is over.
 ##   update_tag_list - compute recipes matching active tags and display.
+##   show_tag_counts - show per-tag result counts in the tag selector.
 ##   show_tag_list - render the filtered recipe list in a read-only widget.
+##   schedule_search - run the full text search once typing pauses.
+##   run_search - search names, ingredients and descriptions.
 ##   show_tags - display tags for the selected recipe.
 ##   show_recipe - display ingredient list for the selected recipe.
 ##   show_description - display the selected recipe's description.
-##   show_photo - load, resize, and display the recipe's photo.
+##   show_photo - show a placeholder and request the recipe's photo.
+##   place_photo - display a photo once image_loader has it.
+##   prefetch_photos - start loading photos the user may look at next.
 
 class menu_manager:
 
-    ## __init__(self, root)
+    ## __init__(self, root, storage=None, filename="recipes.txt", startup_report=None, watch=True)
     ##
     ## Summary of the constructor function:
     ##
-    ## Initializes the UI manager, builds frames and widgets, and loads
-    ## recipes from disk.
+    ## Initializes the UI manager, builds frames and widgets, and starts
+    ## loading recipes from disk.
     ##
-    ## Parameters : root (top level Tkinter window)
+    ## Parameters :
+    ##    root - top level Tkinter window
+    ##    storage - recipe_storage backend (defaults to text_storage)
+    ##    filename - recipes file or database to open
+    ##    startup_report - optional function called with a list of
+    ##                     (phase, seconds) once the library has loaded
+    ##    watch - whether to pick up changes other programs make to a
+    ##            recipes text file while the window is open
     ##
     ## Return Value : none
     ##
@@ -74,18 +170,38 @@ class menu_manager:
     ##
     ## Configures window geometry, creates frames for layout, instantiates
     ## the recipe_manager, and sets up initial widget states and bindings.
-
-    def __init__(self, root):
+    ## The window is built empty so it can be shown straight away; the
+    ## recipes are loaded afterwards by load_step.
+
+    def __init__(self, root, storage=None, filename="recipes.txt", startup_report=None, watch=True):
+        started = time.perf_counter()
+        self.startup_report = startup_report
+        self.parse_seconds = 0.0
+        self.index_seconds = 0.0
         self.root = root
         self.root.title("Recipe Manager")
 
 
         self.recipe_menu = None
+        self.pantry_menu = None
         self.hold_true_tags = ""
         self.tag_state = {}
-
-        self.recipe_manager = recipe_manager()
-        self.recipe_manager.load_recipes()
+        self.image_cache = image_cache()
+        self.image_loader = image_loader(root, self.image_cache)
+        self.tag_matches = []
+        self.tag_result = None
+        self.tag_job = None
+        self.search_var = tk.StringVar()
+        self.search_job = None
+        self.hold_search_results = ""
+
+        self.recipe_manager = recipe_manager(storage)
+        self.filename = filename
+        self.loading = self.recipe_manager.load_steps(filename)
+        self.load_job = None
+        self.loaded_count = 0
+        self.watch = watch
+        self.watcher = None
         self.recipe_list = self.recipe_manager.recipe_list
         self.all_tags = self.recipe_manager.all_tags
 
@@ -143,24 +259,211 @@ class menu_manager:
         self.bottom_left_frame.pack_propagate(False)
         self.bottom_right_frame.pack_propagate(False)
 
+        self.build_details()
         self.toggle_tags()
-        self.box = ttk.Combobox(self.left_frame, textvariable=self.chosen_recipe, values=[item.name for item in self.recipe_list], state="readonly")
-        self.box.bind("<<ComboboxSelected>>", self.update_window)
+        self.recipe_manager.add_tag_listener(self.apply_tag_changes)
+        self.browser = recipe_browser(self.left_frame, self.chosen_recipe, [], self.update_window)
 
         recipe_label = tk.Label(self.left_frame, text="Recipe Browser", bg="lightgrey")
         add_item = ttk.Button(self.add_item_frame, text="Add Recipe", command=self.new_recipe)
         edit_item = ttk.Button(self.edit_item_frame, text="Edit Recipe", command=self.edit_recipe)
         delete_item = ttk.Button(self.below_edit_button_frame, text="Delete Recipe", command=self.delete_recipe)
+        pantry_item = ttk.Button(self.below_edit_button_frame, text="What Can I Cook?", command=self.pantry_search)
 
         add_item.pack(anchor="nw", padx=25, pady=35)
         edit_item.pack(anchor="nw", padx=25, pady=35)
-        delete_item.pack(anchor="nw", padx=18, pady=25)
+        delete_item.pack(anchor="nw", padx=18, pady=(25, 5))
+        pantry_item.pack(anchor="nw", padx=18, pady=(0, 10))
         recipe_label.pack(anchor="nw", padx=30, pady=(20,0))
-        self.box.pack(anchor="nw", padx=30, pady=(0, 36))
+        self.browser.pack(anchor="nw", fill="x", padx=30, pady=(0, 10))
+
+        self.change_buttons = [add_item, edit_item, delete_item]
+        for button in self.change_buttons:
+            button.state(["disabled"])
+        self.progress_label = tk.Label(self.left_frame, text="Loading recipes...", bg="lightgrey")
+        self.progress_label.pack(anchor="nw", padx=30)
+        self.progress = ttk.Progressbar(self.left_frame, maximum=1.0)
+        self.progress.pack(anchor="nw", fill="x", padx=30)
 
         self.root.update_idletasks()
         self.root.geometry(f"{TOTAL_WINDOW_WIDTH}x{TOTAL_WINDOW_HEIGHT}")
         self.root.resizable(width=False, height=False)
+        self.root.protocol("WM_DELETE_WINDOW", self.close_window)
+        self.startup_mark = time.perf_counter()
+        self.startup_times = [("window", self.startup_mark - started)]
+        self.load_job = self.root.after_idle(self.load_step)
+
+    ## load_step(self)
+    ##
+    ## Summary of the stepped load function:
+    ##
+    ## Loads recipes for LOAD_SLICE_SECONDS, shows them and comes back
+    ## later for more.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The first call happens once the empty window has been drawn. Each
+    ## call runs recipe_manager.load_steps until the time slice is used
+    ## up, moves the progress bar and gives Tk a chance to handle events
+    ## before the next slice. A malformed recipes file is reported in a
+    ## warning dialog and the recipes read before the bad record are still
+    ## shown.
+
+    def load_step(self):
+        self.load_job = None
+        if len(self.startup_times) == 1:
+            self.root.update_idletasks()
+            self.startup_times.append(("first paint", time.perf_counter() - self.startup_mark))
+        started = time.perf_counter()
+        deadline = started + LOAD_SLICE_SECONDS
+        finished = True
+        try:
+            for fraction in self.loading:
+                self.progress["value"] = fraction
+                if time.perf_counter() >= deadline:
+                    finished = False
+                    break
+        except RecipeParseError as error:
+            messagebox.showwarning("Recipe Manager", f"Some recipes could not be loaded:\n{error}\n\nChanges are kept in the journal and recipes.txt is left as it is until it is fixed.")
+        self.parse_seconds += time.perf_counter() - started
+        if finished:
+            self.finish_loading()
+        else:
+            self.show_loaded()
+            self.load_job = self.root.after(1, self.load_step)
+
+    ## show_loaded(self)
+    ##
+    ## Summary of the loaded recipe display function:
+    ##
+    ## Adds the recipes loaded since the last call to the browser.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Recipes are only appended to recipe_list while loading, so the new
+    ## ones are the ones past loaded_count. New tags reach the tag
+    ## selector through apply_tag_changes as each recipe is added.
+
+    def show_loaded(self):
+        started = time.perf_counter()
+        self.browser.add_names([item.name for item in self.recipe_list[self.loaded_count:]])
+        self.loaded_count = len(self.recipe_list)
+        self.index_seconds += time.perf_counter() - started
+
+    ## finish_loading(self)
+    ##
+    ## Summary of the load completion function:
+    ##
+    ## Shows the last loaded recipes, starts journaling, starts watching
+    ## the recipes file and enables the buttons that change recipes.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Replaying the journal at the end of loading can rename or delete
+    ## recipes, so if the browser no longer holds exactly the loaded names
+    ## it is rebuilt from recipe_list. The startup timings are handed to
+    ## startup_report if one was given. Only a text file is watched; a
+    ## database is not changed behind our back by sync jobs.
+
+    def finish_loading(self):
+        self.loading = None
+        self.show_loaded()
+        started = time.perf_counter()
+        names = [item.name for item in self.recipe_list]
+        if Counter(names) != self.browser.index.counts:
+            self.browser.reset(names)
+        self.index_seconds += time.perf_counter() - started
+        self.recipe_manager.open_journal(self.filename)
+        storage = self.recipe_manager.storage
+        if self.watch and isinstance(storage, text_storage):
+            self.watcher = recipe_watcher(self.root, self.filename, self.reload_changes, storage.written)
+            self.watcher.start()
+        self.progress.destroy()
+        self.progress_label.destroy()
+        for button in self.change_buttons:
+            button.state(["!disabled"])
+        if self.startup_report is not None:
+            self.startup_times.append(("parse", self.parse_seconds))
+            self.startup_times.append(("index", self.index_seconds))
+            self.startup_report(self.startup_times)
+
+    ## close_window(self)
+    ##
+    ## Summary of the window close function:
+    ##
+    ## Saves outstanding changes and closes the application.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Stops the watcher, then calls recipe_manager.close_journal so
+    ## journaled edits are folded into recipes.txt before the main window
+    ## is destroyed.
+    ## A load still in progress is stopped; editing is disabled until
+    ## loading finishes, so there is nothing of it to save.
+
+    def close_window(self):
+        if self.load_job is not None:
+            self.root.after_cancel(self.load_job)
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.image_loader.shutdown()
+        self.recipe_manager.close_journal()
+        self.root.destroy()
+
+    ## reload_changes(self, stamp, changes)
+    ##
+    ## Summary of the outside change function:
+    ##
+    ## Applies changes another program made to the recipes file and
+    ## updates the window to match.
+    ##
+    ## Parameters :
+    ##    stamp - (size, mtime_ns) of the file the changes were read from
+    ##    changes - list of changes from recipe_watcher
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called on the Tk thread by recipe_watcher. recipe_watcher's
+    ## apply_changes makes the changes in one batch, so the tag selector
+    ## hears about them through apply_tag_changes once. The browser gets
+    ## the added and removed names, or is rebuilt if there are more than
+    ## BROWSER_RESET_CHANGES of them. The selected recipe stays selected
+    ## and is shown again in case it changed; if it was deleted nothing
+    ## is selected.
+
+    def reload_changes(self, stamp, changes):
+        added, removed, updated = apply_changes(self.recipe_manager, self.filename, stamp, changes)
+        if not (added or removed or updated):
+            return
+        if len(added) + len(removed) > BROWSER_RESET_CHANGES:
+            self.browser.reset([item.name for item in self.recipe_list])
+        else:
+            for name in removed:
+                self.browser.remove(name)
+            if added:
+                self.browser.add_names(added)
+        if self.chosen_recipe.get() and self.recipe_manager.get_recipe(self.chosen_recipe.get()) is None:
+            self.browser.clear_selection()
+            self.clear_display()
+        self.update_window()
 
 
     ## update_window(self, event=None)
@@ -175,14 +478,17 @@ class menu_manager:
     ##
     ## Description:
     ##
-    ## Calls the helper methods show_recipe, show_photo, show_description,
-    ## show_tags, and update_tag_list to update the UI.
+    ## Resolves the selected recipe once through recipe_manager.get_recipe
+    ## and hands it to the helper methods show_recipe, show_photo,
+    ## show_description and show_tags, then calls update_tag_list to
+    ## update the UI.
 
     def update_window(self, event=None):
-        self.show_recipe()
-        self.show_photo()
-        self.show_description()
-        self.show_tags()
+        recipe_object = self.recipe_manager.get_recipe(self.chosen_recipe.get())
+        self.show_recipe(recipe_object)
+        self.show_photo(recipe_object)
+        self.show_description(recipe_object)
+        self.show_tags(recipe_object)
         self.update_tag_list()
 
     ## new_recipe(self)
@@ -303,8 +609,8 @@ class menu_manager:
             ## Description:
             ##
             ## Ensures the name is not empty, reads form fields, constructs a
-            ## Recipe and calls recipe_manager.add_recipe and
-            ## save_recipes before updating widgets.
+            ## Recipe and calls recipe_manager.add_recipe (which journals
+            ## the change to disk) before updating widgets.
 
             def submit_recipe():
                 if name_var.get() == "":
@@ -315,15 +621,13 @@ class menu_manager:
                 ingredients = pair_ingredients()
                 description = description_var.get("1.0", "end-1c")
                 self.recipe_manager.add_recipe(Recipe(name, photo_name, tags, ingredients, description))
-                self.recipe_manager.save_recipes()
-                self.box["values"] = [item.name for item in self.recipe_manager.recipe_list]
+                self.browser.add(name)
                 clear_text_boxes()
-                self.toggle_tags()
                 self.update_window()
 
             bottom_frame = Frame(self.recipe_menu, bg="lightgrey")
             bottom_frame.grid(row=1, column=0, padx=10, pady=5)
-            ttk.Button(bottom_frame, text="Submit Recipe", command=submit_recipe).grid(row=0, column=0)
+            ttk.Button(bottom_frame, text="Submit Recipe", command=trace_callback(submit_recipe, "menu_manager.new_recipe.submit_recipe")).grid(row=0, column=0)
 
             self.recipe_menu.protocol("WM_DELETE_WINDOW", clear_text_boxes)
         else:
@@ -342,7 +646,7 @@ class menu_manager:
     ##
     ## Description:
     ##
-    ## Locates the selected Recipe, populates widget variables, and
+    ## Looks up the selected Recipe, populates widget variables, and
     ## applies changes via recipe_manager.update_recipe on submit.
 
     def edit_recipe(self, event=None):
@@ -352,29 +656,26 @@ class menu_manager:
         
         tags_holder = ""
         ingredients_text = ""
-        recipe_object = None
-
-        for item in self.recipe_list:
-            if item.name == user_choice:
-                recipe_object = item
-                name_var = StringVar(value=item.name)
-                photo_name_var = StringVar(value=item.photo_name)
-                            
-                for tag in item.tags:
-                    tags_holder += f" {tag}"
-                tags_holder = tags_holder.strip()
-                tags_var = StringVar(value=tags_holder)
-
-                for object in item.ingredients:
-                    ingredient, amount = object
-                    ingredient = ingredient.replace(":", "")
-                    ingredients_text += f"{ingredient}, {amount}\n"
-                
-                description_text = item.description
-                break
+
+        recipe_object = self.recipe_manager.get_recipe(user_choice)
         if recipe_object is None:
             return
-        
+
+        name_var = StringVar(value=recipe_object.name)
+        photo_name_var = StringVar(value=recipe_object.photo_name)
+
+        for tag in recipe_object.tags:
+            tags_holder += f" {tag}"
+        tags_holder = tags_holder.strip()
+        tags_var = StringVar(value=tags_holder)
+
+        for object in recipe_object.ingredients:
+            ingredient, amount = object
+            ingredient = ingredient.replace(":", "")
+            ingredients_text += f"{ingredient}, {amount}\n"
+
+        description_text = recipe_object.description
+
         self.edit_menu = Toplevel(self.root)
         self.edit_menu.title("Recipe Editor")
 
@@ -464,8 +765,8 @@ class menu_manager:
         ## Summary of the submit helper (edit dialog):
         ##
         ## Reads the edited fields, updates the Recipe object via
-        ## recipe_manager.update_recipe, saves changes and refreshes
-        ## the main UI.
+        ## recipe_manager.update_recipe (which journals the change) and
+        ## refreshes the main UI.
         ##
         ## Parameters : none
         ##
@@ -473,8 +774,8 @@ class menu_manager:
         ##
         ## Description:
         ##
-        ## Gathers values from widgets, calls update_recipe, saves the
-        ## file and updates displayed widgets and tag lists.
+        ## Gathers values from widgets, calls update_recipe and updates
+        ## displayed widgets and tag lists.
 
         def submit_recipe():
             name = name_var.get()
@@ -482,20 +783,91 @@ class menu_manager:
             tags = tags_var.get().split()
             ingredients = pair_ingredients()
             description = description_var.get("1.0", "end-1c")
+            old_name = recipe_object.name
             self.recipe_manager.update_recipe(recipe_object, name, photo_name, tags, ingredients, description)
-            self.recipe_manager.save_recipes()
-            self.box["values"] = [item.name for item in self.recipe_manager.recipe_list]
+            self.browser.rename(old_name, name)
             self.clear_display()
             clear_text_boxes()
-            self.toggle_tags()
-            self.update_tag_list()
             self.update_window()
 
         bottom_frame = Frame(self.edit_menu, bg="lightgrey")
         bottom_frame.pack(padx=10, pady=5)
-        ttk.Button(bottom_frame, text="Finish Editing", command=submit_recipe).grid(row=0, column=0)
+        ttk.Button(bottom_frame, text="Finish Editing", command=trace_callback(submit_recipe, "menu_manager.edit_recipe.submit_recipe")).grid(row=0, column=0)
         self.edit_menu.protocol("WM_DELETE_WINDOW", self.edit_menu.destroy)
 
+    ## pantry_search(self)
+    ##
+    ## Summary of the pantry dialog function:
+    ##
+    ## Opens (or reuses) a Toplevel window that lists the recipes that can
+    ## be made from the ingredients the user has.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The user types ingredients separated by commas and picks how many
+    ## ingredients a recipe may be missing. recipe_manager.what_can_i_cook
+    ## does the matching and the results are listed with whatever each
+    ## recipe still needs.
+
+    def pantry_search(self):
+        if self.pantry_menu is None or not self.pantry_menu.winfo_exists():
+            self.pantry_menu = Toplevel(self.root)
+            self.pantry_menu.title("What Can I Cook?")
+
+            pantry_frame = Frame(self.pantry_menu, bg="lightgrey")
+            pantry_frame.pack(fill="both", expand=True)
+
+            pantry_var = StringVar()
+            missing_var = StringVar(value="0")
+
+            tk.Label(pantry_frame, text="Ingredients I have (comma separated)", bg="lightgrey").grid(row=0, column=0, columnspan=2, sticky="w", padx=10, pady=(10, 0))
+            pantry_entry = tk.Entry(pantry_frame, textvariable=pantry_var, width=60)
+            pantry_entry.grid(row=1, column=0, columnspan=2, sticky="ew", padx=10)
+
+            tk.Label(pantry_frame, text="Missing at most", bg="lightgrey").grid(row=2, column=0, sticky="w", padx=10, pady=5)
+            tk.Spinbox(pantry_frame, from_=0, to=5, width=5, textvariable=missing_var, state="readonly").grid(row=2, column=1, sticky="w", pady=5)
+
+            results_container = Frame(pantry_frame, bg="lightgrey")
+            results_text = self.scrolled_text(results_container, height=15, width=60, side="left", fill="both", expand=True)
+            results_container.grid(row=4, column=0, columnspan=2, sticky="nsew", padx=10, pady=(0, 10))
+
+            ## find_recipes(event=None)
+            ##
+            ## Summary of the pantry match helper:
+            ##
+            ## Runs the pantry search and shows the results.
+            ##
+            ## Parameters : event - optional Tkinter event (never used)
+            ##
+            ## Return Value : none
+            ##
+            ## Description:
+            ##
+            ## Recipes with nothing missing are listed first, then those
+            ## missing one ingredient, and so on.
+
+            def find_recipes(event=None):
+                pantry = [item.strip() for item in pantry_var.get().split(",") if item.strip()]
+                lines = []
+                for recipe_object, missing in self.recipe_manager.what_can_i_cook(pantry, int(missing_var.get())):
+                    if missing:
+                        lines.append(f"{recipe_object.name}  (missing: {', '.join(missing)})")
+                    else:
+                        lines.append(recipe_object.name)
+                self.set_text(results_text, "\n".join(lines) if lines else "No recipes found.")
+
+            find_recipes = trace_callback(find_recipes, "menu_manager.pantry_search.find_recipes")
+            pantry_entry.bind("<Return>", find_recipes)
+            ttk.Button(pantry_frame, text="Find Recipes", command=find_recipes).grid(row=3, column=0, sticky="w", padx=10, pady=5)
+
+            self.pantry_menu.protocol("WM_DELETE_WINDOW", self.pantry_menu.withdraw)
+        else:
+            self.pantry_menu.deiconify()
+
     ## clear_display(self)
     ##
     ## Summary of the clear display function:
@@ -509,13 +881,124 @@ class menu_manager:
     ##
     ## Description:
     ##
-    ## Iterates a small set of frames used for recipe details and destroys
-    ## any existing widgets to avoid duplication when updating views.
+    ## Hides the detail widgets built by build_details and drops the
+    ## photo, so nothing is shown until a recipe is selected again.
 
     def clear_display(self):
-        for frame in [self.lower_frame, self.upper_frame, self.description_label_frame, self.description_frame, self.top_right_frame, self.tags_frame]:
-            for widget in frame.winfo_children():
-                widget.destroy()
+        self.image_loader.cancel()
+        for widget in [self.ingredients_container, self.ingredients_label, self.description_label, self.description_text, self.photo_label, self.tags_container]:
+            widget.pack_forget()
+        self.photo_label.config(image="", text="")
+        self.photo_label.photo = None
+
+    ## build_details(self)
+    ##
+    ## Summary of the detail widget builder:
+    ##
+    ## Creates the widgets of every recipe detail panel once.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The show functions fill these widgets in and pack them the first
+    ## time they are needed; clear_display unpacks them again. Nothing is
+    ## created or destroyed when the selection changes.
+
+    def build_details(self):
+        self.sorted_container = tk.Frame(self.below_browser_frame, bg="lightgrey")
+        self.sorted_container.pack_propagate(False)
+        self.sorted_container.pack(side="top", fill="both", expand=True)
+        search_row = tk.Frame(self.sorted_container, bg="lightgrey")
+        search_row.pack(side="top", fill="x")
+        tk.Label(search_row, text="Search:", bg="lightgrey").pack(side="left")
+        search_entry = tk.Entry(search_row, textvariable=self.search_var)
+        search_entry.pack(side="left", fill="x", expand=True)
+        search_entry.bind("<Return>", lambda event: self.run_search())
+        self.search_var.trace_add("write", self.schedule_search)
+        self.sorted_label = tk.Label(self.sorted_container, text="Sorted Recipes", bg="lightgrey")
+        self.sorted_label.pack(side="top", fill="x")
+        self.sorted_text = self.scrolled_text(self.sorted_container, side="left", fill="both", expand=True)
+
+        self.tags_container = Frame(self.tags_frame, bg="lightgrey")
+        self.tags_container.pack_propagate(False)
+        tk.Label(self.tags_container, text="Recipes Tags", bg="lightgrey").pack(side="top", fill="x", pady=10)
+        self.tags_text = self.scrolled_text(self.tags_container, side="left", expand=True, height=13, width=18)
+
+        self.ingredients_label = tk.Label(self.upper_frame, text="Ingredients list:", bg="lightgrey")
+        self.ingredients_container = tk.Frame(self.lower_frame, bg="lightgrey")
+        self.ingredients_text = self.scrolled_text(self.ingredients_container, side="left", fill="both", expand=True)
+
+        self.description_label = tk.Label(self.description_label_frame, text="Recipe Description:", bg="lightgrey")
+        self.description_text = tk.Label(self.description_frame, bg="lightgrey", wraplength=470, justify="left")
+
+        self.photo_label = tk.Label(self.top_right_frame, bg="lightgrey")
+        self.photo_label.photo = None
+
+    ## scrolled_text(self, container, height=None, width=None, **pack_options)
+    ##
+    ## Summary of the scrolled text builder:
+    ##
+    ## Adds a read-only Text widget with a scrollbar to a container.
+    ##
+    ## Parameters :
+    ##    container - frame to put them in
+    ##    height, width - optional Text size in lines and characters
+    ##    pack_options - how to pack the Text widget
+    ##
+    ## Return Value : the Text widget
+
+    def scrolled_text(self, container, height=None, width=None, **pack_options):
+        scroller = tk.Scrollbar(container)
+        scroller.pack(side="right", fill="y", expand=False)
+        text = tk.Text(container, wrap="word", yscrollcommand=scroller.set)
+        if height is not None:
+            text.config(height=height, width=width)
+        text.pack(**pack_options)
+        scroller.config(command=text.yview)
+        text.config(state="disabled", bg="lightgrey", highlightthickness=0, bd=0, cursor="arrow")
+        return text
+
+    ## set_text(self, text_widget, contents)
+    ##
+    ## Summary of the text replacement function:
+    ##
+    ## Replaces everything in a read-only Text widget.
+    ##
+    ## Parameters :
+    ##    text_widget - the Text widget to change
+    ##    contents - the new text
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Briefly enables editing, swaps the text and scrolls back to the top.
+
+    def set_text(self, text_widget, contents):
+        text_widget.config(state="normal")
+        text_widget.delete("1.0", "end")
+        text_widget.insert("1.0", contents)
+        text_widget.config(state="disabled")
+        text_widget.yview_moveto(0)
+
+    ## show_pane(self, widget, **pack_options)
+    ##
+    ## Summary of the pane display function:
+    ##
+    ## Packs a detail widget if it is not already showing.
+    ##
+    ## Parameters :
+    ##    widget - the widget to show
+    ##    pack_options - how to pack it
+    ##
+    ## Return Value : none
+
+    def show_pane(self, widget, **pack_options):
+        if not widget.winfo_manager():
+            widget.pack(**pack_options)
 
     ## delete_recipe(self)
     ##
@@ -530,27 +1013,24 @@ class menu_manager:
     ##
     ## Description:
     ##
-    ## Reads self.chosen_recipe, calls recipe_manager.delete_recipe,
-    ## saves changes and refreshes lists and displays.
+    ## Reads self.chosen_recipe, calls recipe_manager.delete_recipe
+    ## (which journals the change) and refreshes lists and displays.
 
     def delete_recipe(self):
         user_choice = self.chosen_recipe.get()
         if not user_choice:
             return
         self.recipe_manager.delete_recipe(user_choice)
-        self.recipe_manager.save_recipes()
-        self.box["values"] = [item.name for item in self.recipe_manager.recipe_list]
-        self.chosen_recipe.set("")
-        self.box.set("")
+        self.browser.remove(user_choice)
+        self.browser.clear_selection()
         self.clear_display()
-        self.toggle_tags()
         self.update_window()
 
     ## toggle_tags(self, event=None)
     ##
     ## Summary of the tag toggle builder:
     ##
-    ## Rebuilds the tag selection UI allowing users to toggle tag filters.
+    ## Builds the tag selection UI allowing users to toggle tag filters.
     ##
     ## Parameters : event - optional Tkinter event (Can be ignored because it is never used)
     ##
@@ -558,9 +1038,13 @@ class menu_manager:
     ##
     ## Description:
     ##
-    ## Clears the tag container, builds a scrollable listbox of tags and
-    ## attaches BooleanVars for tracking tag state changes which trigger
-    ## update_tag_list.
+    ## Clears the tag container, builds a scrollable listbox of the tags
+    ## in all_tags sorted by name_key and attaches a BooleanVar to each
+    ## for tracking tag state changes which trigger schedule_tag_update.
+    ## The new rows have no counts yet, so the next update_tag_list always
+    ## redraws. Called once when the window is built; after that rows are
+    ## changed one at a time by apply_tag_changes, which keeps the chosen
+    ## tags chosen.
 
     def toggle_tags(self, event=None):
         self.tag_state = {}
@@ -579,7 +1063,7 @@ class menu_manager:
             try:
                 tag_options_list.curselection()[0]
                 selection = tag_options_list.curselection()[0]
-                tag = tag_options_list.get(selection)
+                tag = self.tag_rows[selection]
                 state = not self.tag_state[tag].get()
                 self.tag_state[tag].set(state)
                 color = "lightgreen" if state else "white"
@@ -588,7 +1072,7 @@ class menu_manager:
                 return
 
 
-        toggle_tags_button = tk.Button(container, text="toggle tag", bg="lightgrey", command=toggle)
+        toggle_tags_button = tk.Button(container, text="toggle tag", bg="lightgrey", command=trace_callback(toggle, "menu_manager.toggle_tags.toggle"))
         toggle_tags_button.pack(side="bottom", fill="x", expand=False)
     
         scroller = tk.Scrollbar(container)
@@ -596,13 +1080,118 @@ class menu_manager:
         tag_options_list = tk.Listbox(container, yscrollcommand=scroller.set)
         tag_options_list.pack(fill="y", expand=True)
         scroller.config(command=tag_options_list.yview)
+        self.tag_options_list = tag_options_list
+        self.tag_rows = sorted(self.recipe_manager.all_tags, key=name_key)
+        self.tag_keys = [name_key(tag) for tag in self.tag_rows]
+        self.tag_labels = list(self.tag_rows)
+        self.tag_result = None
 
-        for index, tag in enumerate(self.recipe_manager.all_tags):
+        for index, tag in enumerate(self.tag_rows):
             tag_options_list.insert(index, tag)
             var = tk.BooleanVar(value=False)
-            var.trace_add("write", self.update_tag_list)
+            var.trace_add("write", self.schedule_tag_update)
             self.tag_state[tag] = var
 
+    ## apply_tag_changes(self, added, removed)
+    ##
+    ## Summary of the tag change listener:
+    ##
+    ## Updates the tag selector after tags came into or went out of use.
+    ##
+    ## Parameters :
+    ##    added - tags now used by a recipe
+    ##    removed - tags no recipe uses any more
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Registered with recipe_manager.add_tag_listener. Only the rows of
+    ## the changed tags are touched, so every other tag keeps its
+    ## BooleanVar, highlight colour and count. Removing a chosen tag
+    ## changes the filter, so the list is updated afterwards.
+
+    def apply_tag_changes(self, added, removed):
+        was_chosen = False
+        for tag in removed:
+            var = self.tag_state.get(tag)
+            was_chosen = was_chosen or (var is not None and var.get())
+            self.delete_tag_row(tag)
+        for tag in added:
+            self.insert_tag_row(tag)
+        if was_chosen:
+            self.schedule_tag_update()
+
+    ## insert_tag_row(self, tag)
+    ##
+    ## Summary of the tag row insert function:
+    ##
+    ## Adds a row for a tag at its sorted position.
+    ##
+    ## Parameters : tag - the new tag
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The row starts unchosen and without a count; the next
+    ## update_tag_list fills the count in.
+
+    def insert_tag_row(self, tag):
+        if tag in self.tag_state:
+            return
+        key = name_key(tag)
+        index = bisect_left(self.tag_keys, key)
+        self.tag_keys.insert(index, key)
+        self.tag_rows.insert(index, tag)
+        self.tag_labels.insert(index, tag)
+        self.tag_options_list.insert(index, tag)
+        var = tk.BooleanVar(value=False)
+        var.trace_add("write", self.schedule_tag_update)
+        self.tag_state[tag] = var
+
+    ## delete_tag_row(self, tag)
+    ##
+    ## Summary of the tag row delete function:
+    ##
+    ## Removes the row of a tag no recipe uses any more.
+    ##
+    ## Parameters : tag - the removed tag
+    ##
+    ## Return Value : none
+
+    def delete_tag_row(self, tag):
+        var = self.tag_state.pop(tag, None)
+        if var is None:
+            return
+        for trace in var.trace_info():
+            var.trace_remove(*trace)
+        index = bisect_left(self.tag_keys, name_key(tag))
+        del self.tag_keys[index]
+        del self.tag_rows[index]
+        del self.tag_labels[index]
+        self.tag_options_list.delete(index)
+
+    ## schedule_tag_update(self, *args)
+    ##
+    ## Summary of the tag update scheduling function:
+    ##
+    ## Asks for update_tag_list to run once Tk is idle.
+    ##
+    ## Parameters : *args - arguments from the BooleanVar traces
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Every tag BooleanVar calls this when it changes. Only the first
+    ## change of a burst schedules anything, so setting several tags in a
+    ## row recomputes and redraws the list once.
+
+    def schedule_tag_update(self, *args):
+        if self.tag_job is None:
+            self.tag_job = self.root.after_idle(self.update_tag_list)
+
     ## update_tag_list(self, *args)
     ##
     ## Summary of the tag filtering function:
@@ -610,19 +1199,63 @@ class menu_manager:
     ## Computes which recipes match the currently enabled tags and updates
     ## the sorted list display.
     ##
-    ## Parameters : *args - optional arguments from trace callbacks
+    ## Parameters : *args - optional arguments from callbacks
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
-    ## Builds a newline-separated string of matching recipe names and calls
-    ## show_tag_list to display it.
+    ## Runs the enabled tags through recipe_manager.tag_query, which
+    ## returns the same cached result as long as the tags and recipes have
+    ## not changed. Only a new result rebuilds the newline-separated string
+    ## of matching recipe names, the per-tag counts and the list from
+    ## show_tag_list. Photos of the first matches are then prefetched. A
+    ## pending scheduled update is cancelled since this one covers it.
 
     def update_tag_list(self, *args):
-        temp_tag_string = [tag for tag in self.tag_state if self.tag_state[tag].get()]
-        self.hold_true_tags = "\n".join([f"  {r.name}" for r in self.recipe_manager.recipe_list if all(tag in r.tags for tag in temp_tag_string)])
-        self.show_tag_list()
+        if self.tag_job is not None:
+            self.root.after_cancel(self.tag_job)
+            self.tag_job = None
+        temp_tag_string = [tag for tag in self.tag_rows if self.tag_state[tag].get()]
+        result = self.recipe_manager.tag_query(match_all=temp_tag_string)
+        if result is not self.tag_result:
+            self.tag_result = result
+            self.tag_matches, counts = result
+            self.hold_true_tags = "\n".join([f"  {r.name}" for r in self.tag_matches])
+            self.show_tag_counts(counts)
+            self.show_tag_list()
+        self.prefetch_photos()
+
+    ## show_tag_counts(self, counts)
+    ##
+    ## Summary of the tag count display function:
+    ##
+    ## Shows "(n)" next to each tag in the tag selector, where n is the
+    ## number of currently listed recipes that carry the tag.
+    ##
+    ## Parameters : counts - dictionary tag -> count from count_tags
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Only rewrites the rows whose label changed. A Listbox row cannot be
+    ## edited in place, so each changed row is deleted and re-inserted and
+    ## its highlight colour and selection are put back afterwards.
+
+    def show_tag_counts(self, counts):
+        selection = self.tag_options_list.curselection()
+        for index, tag in enumerate(self.tag_rows):
+            label = f"{tag} ({counts.get(tag, 0)})"
+            if label == self.tag_labels[index]:
+                continue
+            self.tag_labels[index] = label
+            self.tag_options_list.delete(index)
+            self.tag_options_list.insert(index, label)
+            if self.tag_state[tag].get():
+                self.tag_options_list.itemconfigure(index, bg="lightgreen")
+        for index in selection:
+            self.tag_options_list.selection_set(index)
 
     ## show_tag_list(self)
     ##
@@ -637,181 +1270,222 @@ class menu_manager:
     ##
     ## Description:
     ##
-    ## Clears the browser area, builds a container with a scrollable Text
-    ## widget and inserts self.hold_true_tags then disables editing.
+    ## Replaces the contents of the sorted recipes Text widget built by
+    ## build_details with self.hold_true_tags, or with the full text
+    ## search results while the search box has something in it.
 
     def show_tag_list(self):
-        for widget in self.below_browser_frame.winfo_children():
-            widget.destroy()
-        
-        container = tk.Frame(self.below_browser_frame, bg="lightgrey")
-        container.pack(side="top", fill="both", expand=True)
-        container.pack_propagate(False)
+        if self.search_var.get().strip():
+            self.sorted_label.config(text="Search Results")
+            self.set_text(self.sorted_text, self.hold_search_results)
+        else:
+            self.sorted_label.config(text="Sorted Recipes")
+            self.set_text(self.sorted_text, self.hold_true_tags)
 
-        sorting_label = tk.Label(container, text="Sorted Recipes", bg="lightgrey")
-        sorting_label.pack(side="top", fill="x")
-        scrolltool = tk.Scrollbar(container)
-        scrolltool.pack(side="right", fill="y")
+    ## schedule_search(self, *args)
+    ##
+    ## Summary of the search scheduling function:
+    ##
+    ## Runs the full text search shortly after the user stops typing.
+    ##
+    ## Parameters : *args - arguments from the StringVar trace
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Each key press restarts a SEARCH_DELAY_MS timer so a search is not
+    ## run for every letter of a word.
 
-        show_selection = tk.Text(container, wrap="word", yscrollcommand=scrolltool.set)
-        show_selection.pack(side="left", fill="both", expand=True)
-        scrolltool.config(command=show_selection.yview)
+    def schedule_search(self, *args):
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.run_search)
 
-        show_selection.insert("1.0", self.hold_true_tags)
-        show_selection.config(state="disabled", bg="lightgrey", highlightthickness=0, bd=0, cursor="arrow")
+    ## run_search(self)
+    ##
+    ## Summary of the search function:
+    ##
+    ## Searches recipe names, ingredients and descriptions for the text in
+    ## the search box and shows the best matches.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Uses recipe_manager.search_recipes, which ranks the results with
+    ## BM25. An empty search box goes back to the tag filter list.
+
+    def run_search(self):
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        query = self.search_var.get().strip()
+        if query:
+            results = self.recipe_manager.search_recipes(query)
+            self.hold_search_results = "\n".join(f"  {entry.name}" for entry, score in results) or "  No matching recipes"
+        self.show_tag_list()
 
-    ## show_tags(self, event=None)
+    ## show_tags(self, recipe_object)
     ##
     ## Summary of the tags display function:
     ##
     ## Shows the tag list for the selected recipe in the tags panel.
     ##
-    ## Parameters : event - optional Tkinter event (Can be ignored because it is never used)
+    ## Parameters : recipe_object - the selected Recipe, or None
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
-    ## If a recipe is selected, builds a scrollable Text widget listing the
-    ## recipe's tags and disables editing for presentation.
+    ## If a recipe is selected, fills the read-only tags Text widget with
+    ## the recipe's tags; otherwise the tags panel is hidden.
 
-    def show_tags(self, event=None):
-        user_choice = self.chosen_recipe.get()
-        if not user_choice:
+    def show_tags(self, recipe_object):
+        if not self.chosen_recipe.get():
             return
-        for widget in self.tags_frame.winfo_children():
-            widget.destroy()
-
-        for item in self.recipe_manager.recipe_list:
-            if item.name == user_choice:
-                container = Frame(self.tags_frame, bg="lightgrey")
-                container.pack(fill="both", expand=True)
-                container.pack_propagate(False)
-
-                tk.Label(container, text="Recipes Tags", bg="lightgrey").pack(side="top", fill="x", pady=10)
-                scroller = tk.Scrollbar(container)
-                scroller.pack(side="right", fill="y", expand=False)
-                tags_text = tk.Text(container, wrap="word", yscrollcommand=scroller.set, height=13, width=18)
-                tags_text.pack(side="left", expand=True)
-                scroller.config(command=tags_text.yview)
 
-                tags_text.insert("1.0", "\n".join(f"  {tag}" for tag in item.tags))
-                tags_text.config(state="disabled", bg="lightgrey", highlightthickness=0, bd=0, cursor="arrow")
+        if recipe_object is not None:
+            self.show_pane(self.tags_container, fill="both", expand=True)
+            self.set_text(self.tags_text, "\n".join(f"  {tag}" for tag in recipe_object.tags))
+        else:
+            self.tags_container.pack_forget()
 
-    ## show_recipe(self, event=None)
+    ## show_recipe(self, recipe_object)
     ##
     ## Summary of the ingredient display function:
     ##
     ## Displays the ingredients and amounts for the selected recipe in a
     ## scrollable, read-only Text widget.
     ##
-    ## Parameters : event - optional Tkinter event (Can be ignored because it is never used)
+    ## Parameters : recipe_object - the selected Recipe, or None
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
-    ## Clears the upper and lower frames and inserts the formatted
-    ## ingredient list for the currently selected recipe.
-
-    def show_recipe(self, event=None):
-        user_choice = self.chosen_recipe.get()
-
-        for widget in self.lower_frame.winfo_children():
-            widget.destroy()
-        for widget in self.upper_frame.winfo_children():
-            widget.destroy()
-
-        ingredients_label = tk.Label(self.upper_frame, text="Ingredients list:", bg="lightgrey")
-        ingredients_label.pack(side="bottom", fill="x", expand=False, pady=10)
+    ## Shows the ingredients heading and replaces the contents of the
+    ## ingredients Text widget with the formatted ingredient list for the
+    ## currently selected recipe.
 
-        for item in self.recipe_list:
-            if item.name == user_choice:
-                ingredients_list = item.ingredients
-                ingredients_text = ""
-                for item in ingredients_list:
-                    ingredient, amount = item
-                    ingredients_text += f"  {ingredient}:\t\t\t\t{amount}\n"
+    def show_recipe(self, recipe_object):
+        self.show_pane(self.ingredients_label, side="bottom", fill="x", expand=False, pady=10)
 
-                container = tk.Frame(self.lower_frame, bg="lightgrey")
-                container.pack(fill="both", expand=True)
+        if recipe_object is not None:
+            ingredients_text = ""
+            for item in recipe_object.ingredients:
+                ingredient, amount = item
+                ingredients_text += f"  {ingredient}:\t\t\t\t{amount}\n"
 
-                scroll = tk.Scrollbar(container)
-                scroll.pack(side="right", fill="y")
-                ing_text = tk.Text(container, wrap="word", yscrollcommand=scroll.set)
-                ing_text.pack(side="left", fill="both", expand=True)
-                scroll.config(command=ing_text.yview)
-
-                ing_text.insert("1.0", ingredients_text)
-                ing_text.config(state="disabled", bg="lightgrey", highlightthickness=0, bd=0, cursor="arrow")
+            self.show_pane(self.ingredients_container, fill="both", expand=True)
+            self.set_text(self.ingredients_text, ingredients_text)
+        else:
+            self.ingredients_container.pack_forget()
 
-    ## show_description(self)
+    ## show_description(self, recipe_object)
     ##
     ## Summary of the description display function:
     ##
     ## Shows the recipe description text for the selected recipe.
     ##
-    ## Parameters : none
+    ## Parameters : recipe_object - the selected Recipe, or None
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
-    ## Clears description frames and creates a wrapped Label with the
-    ## recipe's description for display.
-
-    def show_description(self):
-        user_choice = self.chosen_recipe.get()
-
-        for frame in [self.description_label_frame, self.description_frame]:
-            for widget in frame.winfo_children():
-                widget.destroy()
+    ## Shows the description heading and sets the wrapped description
+    ## Label to the recipe's description.
 
-        rec_desc_label = tk.Label(self.description_label_frame, text="Recipe Description:", bg="lightgrey")
-        rec_desc_label.pack(side="top", fill="x", pady=10)
+    def show_description(self, recipe_object):
+        self.show_pane(self.description_label, side="top", fill="x", pady=10)
 
-        for item in self.recipe_manager.recipe_list:
-            if item.name == user_choice:
-                rec_desc_text = tk.Label(self.description_frame, text=item.description, bg="lightgrey", wraplength=470, justify="left")
-                rec_desc_text.pack(anchor="nw", fill="y", padx=20)
+        if recipe_object is not None:
+            self.description_text.config(text=recipe_object.description)
+            self.show_pane(self.description_text, anchor="nw", fill="y", padx=20)
+        else:
+            self.description_text.pack_forget()
 
-    ## show_photo(self)
+    ## show_photo(self, recipe_object)
     ##
     ## Summary of the photo display function:
     ##
     ## Loads and shows the image for the selected recipe using PIL.
     ##
-    ## Parameters : none
+    ## Parameters : recipe_object - the selected Recipe, or None
     ##
     ## Return Value : none
     ##
     ## Description:
     ##
-    ## Attempts to open photo_name (adds .png if missing), resizes the
-    ## image while preserving aspect ratio to fit the UI and attaches the
-    ## PhotoImage object to the label to prevent garbage collection.
+    ## Shows a placeholder and asks image_loader for photo_name (adds .png
+    ## if missing) resized to fit the UI while preserving aspect ratio.
+    ## Decoding happens on a worker thread and place_photo swaps the
+    ## finished photo in; a photo already in memory is placed at once.
+
+    def show_photo(self, recipe_object):
+        if recipe_object is not None:
+            if ".png" not in recipe_object.photo_name:
+                recipe_object.photo_name += ".png"
+            self.photo_label.config(image="", text="Loading photo...")
+            self.photo_label.photo = None
+            self.show_pane(self.photo_label, anchor="n", fill="both", expand=True)
+            self.image_loader.request(recipe_object.photo_name, PHOTO_BOX, self.place_photo)
+        else:
+            self.image_loader.cancel()
+            self.photo_label.pack_forget()
 
-    def show_photo(self):
-        user_choice = self.chosen_recipe.get()
+    ## place_photo(self, resized_image)
+    ##
+    ## Summary of the photo placement function:
+    ##
+    ## Replaces the loading placeholder with the finished photo.
+    ##
+    ## Parameters : resized_image - PIL image from image_loader, or None
+    ##              if the photo could not be read
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Called by image_loader on the Tk thread, only for the most recent
+    ## request. Swaps the image on the persistent photo label and keeps a
+    ## reference to the PhotoImage object to prevent garbage collection.
+    ## ImageTk is imported here rather than at start up, since PIL takes a
+    ## while to import and is not needed until the first photo is shown.
 
-        for widget in self.top_right_frame.winfo_children():
-            widget.destroy()
+    def place_photo(self, resized_image):
+        if resized_image is None:
+            self.photo_label.config(image="", text="A photo with that name could not be found")
+            self.photo_label.photo = None
+            return
+        from PIL import ImageTk
 
-        for item in self.recipe_manager.recipe_list:
-            if item.name == user_choice:
-                if ".png" not in item.photo_name:
-                    item.photo_name += ".png"
-                try:
-                    image = Image.open(item.photo_name)
-                except (FileNotFoundError, OSError):
-                    no_photo = tk.Label(self.top_right_frame, text="A photo with that name could not be found", bg="lightgrey")
-                    no_photo.pack(anchor="n", fill="both", expand=True)
-                    return
-                self.top_right_frame.update_idletasks()
-                width, height = image.size
-                scale = min((TOTAL_WINDOW_WIDTH//2)/width, (TOTAL_WINDOW_HEIGHT//2)/height)
-                resized_image = image.resize((int(width*scale), int(height*scale)))
-                photo = ImageTk.PhotoImage(resized_image)
-                lbl = tk.Label(self.top_right_frame, image=photo, bg="lightgrey")
-                lbl.photo = photo
-                lbl.pack(anchor="n", fill="both", expand=True)
\ No newline at end of file
+        photo = ImageTk.PhotoImage(resized_image)
+        self.photo_label.config(image=photo, text="")
+        self.photo_label.photo = photo
+
+    ## prefetch_photos(self)
+    ##
+    ## Summary of the photo prefetch function:
+    ##
+    ## Starts loading the photos the user is likely to look at next.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Queues the recipes either side of the current one in the recipe
+    ## browser, nearest first, then the first few recipes of the current
+    ## tag filter result.
+
+    def prefetch_photos(self):
+        names = self.browser.neighbours(self.chosen_recipe.get(), PREFETCH_NEIGHBOURS)
+        wanted = [self.recipe_manager.get_recipe(name) for name in names]
+        wanted.extend(self.tag_matches[:PREFETCH_RESULTS])
+        paths = [photo_file(entry.photo_name) for entry in wanted if entry is not None]
+        self.image_loader.prefetch(paths, PHOTO_BOX)
\ No newline at end of file
@@ -0,0 +1,385 @@
+##-----------------------------------------------------------------------
+## File : recipe_watcher.py
+##
+## Description: Notices when another program (a sync job, a text editor)
+##              changes recipes.txt while the window is open and brings
+##              the recipe_manager up to date without loading everything
+##              again. A background thread checks the file's size and
+##              mtime, reads a changed file and works out which records
+##              were added, removed or changed since it last read it. The
+##              Tk thread then applies just those changes in one batch.
+##-----------------------------------------------------------------------
+
+import hashlib
+import os
+import queue
+import threading
+
+from recipe_parser import ENCODING, format_recipe, iter_recipes
+
+CHECK_SECONDS = 1.0
+DELIVER_MS = 250
+DIGEST_BYTES = 16
+
+
+## file_stamp(filename)
+##
+## Summary of the stamp helper:
+##
+## Returns the size and mtime of a file.
+##
+## Parameters : filename - path to the file
+##
+## Return Value : tuple (size, mtime_ns), or None if the file is missing
+##
+## Description:
+##
+## The same pair recipe_snapshot.source_stamp returns and text_storage
+## keeps in written, so the two can be compared.
+
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+## record_digest(recipe_object)
+##
+## Summary of the content hash function:
+##
+## Returns a hash of everything in a recipe.
+##
+## Parameters : recipe_object - the recipe to hash
+##
+## Return Value : bytes
+##
+## Description:
+##
+## The recipe is hashed as format_recipe writes it, so a recipe in memory
+## and a record read from the file have the same digest whenever they
+## have the same fields, however the file spaced them out.
+
+def record_digest(recipe_object):
+    return hashlib.blake2b(format_recipe(recipe_object).encode(ENCODING), digest_size=DIGEST_BYTES).digest()
+
+
+## scan_file(filename, baseline=None)
+##
+## Summary of the file scan function:
+##
+## Hashes every record of a recipes file.
+##
+## Parameters :
+##    filename - path to the recipes file
+##    baseline - digests from an earlier scan, or None
+##
+## Return Value : tuple (digests, candidates)
+##
+## Description:
+##
+## digests maps each record digest to [name, number of records with
+## it]. candidates maps a digest to the parsed recipes the file has more
+## copies of than baseline does; only those recipes are kept, since the
+## rest are already in memory. With no baseline nothing is kept.
+## Raises OSError or RecipeParseError like iter_recipes.
+
+def scan_file(filename, baseline=None):
+    digests = {}
+    candidates = {}
+    for recipe_object in iter_recipes(filename):
+        digest = record_digest(recipe_object)
+        entry = digests.get(digest)
+        if entry is None:
+            entry = digests[digest] = [recipe_object.name, 0]
+        entry[1] += 1
+        if baseline is not None and entry[1] > baseline.get(digest, (None, 0))[1]:
+            candidates.setdefault(digest, []).append(recipe_object)
+    return digests, candidates
+
+
+## diff_records(baseline, digests, candidates)
+##
+## Summary of the record diff function:
+##
+## Works out how a recipes file changed between two scans.
+##
+## Parameters :
+##    baseline - digests from the earlier scan
+##    digests - digests from the later scan
+##    candidates - recipes the later scan has more copies of
+##
+## Return Value : list of (op, name, old digest, new Recipe)
+##
+## Description:
+##
+## A record that disappeared and a new record with the same name make an
+## "update"; any other new record is an "add" (with no old digest) and
+## any other record that disappeared is a "delete" (with no new Recipe).
+## Updates and adds are in the order they appear in the file.
+
+def diff_records(baseline, digests, candidates):
+    removed = {}
+    for digest, (name, count) in baseline.items():
+        for copy in range(count - digests.get(digest, (name, 0))[1]):
+            removed.setdefault(name, []).append(digest)
+    changes = []
+    for recipes in candidates.values():
+        for recipe_object in recipes:
+            old_digests = removed.get(recipe_object.name)
+            if old_digests:
+                changes.append(("update", recipe_object.name, old_digests.pop(), recipe_object))
+            else:
+                changes.append(("add", recipe_object.name, None, recipe_object))
+    for name, old_digests in removed.items():
+        for digest in old_digests:
+            changes.append(("delete", name, digest, None))
+    return changes
+
+
+## apply_changes(manager, filename, stamp, changes)
+##
+## Summary of the change apply function:
+##
+## Makes the changes found by diff_records to a recipe_manager.
+##
+## Parameters :
+##    manager - the recipe_manager to change
+##    filename - path to the recipes file the changes came from
+##    stamp - (size, mtime_ns) of the file when it was read
+##    changes - list from diff_records
+##
+## Return Value : tuple (names added, names removed, names updated)
+##
+## Description:
+##
+## Runs inside manager.batch, so the indexes and tag listeners hear about
+## the whole set at once, and through the storage backend's
+## external_change, so the changes are not stored again. An update or
+## delete only applies while the first recipe with that name still
+## matches what the file used to hold (the same rule journal replay uses
+## to find a recipe by name); a recipe that has been edited or deleted
+## here since keeps our version, which is written back with the next
+## save.
+
+def apply_changes(manager, filename, stamp, changes):
+    added = []
+    removed = []
+    updated = []
+
+    def apply():
+        with manager.batch():
+            for op, name, old_digest, new_recipe in changes:
+                if op == "add":
+                    manager.add_recipe(new_recipe)
+                    added.append(name)
+                    continue
+                recipe_object = manager.get_recipe(name)
+                if recipe_object is None or record_digest(recipe_object) != old_digest:
+                    continue
+                if op == "delete":
+                    manager.delete_recipe(name)
+                    removed.append(name)
+                else:
+                    manager.update_recipe(recipe_object, new_recipe.name, new_recipe.photo_name, new_recipe.tags, new_recipe.ingredients, new_recipe.description)
+                    updated.append(name)
+
+    manager.storage.external_change(manager, filename, stamp, apply)
+    return added, removed, updated
+
+
+## class recipe_watcher
+##
+## Description:
+##
+##   Polls a recipes file from a daemon thread and hands the changes it
+##   finds to a callback on the Tk thread. The thread only reads the file
+##   and its own state; everything that touches the manager or widgets
+##   happens in deliver, which root.after runs. A file is only read once
+##   its size and mtime have stayed the same for a whole check interval,
+##   so a file still being written is left alone, and a file that changes
+##   while it is read is read again at the next check. A missing or
+##   malformed file is ignored until it changes again. Sync jobs should
+##   still write a new file and rename it over the old one, as
+##   text_storage.save does: lazily loaded bodies are read from the old
+##   file, which stays readable after a rename but not after being
+##   written over in place.
+##
+## Data members:
+##
+##   root : Tk window whose after() drives deliver.
+##   filename : The recipes file being watched.
+##   callback : Function called with (stamp, changes) on the Tk thread.
+##   written : Mapping filename -> stamp of our own saves (the
+##             text_storage's written), whose changes are ours already.
+##   interval : Seconds between checks.
+##   stamp : (size, mtime_ns) of the file baseline was read from.
+##   pending : Stamp seen at the last check that has not been read yet.
+##   baseline : Digests of every record at stamp, from scan_file.
+##   results : Queue of (stamp, changes) for deliver.
+##   stopping : Event that ends the thread and the polling.
+##   thread : The checking thread, or None before start.
+##   job : The scheduled deliver call, or None.
+##
+## Methods:
+##
+##   __init__ - set up a watcher without starting it.
+##   start - read the file once and begin checking it.
+##   stop - stop checking.
+##   run - thread body.
+##   check - look at the file once and queue any changes.
+##   deliver - pass queued changes to the callback on the Tk thread.
+
+class recipe_watcher:
+
+    ## __init__(self, root, filename, callback, written=None, interval=CHECK_SECONDS)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Sets up a watcher for one recipes file.
+    ##
+    ## Parameters : see the data members
+    ##
+    ## Return Value : none
+
+    def __init__(self, root, filename, callback, written=None, interval=CHECK_SECONDS):
+        self.root = root
+        self.filename = filename
+        self.callback = callback
+        self.written = written if written is not None else {}
+        self.interval = interval
+        self.stamp = None
+        self.pending = None
+        self.baseline = None
+        self.results = queue.Queue()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.job = None
+
+    ## start(self)
+    ##
+    ## Summary of the start function:
+    ##
+    ## Starts the checking thread and the polling on the Tk thread.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Call once the file has been loaded; the first check reads it as it
+    ## is then, and later changes are measured against that.
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="recipe_watcher", daemon=True)
+        self.thread.start()
+        self.job = self.root.after(DELIVER_MS, self.deliver)
+
+    ## stop(self)
+    ##
+    ## Summary of the stop function:
+    ##
+    ## Stops checking the file without waiting for a read in progress.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Changes found after this are never delivered.
+
+    def stop(self):
+        self.stopping.set()
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+    ## run(self)
+    ##
+    ## Summary of the thread body:
+    ##
+    ## Checks the file every interval until stopped.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def run(self):
+        self.check()
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+    ## check(self)
+    ##
+    ## Summary of the check function:
+    ##
+    ## Reads the file if it has changed and settled, and queues what
+    ## changed.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Runs on the watcher thread. The first read only records the
+    ## baseline. After that a new stamp is noted and the file read at the
+    ## next check if the stamp is still the same. The new digests become
+    ## the baseline either way, but nothing is queued for our own saves.
+
+    def check(self):
+        stamp = file_stamp(self.filename)
+        if stamp is None or stamp == self.stamp:
+            self.pending = None
+            return
+        if self.baseline is not None and stamp != self.pending:
+            self.pending = stamp
+            return
+        self.pending = None
+        try:
+            digests, candidates = scan_file(self.filename, self.baseline)
+        except (OSError, ValueError):
+            self.stamp = stamp
+            return
+        if file_stamp(self.filename) != stamp:
+            return
+        baseline = self.baseline
+        self.stamp = stamp
+        self.baseline = digests
+        if baseline is None or self.written.get(self.filename) == stamp:
+            return
+        changes = diff_records(baseline, digests, candidates)
+        if changes:
+            self.results.put((stamp, changes))
+
+    ## deliver(self)
+    ##
+    ## Summary of the delivery function:
+    ##
+    ## Passes the changes the thread found to the callback.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Runs on the Tk thread every DELIVER_MS until stop is called. A save
+    ## of ours can finish after the thread has read the file it wrote;
+    ## written is checked again here, where saves happen, so those
+    ## changes are dropped.
+
+    def deliver(self):
+        self.job = None
+        while True:
+            try:
+                stamp, changes = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.written.get(self.filename) != stamp:
+                self.callback(stamp, changes)
+        if not self.stopping.is_set():
+            self.job = self.root.after(DELIVER_MS, self.deliver)
@@ -0,0 +1,499 @@
+##-----------------------------------------------------------------------
+## File : record_index.py
+##
+## Description: Reads recipes.txt through a memory map instead of
+##              Python file reads. The start and length of every record
+##              are found with a few byte searches over the map and kept
+##              in a sidecar file (recipes.txt.idx), so the next start
+##              of an unchanged file does not have to look again. Records are
+##              then sliced out of the map with memoryview and only the
+##              blocks that are needed get decoded.
+##-----------------------------------------------------------------------
+
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+
+from recipe_parser import BLOCKS_PER_RECIPE, ENCODING, parse_record, read_records, split_record
+
+INDEX_MAGIC = b"RCPIDX01"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+CHECK_BYTES = 4096
+SEPARATOR = b"\n\n"
+HEADER_BLOCKS = 3
+
+## Header layout: magic, version, source size, source mtime (ns), bytes
+## scanned, records scanned, record count, check sum of the scanned bytes.
+HEADER = struct.Struct("<8sHQqQIII")
+CONTENT_PATTERN = re.compile(rb"[^ \t\n\r\x0b\x0c\x1c-\x1f]")
+
+
+## index_path(filename)
+##
+## Summary of the path helper:
+##
+## Returns where the record index for a recipes file is stored.
+##
+## Parameters : filename - path to the recipes text file
+##
+## Return Value : path of the index file
+
+def index_path(filename):
+    return filename + INDEX_SUFFIX
+
+
+## has_text(data, start, end)
+##
+## Summary of the blank check:
+##
+## Tells whether a stretch of the file has anything besides whitespace.
+##
+## Parameters :
+##    data - the mapped file
+##    start, end - byte range to look at
+##
+## Return Value : True if str.strip would leave something
+##
+## Description:
+##
+## A regular expression finds the first byte that is not ASCII
+## whitespace without copying the range. Only when that byte starts a
+## multi-byte character is the rest decoded, since a few Unicode
+## characters are whitespace too.
+
+def has_text(data, start, end):
+    match = CONTENT_PATTERN.search(data, start, end)
+    if match is None:
+        return False
+    if data[match.start()] < 0x80:
+        return True
+    return bool(str(data[match.start():end], ENCODING).strip())
+
+
+## little_endian(values)
+##
+## Summary of the byte order helper:
+##
+## Converts an array of offsets to or from the index file's byte order.
+##
+## Parameters : values - array("Q")
+##
+## Return Value : values, or a byte swapped copy on big-endian machines
+
+def little_endian(values):
+    if sys.byteorder == "little":
+        return values
+    values = array("Q", values)
+    values.byteswap()
+    return values
+
+
+## read_index(path)
+##
+## Summary of the index reader:
+##
+## Reads a record index file.
+##
+## Parameters : path - the .idx file
+##
+## Return Value : (stamp, scanned_to, scanned_count, check, offsets,
+##                lengths), or None if the file is missing or not a
+##                valid index
+
+def read_index(path):
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, size, mtime_ns, scanned_to, scanned_count, record_count, check = HEADER.unpack_from(data, 0)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION or len(data) != HEADER.size + 16 * record_count or scanned_count > record_count:
+        return None
+    offsets = array("Q")
+    lengths = array("Q")
+    offsets.frombytes(data[HEADER.size:HEADER.size + 8 * record_count])
+    lengths.frombytes(data[HEADER.size + 8 * record_count:])
+    return (size, mtime_ns), scanned_to, scanned_count, check, little_endian(offsets), little_endian(lengths)
+
+
+## class record_index
+##
+## Description:
+##
+##   A recipes file mapped into memory together with the offset and
+##   length of each of its records, the same ones iter_records reports.
+##
+## Data members:
+##
+##   filename : Path of the recipes file.
+##   file : Open binary handle on the file.
+##   mapping : Read-only mmap of the file (b"" for an empty file).
+##   stamp : (size, mtime_ns) of the file when it was mapped.
+##   offsets : array of record start offsets, in file order.
+##   lengths : array of record lengths in bytes.
+##   scanned_to : Byte offset up to which records are final; what
+##                follows was handed to the line based reader.
+##   scanned_count : Number of records before scanned_to.
+##   error : RecipeParseError (or UnicodeDecodeError) for a broken record
+##           after the last good one, or None.
+##
+## Methods:
+##
+##   __init__ - open and map a file.
+##   build - load the offsets from the sidecar and/or scan for them.
+##   check_sum - check sum of the scanned bytes for the sidecar.
+##   skip_blank_lines - step over blank lines at the start of the file.
+##   scan - find the records from a position to the end of the file.
+##   scan_lines - hand the end of the file to the line based reader.
+##   write - save the offsets to the sidecar.
+##   text - decode a byte range.
+##   blocks - the five blocks of one record.
+##   headers - only the name, photo and tags blocks of one record.
+##   recipes - every record as a Recipe.
+##   close - unmap and close the file.
+
+class record_index:
+
+    ## __init__(self, filename)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Opens and maps a recipes file. No records are found until build is
+    ## called.
+    ##
+    ## Parameters : filename - path to the recipes file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Raises FileNotFoundError if the file does not exist. The stamp is
+    ## the same (size, mtime_ns) pair recipe_snapshot.source_stamp gives,
+    ## taken from the open handle so it matches what was mapped.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        try:
+            stat = os.fstat(self.file.fileno())
+            self.stamp = (stat.st_size, stat.st_mtime_ns)
+            self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        except BaseException:
+            self.file.close()
+            raise
+        self.offsets = array("Q")
+        self.lengths = array("Q")
+        self.scanned_to = 0
+        self.scanned_count = 0
+        self.error = None
+
+    ## build(self, use_sidecar=True)
+    ##
+    ## Summary of the build function:
+    ##
+    ## Fills offsets and lengths.
+    ##
+    ## Parameters : use_sidecar - whether to read and write the .idx file
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## A sidecar is only used when it was written for this exact file: its
+    ## stamp must match the file's size and mtime (the same test the
+    ## snapshot and journal use) and the check sum of the bytes it scanned
+    ## must still match. Any other sidecar could hold offsets from before
+    ## an edit anywhere in the file, so the whole file is scanned. The
+    ## sidecar is rewritten after any scan that found no broken record;
+    ## failing to write it is not an error.
+
+    def build(self, use_sidecar=True):
+        saved = read_index(index_path(self.filename)) if use_sidecar else None
+        if saved is not None:
+            stamp, scanned_to, scanned_count, check, offsets, lengths = saved
+            if stamp == self.stamp and scanned_to <= self.stamp[0] and self.check_sum(scanned_to) == check:
+                self.offsets, self.lengths = offsets, lengths
+                self.scanned_to, self.scanned_count = scanned_to, scanned_count
+                return
+        self.scan(0, 0)
+        if use_sidecar and self.error is None:
+            try:
+                self.write(index_path(self.filename))
+            except OSError:
+                pass
+
+    ## check_sum(self, end)
+    ##
+    ## Summary of the check sum function:
+    ##
+    ## Sums the first and last CHECK_BYTES bytes before end.
+    ##
+    ## Parameters : end - byte offset the sidecar scanned to
+    ##
+    ## Return Value : CRC-32 as an int
+    ##
+    ## Description:
+    ##
+    ## Only the two ends are summed so the check costs the same however
+    ## big the file is. It backs up the stamp check in build, for a file
+    ## copied in with its old size and mtime; an edit between the two
+    ## ends that also keeps the size and mtime is not noticed.
+
+    def check_sum(self, end):
+        view = memoryview(self.mapping)
+        head = zlib.crc32(view[:min(end, CHECK_BYTES)])
+        return zlib.crc32(view[max(0, end - CHECK_BYTES):end], head)
+
+    ## skip_blank_lines(self, position)
+    ##
+    ## Summary of the leading blank line skipper:
+    ##
+    ## Steps over whitespace-only lines.
+    ##
+    ## Parameters : position - start of a line
+    ##
+    ## Return Value : start of the first line with text, or the file size
+
+    def skip_blank_lines(self, position):
+        data = self.mapping
+        size = len(data)
+        while position < size:
+            end = data.find(b"\n", position)
+            if end == -1:
+                end = size
+            if has_text(data, position, end):
+                return position
+            position = end + 1
+        return size
+
+    ## scan(self, position, record_number)
+    ##
+    ## Summary of the scanner:
+    ##
+    ## Finds every record from a position to the end of the file.
+    ##
+    ## Parameters :
+    ##    position - start of the first record to look for
+    ##    record_number - number of records before position
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## A block runs from its start to the next "\n\n", so five searches
+    ## find a record. A record with a blank description only counts once
+    ## text follows it, so it is held back until the next record with a
+    ## description. The scan stops at a record that is not finished by a
+    ## blank line or that has "\r" in it, and everything from there (or
+    ## from the first record held back) goes to scan_lines, which is the
+    ## iter_records parser itself and handles end of file the same way.
+
+    def scan(self, position, record_number):
+        data = self.mapping
+        if record_number == 0:
+            position = self.skip_blank_lines(position)
+        pending = []
+        while True:
+            start = position
+            block_start = position
+            for block in range(BLOCKS_PER_RECIPE):
+                block_end = data.find(SEPARATOR, block_start)
+                if block_end == -1:
+                    break
+                description_start = block_start
+                block_start = block_end + len(SEPARATOR)
+            if block_end == -1 or data.find(b"\r", start, block_end) != -1:
+                break
+            if has_text(data, description_start, block_end):
+                for record_start, length in pending:
+                    self.offsets.append(record_start)
+                    self.lengths.append(length)
+                pending = []
+                self.offsets.append(start)
+                self.lengths.append(block_end - start)
+                self.scanned_to = block_start
+                self.scanned_count = len(self.offsets)
+            else:
+                pending.append((start, block_end - start))
+            position = block_start
+        self.scan_lines(pending[0][0] if pending else start)
+
+    ## scan_lines(self, position)
+    ##
+    ## Summary of the fallback scanner:
+    ##
+    ## Finds the records from a position to the end of the file with the
+    ## line based reader.
+    ##
+    ## Parameters : position - start of the first record not yet found
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Records found here are not counted in scanned_to, since the text
+    ## after a bad block is not in the fixed layout. A broken record is
+    ## kept in error rather than raised, so the records before it can
+    ## still be used.
+
+    def scan_lines(self, position):
+        if position >= len(self.mapping):
+            return
+        self.mapping.seek(position)
+        try:
+            for record_number, offset, length, blocks in read_records(iter(self.mapping.readline, b""), position, len(self.offsets)):
+                self.offsets.append(offset)
+                self.lengths.append(length)
+        except ValueError as error:
+            self.error = error
+
+    ## write(self, path)
+    ##
+    ## Summary of the sidecar writer:
+    ##
+    ## Saves the offsets and lengths to an index file.
+    ##
+    ## Parameters : path - the .idx file to write
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Written to a temporary name and renamed, like the snapshot.
+
+    def write(self, path):
+        header = HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.stamp[0], self.stamp[1], self.scanned_to, self.scanned_count, len(self.offsets), self.check_sum(self.scanned_to))
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(header)
+            file.write(little_endian(self.offsets).tobytes())
+            file.write(little_endian(self.lengths).tobytes())
+        os.replace(temp_path, path)
+
+    ## text(self, start, end)
+    ##
+    ## Summary of the decode helper:
+    ##
+    ## Decodes a byte range of the file straight out of the map.
+    ##
+    ## Parameters : start, end - byte range
+    ##
+    ## Return Value : str
+
+    def text(self, start, end):
+        return str(memoryview(self.mapping)[start:end], ENCODING)
+
+    ## blocks(self, offset, length)
+    ##
+    ## Summary of the record reader:
+    ##
+    ## Returns the five blocks of the record at a given span.
+    ##
+    ## Parameters :
+    ##    offset - start of the record
+    ##    length - its length in bytes
+    ##
+    ## Return Value : list of five block strings, as iter_records gives
+
+    def blocks(self, offset, length):
+        return split_record(memoryview(self.mapping)[offset:offset + length])
+
+    ## headers(self, offset, length)
+    ##
+    ## Summary of the header reader:
+    ##
+    ## Returns the name, photo and tags blocks of one record.
+    ##
+    ## Parameters :
+    ##    offset - start of the record
+    ##    length - its length in bytes
+    ##
+    ## Return Value : list [name, photo_name, tags_line]
+    ##
+    ## Description:
+    ##
+    ## Ingredients and description are never decoded. Records with "\r"
+    ## in them go through blocks instead.
+
+    def headers(self, offset, length):
+        data = self.mapping
+        end = offset + length
+        if data.find(b"\r", offset, end) != -1:
+            return self.blocks(offset, length)[:HEADER_BLOCKS]
+        fields = []
+        start = offset
+        for block in range(HEADER_BLOCKS):
+            stop = data.find(SEPARATOR, start, end)
+            fields.append(self.text(start, stop))
+            start = stop + len(SEPARATOR)
+        return fields
+
+    ## recipes(self)
+    ##
+    ## Summary of the recipe reader:
+    ##
+    ## Yields a Recipe for each record found by build.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : generator of Recipe
+    ##
+    ## Description:
+    ##
+    ## Raises error, if build found a broken record, after the records
+    ## before it.
+
+    def recipes(self):
+        for offset, length in zip(self.offsets, self.lengths):
+            yield parse_record(self.blocks(offset, length))
+        if self.error is not None:
+            raise self.error
+
+    ## close(self)
+    ##
+    ## Summary of the close function:
+    ##
+    ## Unmaps and closes the file.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def close(self):
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping.close()
+        self.file.close()
+
+
+## mapped_recipes(filename, use_sidecar=True)
+##
+## Summary of the mapped loader:
+##
+## Yields a Recipe for each record in a recipes file, read through a
+## record_index.
+##
+## Parameters :
+##    filename - path to the recipes file
+##    use_sidecar - whether to read and write the .idx file
+##
+## Return Value : generator of Recipe
+##
+## Description:
+##
+## Gives the same recipes as recipe_parser.iter_recipes and raises the
+## same errors, after every record before the broken one.
+
+def mapped_recipes(filename, use_sidecar=True):
+    records = record_index(filename)
+    try:
+        records.build(use_sidecar)
+        yield from records.recipes()
+    finally:
+        records.close()
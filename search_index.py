@@ -0,0 +1,347 @@
+##-----------------------------------------------------------------------
+## File : search_index.py
+##
+## Description: Full text search over recipe names, ingredients and
+##              descriptions. Words are split out, lower cased and cut
+##              down to a simple stem, then kept in an inverted index
+##              (word -> recipes using it) so a search only looks at the
+##              recipes containing the searched words. Results are ranked
+##              with BM25.
+##-----------------------------------------------------------------------
+
+import heapq
+import math
+import re
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+VOWELS = "aeiou"
+FIELD_WEIGHTS = (("name", 3), ("ingredients", 2), ("description", 1))
+BM25_K1 = 1.2
+BM25_B = 0.75
+SEARCH_LIMIT = 50
+IRREGULAR_PLURALS = {
+    "leaves": "leaf", "loaves": "loaf", "halves": "half", "calves": "calf",
+    "knives": "knife", "shelves": "shelf", "geese": "goose", "feet": "foot",
+    "sloes": "sloe", "shoes": "shoe", "toes": "toe",
+}
+
+
+## short_stem(word)
+##
+## Summary of the short stem check:
+##
+## Tells whether a stem is one syllable ending consonant, vowel,
+## consonant, like "bak" or "slic".
+##
+## Parameters : word - lower case stem
+##
+## Return Value : True if an "e" was probably cut off it
+##
+## Description:
+##
+## Porter's *o rule limited to one syllable stems, so "bak" becomes
+## "bake" but "open" and "heat" are left alone.
+
+def short_stem(word):
+    if len(word) < 3 or word[-1] in VOWELS or word[-1] in "wxy" or word[-2] not in VOWELS or word[-3] in VOWELS:
+        return False
+    return sum(1 for letter in word[:-2] if letter in VOWELS) == 0
+
+
+## singular(word)
+##
+## Summary of the plural remover:
+##
+## Turns a lower case English plural into its singular.
+##
+## Parameters : word - lower case word
+##
+## Return Value : the singular, or word unchanged if it is not a plural
+##
+## Description:
+##
+## Handles the regular endings ("eggs", "tomatoes", "berries",
+## "peaches") and leaves words of three letters or less and words ending
+## in ss, us or is alone. Irregular plurals only work when they are in
+## IRREGULAR_PLURALS, so "leaves" becomes "leaf" and "sloes" "sloe". There
+## is no general -ves rule because "olives" and "cloves" just lose the s.
+
+def singular(word):
+    irregular = IRREGULAR_PLURALS.get(word)
+    if irregular is not None:
+        return irregular
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "shes", "ches", "xes", "zes", "oes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+## stem(word)
+##
+## Summary of the stemmer:
+##
+## Cuts common English endings off a lower case word.
+##
+## Parameters : word - lower case word
+##
+## Return Value : the stem
+##
+## Description:
+##
+## Only handles plurals (with singular) and the -ing/-ed endings, which
+## is enough for "tomatoes" to find "tomato" and "baking" to find "bake".
+## Short words are left alone so "peas" and "eggs" do not lose too much.
+
+def stem(word):
+    if len(word) <= 3:
+        return word
+    if word.endswith("ied") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s"):
+        return singular(word)
+    if word.endswith("ing") and len(word) > 5:
+        word = word[:-3]
+    elif word.endswith("ed") and len(word) > 4:
+        word = word[:-2]
+    else:
+        return word
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+        return word[:-1]
+    if short_stem(word):
+        return word + "e"
+    return word
+
+
+## tokenize(text)
+##
+## Summary of the tokenizer:
+##
+## Splits text into stemmed, case folded words.
+##
+## Parameters : text - any text
+##
+## Return Value : list of stems
+##
+## Description:
+##
+## A word is a run of letters and digits; everything else separates words.
+
+def tokenize(text):
+    return [stem(word) for word in WORD_PATTERN.findall(text.casefold())]
+
+
+## recipe_terms(recipe_object)
+##
+## Summary of the term counting function:
+##
+## Counts the weighted words of one recipe.
+##
+## Parameters : recipe_object - the recipe to index
+##
+## Return Value : (dictionary stem -> weighted count, weighted length)
+##
+## Description:
+##
+## A word in the name counts three times, in the ingredients twice and
+## in the description once, so a match on the name ranks highest.
+
+def recipe_terms(recipe_object):
+    fields = {
+        "name": recipe_object.name,
+        "ingredients": " ".join(f"{ingredient} {amount}" for ingredient, amount in recipe_object.ingredients),
+        "description": recipe_object.description,
+    }
+    terms = {}
+    length = 0
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(fields[field]):
+            terms[term] = terms.get(term, 0) + weight
+            length += weight
+    return terms, length
+
+
+## class search_index
+##
+## Description:
+##
+##   Inverted index over a set of recipes, kept up to date one recipe at
+##   a time.
+##
+## Data members:
+##
+##   postings : Mapping stem -> {doc id: weighted count}.
+##   doc_terms : Mapping doc id -> the recipe's own weighted counts, used
+##               to take it back out of postings.
+##   doc_lengths : Mapping doc id -> weighted word count.
+##   total_length : Sum of doc_lengths.
+##   doc_ids : Mapping Recipe -> doc id.
+##   doc_recipes : Mapping doc id -> Recipe.
+##   next_id : Next doc id to hand out.
+##
+## Methods:
+##
+##   __init__ - index a list of recipes.
+##   add - index one recipe.
+##   index_recipe - file a recipe's words under a doc id.
+##   remove - drop one recipe.
+##   update - re-index an edited recipe.
+##   search - BM25 ranked recipes for a query.
+
+class search_index:
+
+    ## __init__(self, recipes=())
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Builds the index from a list of recipes.
+    ##
+    ## Parameters : recipes - recipes to index, in list order
+    ##
+    ## Return Value : none
+
+    def __init__(self, recipes=()):
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.doc_ids = {}
+        self.doc_recipes = {}
+        self.next_id = 0
+        for recipe_object in recipes:
+            self.add(recipe_object)
+
+    ## add(self, recipe_object)
+    ##
+    ## Summary of the add function:
+    ##
+    ## Indexes one recipe.
+    ##
+    ## Parameters : recipe_object - the recipe to add
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Doc ids only increase, so ties in a search come out in the order
+    ## the recipes were added.
+
+    def add(self, recipe_object):
+        self.index_recipe(recipe_object, self.next_id)
+        self.next_id += 1
+
+    ## index_recipe(self, recipe_object, doc_id)
+    ##
+    ## Summary of the indexing helper:
+    ##
+    ## Adds a recipe's words to the posting lists under a doc id.
+    ##
+    ## Parameters :
+    ##    recipe_object - the recipe to index
+    ##    doc_id - id to file it under
+    ##
+    ## Return Value : none
+
+    def index_recipe(self, recipe_object, doc_id):
+        terms, length = recipe_terms(recipe_object)
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        self.doc_ids[recipe_object] = doc_id
+        self.doc_recipes[doc_id] = recipe_object
+
+    ## remove(self, recipe_object)
+    ##
+    ## Summary of the remove function:
+    ##
+    ## Drops one recipe from the index.
+    ##
+    ## Parameters : recipe_object - the recipe to remove
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Uses the counts stored when the recipe was added, so it works after
+    ## the recipe has already been edited.
+
+    def remove(self, recipe_object):
+        doc_id = self.doc_ids.pop(recipe_object, None)
+        if doc_id is None:
+            return
+        for term in self.doc_terms.pop(doc_id):
+            posting = self.postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        del self.doc_recipes[doc_id]
+
+    ## update(self, recipe_object)
+    ##
+    ## Summary of the update function:
+    ##
+    ## Re-indexes a recipe after it was edited.
+    ##
+    ## Parameters : recipe_object - the edited recipe
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## The recipe keeps its doc id so its place among ties is unchanged.
+
+    def update(self, recipe_object):
+        doc_id = self.doc_ids.get(recipe_object)
+        if doc_id is None:
+            self.add(recipe_object)
+            return
+        self.remove(recipe_object)
+        self.index_recipe(recipe_object, doc_id)
+
+    ## search(self, query, limit=SEARCH_LIMIT)
+    ##
+    ## Summary of the search function:
+    ##
+    ## Returns the recipes that best match a query.
+    ##
+    ## Parameters :
+    ##    query - words to search for
+    ##    limit - most results to return
+    ##
+    ## Return Value : list of (Recipe, score), best first
+    ##
+    ## Description:
+    ##
+    ## Scores each recipe that contains at least one query word with BM25,
+    ## reading only the posting lists of the query words, and keeps the
+    ## best ones with a heap. When no indexed recipe has any words (names
+    ## like "!!!" and nothing else) there is nothing to match and no
+    ## average length to divide by, so the result is empty.
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        count = len(self.doc_lengths)
+        if count == 0 or self.total_length == 0:
+            return []
+        average = self.total_length / count
+        base = BM25_K1 * (1 - BM25_B)
+        scale = BM25_K1 * BM25_B / average
+        lengths = self.doc_lengths
+        scores = {}
+        get = scores.get
+        for term in dict.fromkeys(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            weight = idf * (BM25_K1 + 1)
+            for doc_id, frequency in posting.items():
+                scores[doc_id] = get(doc_id, 0.0) + weight * frequency / (frequency + base + scale * lengths[doc_id])
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.doc_recipes[doc_id], score) for doc_id, score in best]
@@ -0,0 +1,12 @@
+##-----------------------------------------------------------------------
+## File : tests/conftest.py
+##
+## Description: Lets the tests import the program's modules, which sit
+##              at the top of the repository rather than in a package.
+##              Run the tests with "python -m pytest" from the top.
+##-----------------------------------------------------------------------
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,143 @@
+##-----------------------------------------------------------------------
+## File : tests/test_ingredient_index.py
+##
+## Description: Checks that ingredient names match across plural and
+##              descriptor forms, that what_can_i_cook returns recipes
+##              with nothing missing first and then by how many are
+##              missing, and that it agrees with a plain set comparison
+##              after random adds, edits and deletes.
+##-----------------------------------------------------------------------
+
+import random
+
+import pytest
+
+import ingredient_index
+from ingredient_index import normalize_ingredient
+from recipe import Recipe
+from recipe_manager import recipe_manager
+
+WORDS = ["egg", "eggs", "Large eggs", "milk", "flour", "basil leaf", "Fresh Basil Leaves", "tomatoes", "butter", "olives", "salt"]
+
+
+## make_recipe(name, ingredients)
+##
+## Summary of the recipe helper:
+##
+## Returns a recipe with the given name and ingredient names.
+
+def make_recipe(name, ingredients):
+    return Recipe(name, "photo.png", ["tag"], [(ingredient, "1") for ingredient in ingredients], "Cook.")
+
+
+## expected(manager, pantry, max_missing)
+##
+## Summary of the reference pantry search:
+##
+## Works out what_can_i_cook the slow way, one recipe at a time.
+
+def expected(manager, pantry, max_missing):
+    have = {normalize_ingredient(name) for name in pantry} - {""}
+    found = []
+    for recipe_object in manager.recipe_list:
+        needed = {normalize_ingredient(ingredient) for ingredient, amount in recipe_object.ingredients} - {""}
+        missing = sorted(needed - have)
+        if needed and len(missing) <= max_missing:
+            found.append((len(missing), recipe_object, missing))
+    found.sort(key=lambda entry: entry[0])
+    return [(recipe_object, missing) for count, recipe_object, missing in found]
+
+
+## test_plural_and_descriptor_pairs_match()
+##
+## Summary of the normalization test:
+##
+## Regular and irregular plurals and size or preparation words reduce to
+## the same name, while words that only look like -ves plurals keep
+## their e.
+
+@pytest.mark.parametrize("first, second", [
+    ("Large eggs", "Large egg"),
+    ("Fresh Basil Leaves", "basil leaf"),
+    ("bay leaves", "Bay Leaf"),
+    ("Tomatoes", "tomato"),
+    ("potatoes", "Diced potato"),
+    ("loaves", "loaf"),
+    ("halves", "half"),
+    ("Berries", "berry"),
+    ("peaches", "peach"),
+    ("olives", "olive"),
+    ("cloves", "clove"),
+])
+def test_plural_and_descriptor_pairs_match(first, second):
+    assert normalize_ingredient(first) == normalize_ingredient(second)
+
+
+## test_nothing_missing_comes_first()
+##
+## Summary of the coverage order test:
+##
+## Recipes the pantry fully covers come first, then those missing one,
+## then two, each group in recipe_list order, with the missing names.
+
+def test_nothing_missing_comes_first():
+    manager = recipe_manager()
+    manager.add_recipe(make_recipe("Two short", ["egg", "milk", "flour", "sugar"]))
+    manager.add_recipe(make_recipe("One short", ["Large eggs", "milk", "butter"]))
+    manager.add_recipe(make_recipe("Pesto", ["Fresh Basil Leaves", "olive oil"]))
+    manager.add_recipe(make_recipe("Omelette", ["eggs", "Milk"]))
+    manager.add_recipe(make_recipe("Three short", ["salt", "pepper", "rice", "egg"]))
+    manager.add_recipe(make_recipe("Nothing", []))
+    results = manager.what_can_i_cook(["egg", "milk", "basil leaf", "olive oil"], 2)
+    assert [(recipe_object.name, missing) for recipe_object, missing in results] == [
+        ("Pesto", []),
+        ("Omelette", []),
+        ("One short", ["butter"]),
+        ("Two short", ["flour", "sugar"]),
+    ]
+    assert [recipe_object.name for recipe_object, missing in manager.what_can_i_cook(["Eggs", "MILK", "basil leaves", "olive oil"])] == ["Pesto", "Omelette"]
+    assert manager.what_can_i_cook([]) == []
+
+
+## test_pantry_is_normalized_once()
+##
+## Summary of the normalization count test:
+##
+## A query normalizes each pantry item once, however many recipes it
+## returns.
+
+def test_pantry_is_normalized_once(monkeypatch):
+    manager = recipe_manager()
+    for number in range(200):
+        manager.add_recipe(make_recipe(f"Recipe {number}", ["egg", "milk", f"spice {number}"]))
+    manager.what_can_i_cook(["egg"])
+    calls = []
+    monkeypatch.setattr(ingredient_index, "normalize_ingredient", lambda name: calls.append(name) or normalize_ingredient(name))
+    results = manager.what_can_i_cook(["Large eggs", "milk", "salt"], 1)
+    assert len(results) == 200
+    assert len(calls) == 3
+
+
+## test_random_changes_match_set_comparison()
+##
+## Summary of the random change test:
+##
+## After every add, edit and delete, what_can_i_cook gives the same
+## recipes in the same order as comparing ingredient sets one by one.
+
+def test_random_changes_match_set_comparison():
+    for seed in range(40):
+        rng = random.Random(seed)
+        manager = recipe_manager()
+        for step in range(40):
+            choice = rng.random()
+            if choice < 0.45 or not manager.recipe_list:
+                manager.add_recipe(make_recipe(f"Recipe {step}", rng.sample(WORDS, rng.randint(0, 5))))
+            elif choice < 0.75:
+                entry = rng.choice(manager.recipe_list)
+                manager.update_recipe(entry, entry.name, entry.photo_name, entry.tags, [(word, "1") for word in rng.sample(WORDS, rng.randint(0, 5))], entry.description)
+            else:
+                manager.delete_recipe(rng.choice(manager.recipe_list).name)
+            pantry = rng.sample(WORDS, rng.randint(0, 6))
+            max_missing = rng.randint(0, 3)
+            assert manager.what_can_i_cook(pantry, max_missing) == expected(manager, pantry, max_missing)
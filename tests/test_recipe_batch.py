@@ -0,0 +1,275 @@
+##-----------------------------------------------------------------------
+## File : tests/test_recipe_batch.py
+##
+## Description: Checks that a recipe_manager batch that raises puts back
+##              recipe_list, the name index, the tag bitsets and the
+##              search and pantry indexes exactly as they were, and that
+##              a batch that commits ends up where the same changes made
+##              one at a time would.
+##-----------------------------------------------------------------------
+
+import random
+
+import pytest
+
+from recipe import Recipe
+from recipe_manager import recipe_manager
+from recipe_storage import recipe_storage
+
+NAMES = ["Soup", "Salad", "Stew", "Toast", "Curry", "Pie"]
+TAGS = ["quick", "vegan", "dinner", "lunch", "sweet"]
+WORDS = ["flour", "egg", "milk", "tomato", "basil", "rice", "lentils", "butter"]
+
+
+## class recording_storage
+##
+## Description:
+##
+##   Storage backend that only remembers the changes handed to it.
+##
+## Data members:
+##
+##   changes : List of (op, name, recipe fields) in the order stored.
+##   writes : Number of record_many calls.
+##
+## Methods:
+##
+##   record - remember one change.
+##   record_many - count the call and remember each change.
+
+class recording_storage(recipe_storage):
+
+    def __init__(self):
+        self.changes = []
+        self.writes = 0
+
+    def record_many(self, manager, changes):
+        self.writes += 1
+        recipe_storage.record_many(self, manager, changes)
+
+    def record(self, manager, op, name, recipe_object):
+        self.changes.append((op, name, fields(recipe_object)))
+
+
+## fields(recipe_object)
+##
+## Summary of the comparison helper:
+##
+## Returns a recipe's five fields as plain values.
+
+def fields(recipe_object):
+    return (recipe_object.name, recipe_object.photo_name, list(recipe_object.tags), list(recipe_object.ingredients), recipe_object.description)
+
+
+## random_recipe(rng)
+##
+## Summary of the recipe builder:
+##
+## Returns a recipe with a random name, tags and ingredients.
+
+def random_recipe(rng):
+    ingredients = [(word, "1 cup") for word in rng.sample(WORDS, rng.randint(1, 4))]
+    return Recipe(rng.choice(NAMES), "photo.png", rng.sample(TAGS, rng.randint(1, 3)), ingredients, " ".join(rng.choice(WORDS) for word in range(5)))
+
+
+## random_changes(rng, count)
+##
+## Summary of the change list builder:
+##
+## Returns a list of changes that apply_change can make to any manager.
+##
+## Description:
+##
+## Recipes are picked by position so the same list can be replayed on
+## two managers holding the same recipes.
+
+def random_changes(rng, count):
+    changes = []
+    for step in range(count):
+        choice = rng.random()
+        if choice < 0.35:
+            changes.append(("add", random_recipe(rng)))
+        elif choice < 0.75:
+            changes.append(("update", rng.random(), random_recipe(rng)))
+        else:
+            changes.append(("delete", rng.random()))
+    return changes
+
+
+## apply_change(manager, change)
+##
+## Summary of the change helper:
+##
+## Makes one change from random_changes to a manager.
+
+def apply_change(manager, change):
+    if change[0] == "add":
+        new = change[1]
+        manager.add_recipe(Recipe(new.name, new.photo_name, list(new.tags), list(new.ingredients), new.description))
+    elif manager.recipe_list:
+        entry = manager.recipe_list[int(change[1] * len(manager.recipe_list))]
+        if change[0] == "update":
+            new = change[2]
+            manager.update_recipe(entry, new.name, new.photo_name, list(new.tags), list(new.ingredients), new.description)
+        else:
+            manager.delete_recipe(entry.name)
+
+
+## make_manager(rng)
+##
+## Summary of the manager builder:
+##
+## Returns a manager with random recipes whose search and pantry indexes
+## have already been built, and whose storage has not recorded anything.
+
+def make_manager(rng):
+    manager = recipe_manager(recording_storage())
+    for number in range(rng.randint(4, 24)):
+        manager.add_recipe(random_recipe(rng))
+    manager.search_recipes("flour")
+    manager.what_can_i_cook(["egg"])
+    manager.storage.changes = []
+    return manager
+
+
+## state(manager)
+##
+## Summary of the state helper:
+##
+## Returns everything a batch may change, as values that compare equal
+## for the same recipes.
+
+def state(manager):
+    position = {id(entry): index for index, entry in enumerate(manager.recipe_list)}
+    return (
+        [fields(entry) for entry in manager.recipe_list],
+        {name: position[id(entry)] for name, entry in manager.recipe_index.items()},
+        dict(manager.name_counts),
+        list(manager.all_tags),
+        dict(manager.tag_counts),
+        {tag: bytes(bits).rstrip(b"\0") for tag, bits in manager.tag_bits.items()},
+        bytes(manager.live_bits).rstrip(b"\0"),
+        results(manager),
+    )
+
+
+## results(manager)
+##
+## Summary of the query helper:
+##
+## Runs the same get_recipe, tag, search and pantry queries on a manager.
+
+def results(manager):
+    found = []
+    for name in NAMES:
+        entry = manager.get_recipe(name)
+        found.append(None if entry is None else fields(entry))
+    recipes, counts = manager.tag_query(["dinner"], [], ["sweet"])
+    found.append(([fields(entry) for entry in recipes], dict(counts)))
+    for query in ("flour", "tomato basil", "rice egg milk"):
+        found.append([(fields(entry), round(score, 9)) for entry, score in manager.search_recipes(query)])
+    for pantry, missing in ((["egg", "milk"], 1), (["flour", "butter", "rice"], 0), (["tomato"], 2)):
+        found.append([(fields(entry), sorted(names)) for entry, names in manager.what_can_i_cook(pantry, missing)])
+    return found
+
+
+## test_rollback_restores_everything()
+##
+## Summary of the rollback test:
+##
+## Random adds, edits and deletes in a batch that raises, with searches
+## in the middle of it, leave the manager exactly as it was.
+
+@pytest.mark.parametrize("seed", range(60))
+def test_rollback_restores_everything(seed):
+    rng = random.Random(seed)
+    manager = make_manager(rng)
+    before = state(manager)
+    recipe_list = manager.recipe_list
+    all_tags = manager.all_tags
+    text_index = manager.text_index
+    pantry_index = manager.pantry_index
+    recipe_ids = dict(manager.recipe_ids)
+    next_id = manager.next_id
+    changes = random_changes(rng, rng.randint(1, 30))
+    with pytest.raises(RuntimeError):
+        with manager.batch():
+            for index, change in enumerate(changes):
+                apply_change(manager, change)
+                if index % 7 == 3:
+                    results(manager)
+            raise RuntimeError("undo")
+    assert manager.active_batch is None
+    assert manager.recipe_list is recipe_list
+    assert manager.all_tags is all_tags
+    assert manager.text_index is text_index
+    assert manager.pantry_index is pantry_index
+    assert manager.recipe_ids == recipe_ids
+    assert manager.next_id == next_id
+    assert manager.storage.changes == []
+    assert state(manager) == before
+
+
+## test_nested_batch_rolls_back_with_outer()
+##
+## Summary of the nested batch test:
+##
+## Changes made in an inner batch that finished are still undone when
+## the outer batch raises, and an error raised inside the inner batch
+## undoes the outer batch's changes too.
+
+def test_nested_batch_rolls_back_with_outer():
+    rng = random.Random(99)
+    manager = make_manager(rng)
+    before = state(manager)
+    with pytest.raises(RuntimeError):
+        with manager.batch():
+            apply_change(manager, ("add", random_recipe(rng)))
+            with manager.batch():
+                apply_change(manager, ("update", 0.0, random_recipe(rng)))
+                apply_change(manager, ("delete", 0.5))
+            raise RuntimeError("undo")
+    assert state(manager) == before
+    with pytest.raises(RuntimeError):
+        with manager.batch():
+            apply_change(manager, ("delete", 0.0))
+            with manager.batch():
+                apply_change(manager, ("add", random_recipe(rng)))
+                raise RuntimeError("undo")
+    assert manager.active_batch is None
+    assert state(manager) == before
+
+
+## test_commit_matches_plain_changes()
+##
+## Summary of the commit test:
+##
+## A batch that commits leaves the same recipes, indexes and query
+## results as making the changes one at a time, stores the net changes
+## once and tells the tag listeners once.
+
+@pytest.mark.parametrize("seed", range(60))
+def test_commit_matches_plain_changes(seed):
+    rng = random.Random(seed)
+    plain = make_manager(random.Random(seed))
+    batched = make_manager(random.Random(seed))
+    changes = random_changes(rng, rng.randint(1, 30))
+    tags_before = list(batched.all_tags)
+    heard = []
+    batched.add_tag_listener(lambda added, removed: heard.append((added, removed)))
+    with batched.batch():
+        for index, change in enumerate(changes):
+            apply_change(batched, change)
+            if index % 7 == 3:
+                results(batched)
+    for change in changes:
+        apply_change(plain, change)
+    assert state(batched) == state(plain)
+    added = [tag for tag in batched.all_tags if tag not in tags_before]
+    removed = [tag for tag in tags_before if tag not in batched.all_tags]
+    assert heard == ([(added, removed)] if added or removed else [])
+    stored = batched.storage.changes
+    final = [fields(entry) for entry in batched.recipe_list]
+    assert batched.storage.writes == (1 if stored else 0)
+    assert sum(op == "add" for op, name, values in stored) - sum(op == "delete" for op, name, values in stored) == len(final) - len(state(make_manager(random.Random(seed)))[0])
+    assert all(values in final for op, name, values in stored if op != "delete")
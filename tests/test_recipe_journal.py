@@ -0,0 +1,160 @@
+##-----------------------------------------------------------------------
+## File : tests/test_recipe_journal.py
+##
+## Description: Checks that journaled changes survive the two ways they
+##              used to be lost: a recipes file with a malformed record,
+##              and a crash that leaves half a record at the end of the
+##              journal.
+##-----------------------------------------------------------------------
+
+import pytest
+
+from recipe import Recipe
+from recipe_journal import journal_path, read_journal
+from recipe_manager import recipe_manager
+from recipe_parser import ENCODING, RecipeParseError, format_recipe
+from recipe_storage import text_storage
+
+BROKEN_RECORD = "Broken\n\nbroken.png\n\nlunch\n"
+
+
+## make_recipe(name)
+##
+## Summary of the recipe helper:
+##
+## Returns a small recipe with the given name.
+
+def make_recipe(name):
+    return Recipe(name, "photo.png", ["tag"], [("flour", "1 cup")], "Mix.")
+
+
+## start_session(path, lazy=False, broken=False)
+##
+## Summary of the session helper:
+##
+## Loads a recipes file and opens its journal the way the window does.
+##
+## Parameters :
+##    path - recipes file
+##    lazy - whether to load bodies lazily
+##    broken - whether the file is expected to fail to load
+##
+## Return Value : recipe_manager
+
+def start_session(path, lazy=False, broken=False):
+    manager = recipe_manager(text_storage(lazy_bodies=lazy))
+    if broken:
+        with pytest.raises(RecipeParseError):
+            manager.load_recipes(str(path))
+    else:
+        manager.load_recipes(str(path))
+    manager.open_journal(str(path))
+    return manager
+
+
+## crash(manager)
+##
+## Summary of the crash helper:
+##
+## Drops a session without folding its journal into the recipes file,
+## as if the program had been killed.
+
+def crash(manager):
+    manager.storage.journal.close()
+    manager.storage.close_body_records()
+
+
+## names(manager)
+##
+## Summary of the name helper:
+##
+## Returns the names of a manager's recipes.
+
+def names(manager):
+    return [entry.name for entry in manager.recipe_list]
+
+
+## test_journal_replayed_after_malformed_record(tmp_path)
+##
+## Summary of the malformed file test:
+##
+## Edits journaled while recipes.txt has a malformed record are shown
+## after a restart and are never lost by saving the partial library over
+## the file.
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_journal_replayed_after_malformed_record(tmp_path, lazy):
+    path = tmp_path / "recipes.txt"
+    text = format_recipe(make_recipe("Old")) + BROKEN_RECORD
+    path.write_bytes(text.encode(ENCODING))
+
+    manager = start_session(path, lazy, broken=True)
+    manager.add_recipe(make_recipe("Added"))
+    crash(manager)
+
+    manager = start_session(path, lazy, broken=True)
+    assert names(manager) == ["Old", "Added"]
+    manager.add_recipe(make_recipe("Second"))
+    manager.close_journal()
+    assert path.read_bytes() == text.encode(ENCODING)
+
+    manager = start_session(path, lazy, broken=True)
+    assert names(manager) == ["Old", "Added", "Second"]
+    manager.close_journal()
+
+
+## test_resume_after_torn_last_record(tmp_path)
+##
+## Summary of the torn record test:
+##
+## A record cut off by a crash is dropped when the journal is resumed, so
+## records appended after it are still replayed after a second crash.
+
+def test_resume_after_torn_last_record(tmp_path):
+    path = tmp_path / "recipes.txt"
+    path.write_bytes(format_recipe(make_recipe("Old")).encode(ENCODING))
+
+    manager = start_session(path)
+    manager.add_recipe(make_recipe("A1"))
+    manager.add_recipe(make_recipe("A2"))
+    crash(manager)
+    journal = journal_path(str(path))
+    with open(journal, "r+b") as file:
+        file.truncate(len(file.read()) - 20)
+
+    manager = start_session(path)
+    assert names(manager) == ["Old", "A1"]
+    manager.add_recipe(make_recipe("B1"))
+    crash(manager)
+
+    manager = start_session(path)
+    assert names(manager) == ["Old", "A1", "B1"]
+    assert len(read_journal(str(path))) == 2
+    manager.close_journal()
+
+
+## test_resume_after_record_missing_its_line_ending(tmp_path)
+##
+## Summary of the unterminated record test:
+##
+## A complete last record that lost only its "\n" is kept and the next
+## record starts on a line of its own.
+
+def test_resume_after_record_missing_its_line_ending(tmp_path):
+    path = tmp_path / "recipes.txt"
+    path.write_bytes(format_recipe(make_recipe("Old")).encode(ENCODING))
+
+    manager = start_session(path)
+    manager.add_recipe(make_recipe("A1"))
+    crash(manager)
+    journal = journal_path(str(path))
+    with open(journal, "r+b") as file:
+        file.truncate(len(file.read()) - 1)
+
+    manager = start_session(path)
+    manager.add_recipe(make_recipe("B1"))
+    crash(manager)
+
+    manager = start_session(path)
+    assert names(manager) == ["Old", "A1", "B1"]
+    manager.close_journal()
@@ -0,0 +1,76 @@
+##-----------------------------------------------------------------------
+## File : tests/test_recipe_manager.py
+##
+## Description: Checks that recipe_manager's name index finds the same
+##              recipe the old scans over recipe_list found.
+##-----------------------------------------------------------------------
+
+import random
+
+from recipe import Recipe
+from recipe_manager import recipe_manager
+
+
+## make_recipe(name)
+##
+## Summary of the recipe helper:
+##
+## Returns a small recipe with the given name.
+
+def make_recipe(name):
+    return Recipe(name, "photo.png", ["tag"], [("flour", "1 cup")], "Mix.")
+
+
+## first_named(manager, name)
+##
+## Summary of the linear scan helper:
+##
+## Finds the first recipe with a name the way the old code did, by
+## walking recipe_list.
+
+def first_named(manager, name):
+    return next((entry for entry in manager.recipe_list if entry.name == name), None)
+
+
+## test_rename_into_existing_name_finds_first_in_list()
+##
+## Summary of the rename test:
+##
+## A recipe renamed to a name an older recipe already has, but sitting
+## before it in recipe_list, becomes the one get_recipe returns.
+
+def test_rename_into_existing_name_finds_first_in_list():
+    manager = recipe_manager()
+    first = make_recipe("A")
+    second = make_recipe("B")
+    manager.add_recipe(first)
+    manager.add_recipe(second)
+    manager.update_recipe(first, "B", first.photo_name, first.tags, first.ingredients, first.description)
+    assert manager.get_recipe("B") is first
+    manager.delete_recipe("B")
+    assert manager.get_recipe("B") is second
+    assert manager.get_recipe("A") is None
+
+
+## test_random_changes_match_linear_scan()
+##
+## Summary of the random change test:
+##
+## After every add, rename and delete, get_recipe agrees with a scan.
+
+def test_random_changes_match_linear_scan():
+    names = ["A", "B", "C", "D"]
+    for seed in range(100):
+        rng = random.Random(seed)
+        manager = recipe_manager()
+        for step in range(40):
+            choice = rng.random()
+            if choice < 0.4 or not manager.recipe_list:
+                manager.add_recipe(make_recipe(rng.choice(names)))
+            elif choice < 0.7:
+                entry = rng.choice(manager.recipe_list)
+                manager.update_recipe(entry, rng.choice(names), entry.photo_name, entry.tags, entry.ingredients, entry.description)
+            else:
+                manager.delete_recipe(rng.choice(names))
+            for name in names:
+                assert manager.get_recipe(name) is first_named(manager, name)
@@ -0,0 +1,202 @@
+##-----------------------------------------------------------------------
+## File : tests/test_recipe_parser.py
+##
+## Description: Checks that the streaming reader in recipe_parser and the
+##              mapped reader in record_index give the same recipes the
+##              original load_recipes did, that a record cut short at the
+##              end of the file is reported instead of dropped, that
+##              format_recipe writes records that read back unchanged, and
+##              that a saved record index is not used for an edited file.
+##-----------------------------------------------------------------------
+
+import os
+import random
+
+import pytest
+
+from recipe import Recipe
+from recipe_parser import ENCODING, RecipeParseError, format_recipe, iter_recipes
+from record_index import mapped_recipes
+
+LINES = ["", "", "", " ", "Pancakes", "Flour, 2 cups", "Egg", "  Milk ,1 cup  ", "sweet breakfast", "Mix and fry.", "a,b,c"]
+
+
+## old_load(content)
+##
+## Summary of the reference loader:
+##
+## The block splitting of the original recipe_manager.load_recipes.
+##
+## Parameters : content - text of a recipes file
+##
+## Return Value : tuple (list of Recipe, True if blocks were left over)
+##
+## Description:
+##
+## Copied from the first version of the program so the new readers are
+## measured against what it actually did. It silently dropped a record
+## with fewer than five blocks at the end of the file; the leftover flag
+## says whether that happened.
+
+def old_load(content):
+    blocks = content.strip().split("\n\n")
+    recipes = []
+    for index in range(0, len(blocks), 5):
+        block = blocks[index : index + 5]
+        if len(block) != 5:
+            continue
+        name, photo_name, tags_line, ingredients_block, description = block
+        ingredients = []
+        for line in ingredients_block.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if "," in line:
+                ingredient, amount = line.split(",", 1)
+                ingredients.append((ingredient.strip(), amount.strip()))
+            else:
+                ingredients.append((line, ""))
+        recipes.append(Recipe(name.strip(), photo_name.strip(), tags_line.split(), ingredients, description.strip()))
+    return recipes, bool(content.strip()) and len(blocks) % 5 != 0
+
+
+## fields(recipe_object)
+##
+## Summary of the comparison helper:
+##
+## Returns a recipe's five fields as plain values.
+
+def fields(recipe_object):
+    return (recipe_object.name, recipe_object.photo_name, list(recipe_object.tags), list(recipe_object.ingredients), recipe_object.description)
+
+
+## read_all(reader, path)
+##
+## Summary of the reader helper:
+##
+## Collects what a reader yields and the RecipeParseError it ends with.
+##
+## Parameters :
+##    reader - iter_recipes or mapped_recipes
+##    path - file to read
+##
+## Return Value : tuple (list of fields, error or None)
+
+def read_all(reader, path):
+    recipes = []
+    try:
+        for recipe_object in reader(path):
+            recipes.append(fields(recipe_object))
+    except RecipeParseError as error:
+        return recipes, error
+    return recipes, None
+
+
+## random_file(rng)
+##
+## Summary of the random file builder:
+##
+## Returns the text of a recipes file made of random lines.
+##
+## Parameters : rng - random.Random
+##
+## Return Value : string with "\n" line endings
+##
+## Description:
+##
+## Mostly blank lines and short text lines, so runs of blank lines,
+## blank blocks and short records all turn up often.
+
+def random_file(rng):
+    lines = [rng.choice(LINES) for line in range(rng.randint(0, 60))]
+    text = "\n".join(lines)
+    return text + "\n" if rng.random() < 0.5 else text
+
+
+## test_readers_match_old_loader(tmp_path)
+##
+## Summary of the equivalence test:
+##
+## Both readers give the old loader's recipes for random files, with
+## "\n" and "\r\n" line endings, and raise RecipeParseError exactly when
+## the old loader would have dropped a short record at the end.
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_readers_match_old_loader(tmp_path, newline):
+    path = tmp_path / "recipes.txt"
+    for seed in range(400):
+        rng = random.Random(seed)
+        text = random_file(rng)
+        path.write_bytes(text.replace("\n", newline).encode(ENCODING))
+        expected, leftover = old_load(text)
+        expected = [fields(entry) for entry in expected]
+        for reader in (iter_recipes, lambda name: mapped_recipes(name, use_sidecar=False)):
+            recipes, error = read_all(reader, str(path))
+            assert recipes == expected, seed
+            assert (error is not None) == leftover, seed
+
+
+## test_malformed_last_record_is_reported(tmp_path)
+##
+## Summary of the malformed record test:
+##
+## A record cut off after its tags is reported with its number and
+## offset, after the complete record before it has been read.
+
+def test_malformed_last_record_is_reported(tmp_path):
+    good = Recipe("Toast", "toast.png", ["breakfast"], [("Bread", "2 slices")], "Toast it.")
+    path = tmp_path / "recipes.txt"
+    path.write_bytes((format_recipe(good) + "Broken\n\nbroken.png\n\nlunch\n").encode(ENCODING))
+    for reader in (iter_recipes, lambda name: mapped_recipes(name, use_sidecar=False)):
+        recipes, error = read_all(reader, str(path))
+        assert recipes == [fields(good)]
+        assert error is not None
+        assert error.record_number == 2
+        assert error.offset == len(format_recipe(good).encode(ENCODING))
+
+
+## test_format_round_trip(tmp_path)
+##
+## Summary of the round trip test:
+##
+## Recipes written with format_recipe read back with the same fields.
+
+def test_format_round_trip(tmp_path):
+    rng = random.Random(7)
+    words = ["salt", "Olive oil", "tomato", "basil", "pasta", "crème fraîche"]
+    recipes = []
+    for number in range(200):
+        ingredients = [(rng.choice(words), rng.choice(["", "1 tsp", "2, chopped"])) for item in range(rng.randint(1, 5))]
+        description = " ".join(rng.choice(words) for word in range(rng.randint(1, 8))).capitalize()
+        recipes.append(Recipe(f"Recipe {number}", f"photo_{number}.png", rng.sample(["quick", "vegan", "dinner"], rng.randint(1, 3)), ingredients, description))
+    path = tmp_path / "recipes.txt"
+    path.write_bytes("".join(format_recipe(entry) for entry in recipes).encode(ENCODING))
+    for reader in (iter_recipes, lambda name: mapped_recipes(name, use_sidecar=False)):
+        recipes_read, error = read_all(reader, str(path))
+        assert error is None
+        assert recipes_read == [fields(entry) for entry in recipes]
+
+
+## test_sidecar_not_reused_after_middle_edit(tmp_path)
+##
+## Summary of the stale sidecar test:
+##
+## A record index saved before an edit in the middle of the file, which
+## keeps the size and both ends, is not used once the mtime has changed.
+
+def test_sidecar_not_reused_after_middle_edit(tmp_path):
+    recipes = [Recipe(f"Recipe {number}", f"photo_{number}.png", ["dinner"], [("Salt", "1 tsp")], "Cook it.") for number in range(400)]
+    path = tmp_path / "recipes.txt"
+    text = "".join(format_recipe(entry) for entry in recipes)
+    path.write_bytes(text.encode(ENCODING))
+    assert read_all(mapped_recipes, str(path)) == read_all(iter_recipes, str(path))
+    assert (tmp_path / "recipes.txt.idx").exists()
+    stat = path.stat()
+    edited = text.replace("Recipe 150\n", "Recipe 150 extra\n").replace("Recipe 160\n", "R 160\n").replace("Recipe 161\n", "Recipe161\n")
+    assert len(edited) == len(text) and edited[:5000] == text[:5000] and edited[-5000:] == text[-5000:]
+    path.write_bytes(edited.encode(ENCODING))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    recipes_read, error = read_all(mapped_recipes, str(path))
+    assert error is None
+    assert recipes_read == read_all(iter_recipes, str(path))[0]
+    assert recipes_read[150][0] == "Recipe 150 extra"
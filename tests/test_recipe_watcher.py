@@ -0,0 +1,254 @@
+##-----------------------------------------------------------------------
+## File : tests/test_recipe_watcher.py
+##
+## Description: Checks how recipe_watcher splits an outside change to
+##              recipes.txt into adds, updates and deletes (with repeated
+##              names), that apply_changes leaves alone recipes edited in
+##              the program since, and that check and deliver only hand
+##              over settled changes that were not our own saves. The Tk
+##              root is replaced by a stub that only remembers the
+##              scheduled call.
+##-----------------------------------------------------------------------
+
+import os
+
+from recipe import Recipe
+from recipe_manager import recipe_manager
+from recipe_parser import ENCODING, format_recipe
+from recipe_watcher import apply_changes, diff_records, file_stamp, recipe_watcher, scan_file
+
+
+## class stub_root
+##
+## Description:
+##
+##   Stands in for the Tk window; after only remembers the last call.
+##
+## Data members:
+##
+##   scheduled : The (delay, function) passed to after, or None.
+##
+## Methods:
+##
+##   after - remember a call.
+##   after_cancel - forget it.
+
+class stub_root:
+
+    def __init__(self):
+        self.scheduled = None
+
+    def after(self, delay, function):
+        self.scheduled = (delay, function)
+        return "job"
+
+    def after_cancel(self, job):
+        self.scheduled = None
+
+
+## make_recipe(name, description="Cook.")
+##
+## Summary of the recipe helper:
+##
+## Returns a small recipe with the given name and description.
+
+def make_recipe(name, description="Cook."):
+    return Recipe(name, f"{name.lower()}.png", ["dinner"], [("salt", "1 tsp")], description)
+
+
+## write_file(path, recipes, tick)
+##
+## Summary of the file writer:
+##
+## Writes recipes to a file and gives it a modified time of its own, so
+## two writes within the clock's resolution still have different stamps.
+
+def write_file(path, recipes, tick):
+    path.write_bytes("".join(format_recipe(entry) for entry in recipes).encode(ENCODING))
+    os.utime(path, ns=(tick * 1_000_000_000, tick * 1_000_000_000))
+
+
+## summary(changes)
+##
+## Summary of the change summary helper:
+##
+## Returns diff_records output as (op, name, new description) tuples.
+
+def summary(changes):
+    return [(op, name, None if recipe_object is None else recipe_object.description) for op, name, old_digest, recipe_object in changes]
+
+
+## diff_files(tmp_path, before, after)
+##
+## Summary of the file diff helper:
+##
+## Writes two versions of a file and returns what diff_records makes of
+## the change between them.
+
+def diff_files(tmp_path, before, after):
+    path = tmp_path / "recipes.txt"
+    write_file(path, before, 1)
+    baseline, candidates = scan_file(str(path))
+    write_file(path, after, 2)
+    digests, candidates = scan_file(str(path), baseline)
+    return diff_records(baseline, digests, candidates)
+
+
+## test_diff_splits_updates_adds_and_deletes()
+##
+## Summary of the record diff test:
+##
+## A changed record with a name that disappeared is an update, a new
+## name an add and a name that is gone a delete; untouched records and
+## moved records are not changes.
+
+def test_diff_splits_updates_adds_and_deletes(tmp_path):
+    before = [make_recipe("Soup"), make_recipe("Stew"), make_recipe("Pie"), make_recipe("Toast")]
+    after = [make_recipe("Toast"), make_recipe("Soup", "Simmer."), make_recipe("Pie"), make_recipe("Curry")]
+    assert sorted(summary(diff_files(tmp_path, before, after))) == [
+        ("add", "Curry", "Cook."),
+        ("delete", "Stew", None),
+        ("update", "Soup", "Simmer."),
+    ]
+
+
+## test_diff_with_repeated_names()
+##
+## Summary of the repeated name test:
+##
+## With two recipes of the same name, editing one is a single update,
+## and a second identical copy of a record is an add.
+
+def test_diff_with_repeated_names(tmp_path):
+    before = [make_recipe("Soup", "One."), make_recipe("Soup", "Two."), make_recipe("Pie")]
+    after = [make_recipe("Soup", "One."), make_recipe("Soup", "Three."), make_recipe("Pie"), make_recipe("Pie")]
+    changes = diff_files(tmp_path, before, after)
+    assert sorted(summary(changes)) == [("add", "Pie", "Cook."), ("update", "Soup", "Three.")]
+    assert sorted(summary(diff_files(tmp_path, after, before))) == [
+        ("delete", "Pie", None),
+        ("update", "Soup", "Two."),
+    ]
+
+
+## test_apply_skips_recipes_edited_here()
+##
+## Summary of the apply test:
+##
+## Outside updates and deletes only apply to recipes that still match
+## what the file used to hold; one edited in the program keeps our
+## version, and the names reported are the ones that changed.
+
+def test_apply_skips_recipes_edited_here(tmp_path):
+    before = [make_recipe("Soup"), make_recipe("Stew"), make_recipe("Pie"), make_recipe("Toast")]
+    after = [make_recipe("Soup", "Simmer."), make_recipe("Pie", "Bake."), make_recipe("Curry")]
+    manager = recipe_manager()
+    for entry in before:
+        manager.add_recipe(make_recipe(entry.name))
+    ours = manager.get_recipe("Pie")
+    manager.update_recipe(ours, "Pie", ours.photo_name, ours.tags, ours.ingredients, "Our pie.")
+    toast = manager.get_recipe("Toast")
+    manager.update_recipe(toast, "Toast", toast.photo_name, toast.tags, toast.ingredients, "Our toast.")
+    changes = diff_files(tmp_path, before, after)
+    added, removed, updated = apply_changes(manager, str(tmp_path / "recipes.txt"), None, changes)
+    assert (sorted(added), sorted(removed), sorted(updated)) == (["Curry"], ["Stew"], ["Soup"])
+    assert [(entry.name, entry.description) for entry in manager.recipe_list] == [
+        ("Soup", "Simmer."),
+        ("Pie", "Our pie."),
+        ("Toast", "Our toast."),
+        ("Curry", "Cook."),
+    ]
+
+
+## test_check_waits_for_the_file_to_settle()
+##
+## Summary of the check and deliver test:
+##
+## The first check only reads the baseline, a new stamp is read at the
+## next check if it has not moved, and deliver passes the changes to
+## the callback and schedules itself again.
+
+def test_check_waits_for_the_file_to_settle(tmp_path):
+    path = tmp_path / "recipes.txt"
+    write_file(path, [make_recipe("Soup"), make_recipe("Pie")], 1)
+    root = stub_root()
+    delivered = []
+    watcher = recipe_watcher(root, str(path), lambda stamp, changes: delivered.append((stamp, summary(changes))))
+    watcher.check()
+    assert watcher.baseline is not None and watcher.results.empty()
+    write_file(path, [make_recipe("Soup", "Simmer.")], 2)
+    watcher.check()
+    assert watcher.results.empty()
+    write_file(path, [make_recipe("Soup", "Simmer."), make_recipe("Stew")], 3)
+    watcher.check()
+    assert watcher.results.empty()
+    watcher.check()
+    watcher.deliver()
+    assert delivered == [(file_stamp(str(path)), [("update", "Soup", "Simmer."), ("add", "Stew", "Cook."), ("delete", "Pie", None)])]
+    assert root.scheduled is not None and root.scheduled[1] == watcher.deliver
+    watcher.check()
+    watcher.deliver()
+    assert len(delivered) == 1
+    watcher.stop()
+    assert root.scheduled is None
+    watcher.deliver()
+    assert root.scheduled is None
+
+
+## test_own_saves_are_not_delivered()
+##
+## Summary of the own save test:
+##
+## A file whose stamp is in written, either before the thread read it
+## or by the time deliver runs, is taken as the new baseline without
+## being handed to the callback.
+
+def test_own_saves_are_not_delivered(tmp_path):
+    path = tmp_path / "recipes.txt"
+    write_file(path, [make_recipe("Soup")], 1)
+    written = {}
+    delivered = []
+    watcher = recipe_watcher(stub_root(), str(path), lambda stamp, changes: delivered.append(summary(changes)), written)
+    watcher.check()
+    write_file(path, [make_recipe("Soup"), make_recipe("Pie")], 2)
+    written[str(path)] = file_stamp(str(path))
+    watcher.check()
+    watcher.check()
+    watcher.deliver()
+    assert delivered == []
+    write_file(path, [make_recipe("Soup"), make_recipe("Pie"), make_recipe("Stew")], 3)
+    watcher.check()
+    watcher.check()
+    written[str(path)] = file_stamp(str(path))
+    watcher.deliver()
+    assert delivered == []
+    write_file(path, [make_recipe("Stew")], 4)
+    watcher.check()
+    watcher.check()
+    watcher.deliver()
+    assert delivered == [[("delete", "Soup", None), ("delete", "Pie", None)]]
+
+
+## test_malformed_file_is_skipped()
+##
+## Summary of the malformed file test:
+##
+## A broken file is not delivered, and once it is fixed the changes are
+## measured against the last file that could be read.
+
+def test_malformed_file_is_skipped(tmp_path):
+    path = tmp_path / "recipes.txt"
+    write_file(path, [make_recipe("Soup")], 1)
+    delivered = []
+    watcher = recipe_watcher(stub_root(), str(path), lambda stamp, changes: delivered.append(summary(changes)))
+    watcher.check()
+    path.write_bytes((format_recipe(make_recipe("Soup")) + "Broken\n\nbroken.png\n").encode(ENCODING))
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    watcher.check()
+    watcher.check()
+    watcher.deliver()
+    assert delivered == []
+    write_file(path, [make_recipe("Soup"), make_recipe("Pie")], 3)
+    watcher.check()
+    watcher.check()
+    watcher.deliver()
+    assert delivered == [[("add", "Pie", "Cook.")]]
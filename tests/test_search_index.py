@@ -0,0 +1,150 @@
+##-----------------------------------------------------------------------
+## File : tests/test_search_index.py
+##
+## Description: Checks the BM25 ranking of search_index, that the index
+##              recipe_manager keeps up to date one change at a time
+##              gives the same results as one built from scratch, and
+##              that a library with no searchable words returns nothing.
+##-----------------------------------------------------------------------
+
+import random
+
+from recipe import Recipe
+from recipe_manager import recipe_manager
+from search_index import search_index
+
+WORDS = ["tomato", "tomatoes", "basil", "baking", "bake", "lemon", "cake", "rice", "garlic", "soup"]
+
+
+## make_recipe(name, ingredients=(), description="")
+##
+## Summary of the recipe helper:
+##
+## Returns a recipe with the given name, ingredient names and description.
+
+def make_recipe(name, ingredients=(), description=""):
+    return Recipe(name, "photo.png", ["tag"], [(ingredient, "") for ingredient in ingredients], description)
+
+
+## names(results)
+##
+## Summary of the result helper:
+##
+## Returns the recipe names of a search result, best first.
+
+def names(results):
+    return [recipe_object.name for recipe_object, score in results]
+
+
+## test_name_ranks_above_ingredients_and_description()
+##
+## Summary of the field weight test:
+##
+## The same word counts most in the name, then the ingredients, then the
+## description.
+
+def test_name_ranks_above_ingredients_and_description():
+    index = search_index([
+        make_recipe("Plain", description="lemon"),
+        make_recipe("Plain", ["lemon"]),
+        make_recipe("Lemon"),
+        make_recipe("Rice", ["rice"], "rice"),
+    ])
+    results = index.search("lemon")
+    assert [(recipe_object.name, list(recipe_object.ingredients), recipe_object.description) for recipe_object, score in results] == [
+        ("Lemon", [], ""),
+        ("Plain", [("lemon", "")], ""),
+        ("Plain", [], "lemon"),
+    ]
+    assert results[0][1] > results[1][1] > results[2][1] > 0
+
+
+## test_rare_words_and_short_recipes_rank_higher()
+##
+## Summary of the BM25 weighting test:
+##
+## A recipe matching a rarer query word outranks one matching a common
+## word, and of two recipes with the word once the shorter one ranks
+## first.
+
+def test_rare_words_and_short_recipes_rank_higher():
+    index = search_index([
+        make_recipe("Soup", description="garlic"),
+        make_recipe("Soup", description="garlic"),
+        make_recipe("Soup", description="basil"),
+        make_recipe("Rice", description="garlic rice rice rice"),
+    ])
+    assert index.search("garlic basil")[0][0].description == "basil"
+    results = index.search("garlic")
+    assert [recipe_object.description for recipe_object, score in results] == ["garlic", "garlic", "garlic rice rice rice"]
+    assert results[0][1] == results[1][1] > results[2][1]
+
+
+## test_stems_match_across_word_forms()
+##
+## Summary of the stemming test:
+##
+## Plurals and -ing forms find the plain word and the other way round.
+
+def test_stems_match_across_word_forms():
+    index = search_index([make_recipe("Tomato Bake"), make_recipe("Rice")])
+    assert names(index.search("tomatoes")) == ["Tomato Bake"]
+    assert names(index.search("baking")) == ["Tomato Bake"]
+    assert index.search("cake") == []
+    assert index.search("") == []
+
+
+## test_limit_keeps_the_best()
+##
+## Summary of the limit test:
+##
+## A limit returns the top of the full ranking, ties in list order.
+
+def test_limit_keeps_the_best():
+    recipes = [make_recipe(f"Cake {number}", ["cake"] * (number % 3), "") for number in range(20)]
+    index = search_index(recipes)
+    assert index.search("cake", 5) == index.search("cake", 50)[:5]
+
+
+## test_incremental_changes_match_fresh_index()
+##
+## Summary of the incremental index test:
+##
+## After every add, edit and delete made through recipe_manager, searches
+## give the same recipes and scores as an index built from recipe_list.
+
+def test_incremental_changes_match_fresh_index():
+    for seed in range(40):
+        rng = random.Random(seed)
+        text = lambda count: " ".join(rng.choice(WORDS) for word in range(count))
+        manager = recipe_manager()
+        manager.search_recipes("cake")
+        for step in range(40):
+            choice = rng.random()
+            if choice < 0.45 or not manager.recipe_list:
+                manager.add_recipe(make_recipe(text(2), text(rng.randint(0, 3)).split(), text(rng.randint(0, 6))))
+            elif choice < 0.75:
+                entry = rng.choice(manager.recipe_list)
+                manager.update_recipe(entry, text(2), entry.photo_name, entry.tags, [(word, "") for word in text(2).split()], text(3))
+            else:
+                manager.delete_recipe(rng.choice(manager.recipe_list).name)
+            fresh = search_index(manager.recipe_list)
+            for query in ("tomato", "basil cake", "baking soup rice"):
+                assert manager.search_recipes(query) == fresh.search(query)
+
+
+## test_library_without_words_returns_nothing()
+##
+## Summary of the tokenless library test:
+##
+## Recipes with no letters or digits anywhere give an empty result
+## instead of dividing by a zero average length.
+
+def test_library_without_words_returns_nothing():
+    manager = recipe_manager()
+    manager.add_recipe(Recipe("!!!", "a.png", ["A"], [], ""))
+    assert manager.search_recipes("cake") == []
+    manager.add_recipe(make_recipe("Cake"))
+    assert names(manager.search_recipes("cake")) == ["Cake"]
+    manager.delete_recipe("Cake")
+    assert manager.search_recipes("cake") == []
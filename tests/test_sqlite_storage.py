@@ -0,0 +1,146 @@
+##-----------------------------------------------------------------------
+## File : tests/test_sqlite_storage.py
+##
+## Description: Checks that sqlite_storage keeps the recipes it is given,
+##              that tag queries run as SQL give the same recipes and
+##              counts as the manager's bitsets before and after changes
+##              are written through, and that a database missing changes
+##              hands tag queries back to the bitsets.
+##-----------------------------------------------------------------------
+
+import random
+
+from recipe import Recipe
+from recipe_manager import recipe_manager
+from recipe_storage import sqlite_storage
+
+TAGS = ["quick", "vegan", "dinner", "lunch", "sweet", "spicy"]
+
+
+## fields(recipe_object)
+##
+## Summary of the comparison helper:
+##
+## Returns a recipe's five fields as plain values.
+
+def fields(recipe_object):
+    return (recipe_object.name, recipe_object.photo_name, list(recipe_object.tags), list(recipe_object.ingredients), recipe_object.description)
+
+
+## random_recipe(rng, number)
+##
+## Summary of the recipe builder:
+##
+## Returns a recipe with random tags (sometimes none) and ingredients.
+
+def random_recipe(rng, number):
+    ingredients = [(rng.choice(["egg", "milk", "flour", "salt"]), rng.choice(["", "1 cup", "2"])) for item in range(rng.randint(0, 3))]
+    return Recipe(f"Recipe {number}", f"photo_{number}.png", rng.sample(TAGS, rng.randint(0, 4)), ingredients, f"Step {number}.")
+
+
+## random_query(rng)
+##
+## Summary of the query builder:
+##
+## Returns random AND, OR and NOT tag lists, sometimes empty and
+## sometimes naming a tag no recipe has.
+
+def random_query(rng):
+    pick = lambda: rng.sample(TAGS + ["unused"], rng.randint(0, 2))
+    return pick(), pick(), pick()
+
+
+## bitset_query(manager, match_all, match_any, match_none)
+##
+## Summary of the reference query:
+##
+## Answers a tag query with the manager's own bitsets.
+
+def bitset_query(manager, match_all, match_any, match_none):
+    bits = manager.filter_bits(match_all, match_any, match_none)
+    return manager.recipes_from_bits(bits), manager.count_tags(bits)
+
+
+## open_manager(path, count, seed)
+##
+## Summary of the database builder:
+##
+## Saves random recipes to a database and loads them back into a manager
+## with the database open for changes.
+
+def open_manager(path, count, seed):
+    rng = random.Random(seed)
+    writer = recipe_manager(sqlite_storage())
+    for number in range(count):
+        writer.add_recipe(random_recipe(rng, number))
+    writer.save_recipes(path)
+    manager = recipe_manager(sqlite_storage())
+    manager.load_recipes(path)
+    manager.open_journal(path)
+    return writer, manager
+
+
+## test_load_gives_back_saved_recipes()
+##
+## Summary of the round trip test:
+##
+## Recipes saved to a database load back with the same fields, in the
+## same order, with their bodies read on first use.
+
+def test_load_gives_back_saved_recipes(tmp_path):
+    writer, manager = open_manager(str(tmp_path / "recipes.db"), 50, 1)
+    assert [fields(entry) for entry in manager.recipe_list] == [fields(entry) for entry in writer.recipe_list]
+    assert [fields(entry) for entry in manager.storage.stream(str(tmp_path / "recipes.db"))] == [fields(entry) for entry in writer.recipe_list]
+
+
+## test_tag_query_matches_bitsets()
+##
+## Summary of the SQL tag query test:
+##
+## AND/OR/NOT queries pushed down to SQL return the same recipes in the
+## same order and the same tag counts as the bitsets, also after adds,
+## edits and deletes have been written through.
+
+def test_tag_query_matches_bitsets(tmp_path):
+    rng = random.Random(7)
+    writer, manager = open_manager(str(tmp_path / "recipes.db"), 120, 7)
+    storage = manager.storage
+    for round_number in range(6):
+        for query in range(50):
+            match_all, match_any, match_none = random_query(rng)
+            result = storage.tag_query(manager, match_all, match_any, match_none)
+            assert result is not None
+            assert result == bitset_query(manager, match_all, match_any, match_none)
+        for change in range(10):
+            entry = rng.choice(manager.recipe_list)
+            choice = rng.random()
+            if choice < 0.4:
+                manager.add_recipe(random_recipe(rng, 1000 + round_number * 10 + change))
+            elif choice < 0.8:
+                manager.update_recipe(entry, entry.name, entry.photo_name, rng.sample(TAGS, rng.randint(0, 4)), entry.ingredients, entry.description)
+            else:
+                manager.delete_recipe(entry.name)
+    reloaded = recipe_manager(sqlite_storage())
+    reloaded.load_recipes(str(tmp_path / "recipes.db"))
+    assert [fields(entry) for entry in reloaded.recipe_list] == [fields(entry) for entry in manager.recipe_list]
+
+
+## test_changes_before_open_fall_back_to_bitsets()
+##
+## Summary of the out of date database test:
+##
+## A change made before the database is open leaves tag_query to the
+## bitsets, and opening the database brings it back up to date.
+
+def test_changes_before_open_fall_back_to_bitsets(tmp_path):
+    path = str(tmp_path / "recipes.db")
+    writer, manager = open_manager(path, 20, 3)
+    manager.close_journal()
+    manager = recipe_manager(sqlite_storage())
+    manager.load_recipes(path)
+    manager.add_recipe(Recipe("New", "new.png", ["vegan", "quick"], [("tofu", "1")], "Fry."))
+    assert manager.storage.tag_query(manager, ["vegan"], [], []) is None
+    assert manager.tag_query(["vegan"])[0] == bitset_query(manager, ["vegan"], [], [])[0]
+    manager.open_journal(path)
+    assert manager.storage.tag_query(manager, ["vegan"], [], []) == bitset_query(manager, ["vegan"], [], [])
+    assert [fields(entry) for entry in manager.storage.stream(path)] == [fields(entry) for entry in manager.recipe_list]
@@ -0,0 +1,443 @@
+##-----------------------------------------------------------------------
+## File : tracing.py
+##
+## Description: Optional timing of where the time goes while the window
+##              is used. Nothing here runs unless tracing is started: the
+##              application's methods are only wrapped in timing code by
+##              start_tracing, so a normal run calls exactly the same
+##              functions as before. When the program exits the spans are
+##              written as a Chrome trace (open it in chrome://tracing or
+##              https://ui.perfetto.dev) and a table of p50/p95/p99 times
+##              per callback is printed.
+##-----------------------------------------------------------------------
+
+import functools
+import inspect
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+DEFAULT_MAX_EVENTS = 500000
+
+## (module, class, category, methods to leave alone). menu_manager and
+## recipe_browser methods are the Tk callbacks; recipe_manager methods are
+## the operations they call. The bit and name helpers run once per recipe
+## or per bit inside those operations and are left out so tracing a big
+## load does not drown in them.
+CLASS_SPANS = [
+    ("recipe_ui", "menu_manager", "ui", ()),
+    ("recipe_browser", "recipe_browser", "ui", ("pack", "view_size", "view_name", "view_position", "matches_query", "render")),
+    ("recipe_manager", "recipe_manager", "manager", ("set_bit", "has_bit", "tag_mask", "index_name", "unindex_name", "assign_id", "release_id", "forget_queries", "add_subtract_tags", "log_change")),
+]
+
+## (module, function or Class.method, category) for the work nested
+## inside the callbacks and operations.
+NESTED_SPANS = [
+    ("recipe_parser", "parse_record", "parse"),
+    ("recipe_parser", "split_record", "parse"),
+    ("record_index", "record_index.build", "index"),
+    ("record_index", "record_index.headers", "decode"),
+    ("recipe_snapshot", "read_snapshot", "decode"),
+    ("recipe_storage", "text_storage.read_body", "decode"),
+    ("recipe_storage", "sqlite_storage.read_body", "decode"),
+    ("search_index", "search_index.__init__", "index"),
+    ("search_index", "search_index.search", "index"),
+    ("ingredient_index", "ingredient_index.match", "index"),
+    ("recipe_browser", "name_index.add_many", "index"),
+    ("recipe_browser", "name_index.substring_matches", "index"),
+    ("image_loader", "image_loader.decode", "decode"),
+    ("recipe_browser", "recipe_browser.render", "render"),
+]
+
+active = None
+
+
+## class trace_recorder
+##
+## Description:
+##
+##   Collects timed spans and turns them into a Chrome trace and a
+##   summary table. Spans can be recorded from any thread.
+##
+## Data members:
+##
+##   started : perf_counter_ns when recording began, the trace's zero.
+##   events : List of (name, category, start, duration, thread id), with
+##            times in nanoseconds.
+##   durations : Mapping (category, name) -> list of durations in seconds.
+##   max_events : Most events kept for the trace; later spans still count
+##                towards durations.
+##   dropped : Number of spans left out of events.
+##   patches : List of (owner, attribute, original) replaced by wrappers.
+##   thread_names : Mapping thread id -> thread name.
+##
+## Methods:
+##
+##   __init__ - start an empty recording.
+##   record - store one finished span.
+##   traced - wrap a function so each call is recorded.
+##   patch - replace an attribute with a traced wrapper.
+##   instrument_class - trace the methods of a class.
+##   instrument_function - trace a module level function wherever it
+##                         was imported.
+##   uninstall - put every original function back.
+##   chrome_trace - the events in Chrome trace_event form.
+##   write_chrome - save the Chrome trace to a file.
+##   summary - count, total and percentiles per span name.
+##   print_summary - print the summary as a table.
+
+class trace_recorder:
+
+    ## __init__(self, max_events=DEFAULT_MAX_EVENTS)
+    ##
+    ## Summary of the constructor function:
+    ##
+    ## Starts an empty recording.
+    ##
+    ## Parameters : max_events - most events kept for the Chrome trace
+    ##
+    ## Return Value : none
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS):
+        self.started = time.perf_counter_ns()
+        self.events = []
+        self.durations = {}
+        self.max_events = max_events
+        self.dropped = 0
+        self.patches = []
+        self.thread_names = {}
+
+    ## record(self, name, category, start, end)
+    ##
+    ## Summary of the span record function:
+    ##
+    ## Stores one finished span.
+    ##
+    ## Parameters :
+    ##    name - span name, e.g. "menu_manager.update_window"
+    ##    category - "ui", "manager", "parse", "index", "decode" or "render"
+    ##    start - perf_counter_ns at the start
+    ##    end - perf_counter_ns at the end
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## list.append and dict.setdefault are single steps under the GIL, so
+    ## worker threads can record without a lock.
+
+    def record(self, name, category, start, end):
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.durations.setdefault((category, name), []).append((end - start) / 1e9)
+        if len(self.events) < self.max_events:
+            self.events.append((name, category, start, end - start, thread))
+        else:
+            self.dropped += 1
+
+    ## traced(self, function, name, category)
+    ##
+    ## Summary of the wrapper builder:
+    ##
+    ## Wraps a function so each call is recorded as a span.
+    ##
+    ## Parameters :
+    ##    function - function to wrap
+    ##    name - span name
+    ##    category - span category
+    ##
+    ## Return Value : wrapper function
+    ##
+    ## Description:
+    ##
+    ## The span is recorded even when the call raises. Calls made inside
+    ## the function that are traced too become nested spans, since they
+    ## start after it and end before it on the same thread.
+
+    def traced(self, function, name, category):
+        record = self.record
+        clock = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, category, start, clock())
+
+        return wrapper
+
+    ## patch(self, owner, attribute, name, category)
+    ##
+    ## Summary of the patch function:
+    ##
+    ## Replaces a function attribute of a class or module with a traced
+    ## wrapper and remembers the original.
+    ##
+    ## Parameters :
+    ##    owner - class or module
+    ##    attribute - name of the function on owner
+    ##    name - span name
+    ##    category - span category
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Generator functions are left alone, since a wrapper would only time
+    ## creating the generator and not the work done as it is read.
+
+    def patch(self, owner, attribute, name, category):
+        original = inspect.getattr_static(owner, attribute)
+        if not inspect.isfunction(original) or inspect.isgeneratorfunction(original):
+            return
+        setattr(owner, attribute, self.traced(original, name, category))
+        self.patches.append((owner, attribute, original))
+
+    ## instrument_class(self, cls, category, skip=())
+    ##
+    ## Summary of the class instrumentation function:
+    ##
+    ## Traces every method a class defines.
+    ##
+    ## Parameters :
+    ##    cls - the class
+    ##    category - span category
+    ##    skip - method names to leave alone
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## Spans are named "class.method". Of the double underscore methods
+    ## only __init__ is traced. Must run before the objects whose bound
+    ## methods are handed to Tk are created, since Tk keeps whatever
+    ## function it was given.
+
+    def instrument_class(self, cls, category, skip=()):
+        for attribute in list(vars(cls)):
+            if attribute in skip or (attribute.startswith("__") and attribute != "__init__"):
+                continue
+            self.patch(cls, attribute, f"{cls.__name__}.{attribute}", category)
+
+    ## instrument_function(self, module, path, category)
+    ##
+    ## Summary of the function instrumentation function:
+    ##
+    ## Traces one function or method by its dotted path in a module.
+    ##
+    ## Parameters :
+    ##    module - the module object
+    ##    path - "function" or "Class.method"
+    ##    category - span category
+    ##
+    ## Return Value : none
+    ##
+    ## Description:
+    ##
+    ## A module level function is replaced in every loaded module that
+    ## imported it with "from module import function" too, since those
+    ## modules call their own copy of the name.
+
+    def instrument_function(self, module, path, category):
+        owner_name, dot, attribute = path.rpartition(".")
+        if dot:
+            self.patch(getattr(module, owner_name), attribute, path, category)
+            return
+        original = getattr(module, attribute)
+        for other in list(sys.modules.values()):
+            if other is not None and getattr(other, attribute, None) is original:
+                self.patch(other, attribute, path, category)
+
+    ## uninstall(self)
+    ##
+    ## Summary of the uninstall function:
+    ##
+    ## Puts every original function back, newest patch first.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : none
+
+    def uninstall(self):
+        for owner, attribute, original in reversed(self.patches):
+            setattr(owner, attribute, original)
+        self.patches = []
+
+    ## chrome_trace(self)
+    ##
+    ## Summary of the Chrome trace builder:
+    ##
+    ## Returns the recording in the Chrome trace_event format.
+    ##
+    ## Parameters : none
+    ##
+    ## Return Value : dict ready for json.dump
+    ##
+    ## Description:
+    ##
+    ## Every span is a complete ("X") event with microsecond times from
+    ## the start of the recording, and each thread gets a name event so
+    ## the photo workers show up under their own names.
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}} for thread, name in self.thread_names.items()]
+        for name, category, start, duration, thread in self.events:
+            events.append({"name": name, "cat": category, "ph": "X", "ts": (start - self.started) / 1000, "dur": duration / 1000, "pid": pid, "tid": thread})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"dropped_events": self.dropped}}
+
+    ## write_chrome(self, path)
+    ##
+    ## Summary of the Chrome trace writer:
+    ##
+    ## Saves the Chrome trace to a file.
+    ##
+    ## Parameters : path - file to write
+    ##
+    ## Return Value : none
+
+    def write_chrome(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
+
+    ## summary(self, category=None)
+    ##
+    ## Summary of the summary function:
+    ##
+    ## Works out the count, total and percentiles of every span name.
+    ##
+    ## Parameters : category - only this category, or None for all
+    ##
+    ## Return Value : list of (category, name, count, total, p50, p95,
+    ##                p99, max) in seconds, slowest total first
+    ##
+    ## Description:
+    ##
+    ## Percentiles use the nearest rank, so each one is a time some call
+    ## really took.
+
+    def summary(self, category=None):
+        rows = []
+        for (span_category, name), values in self.durations.items():
+            if category is not None and span_category != category:
+                continue
+            values = sorted(values)
+            rows.append((span_category, name, len(values), sum(values), percentile(values, 50), percentile(values, 95), percentile(values, 99), values[-1]))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
+
+    ## print_summary(self, file=None)
+    ##
+    ## Summary of the summary printer:
+    ##
+    ## Prints the summary as a table, in milliseconds.
+    ##
+    ## Parameters : file - stream to print to (defaults to sys.stderr)
+    ##
+    ## Return Value : none
+
+    def print_summary(self, file=None):
+        file = file if file is not None else sys.stderr
+        print(f"{'span':<40} {'cat':<8} {'calls':>7} {'total':>10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}", file=file)
+        for category, name, count, total, p50, p95, p99, longest in self.summary():
+            print(f"{name:<40} {category:<8} {count:>7} {total * 1000:>10.1f} {p50 * 1000:>9.3f} {p95 * 1000:>9.3f} {p99 * 1000:>9.3f} {longest * 1000:>9.3f}", file=file)
+        if self.dropped:
+            print(f"({self.dropped} spans were counted but left out of the trace file)", file=file)
+
+
+## percentile(values, percent)
+##
+## Summary of the percentile function:
+##
+## Nearest rank percentile of a sorted list.
+##
+## Parameters :
+##    values - sorted, non-empty list of numbers
+##    percent - 0 to 100
+##
+## Return Value : one of the values
+
+def percentile(values, percent):
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+## start_tracing(max_events=DEFAULT_MAX_EVENTS)
+##
+## Summary of the start function:
+##
+## Starts recording and wraps the application's functions.
+##
+## Parameters : max_events - most events kept for the Chrome trace
+##
+## Return Value : the trace_recorder
+##
+## Description:
+##
+## Imports each module in CLASS_SPANS and NESTED_SPANS and wraps what
+## they list. Call before the menu_manager is created. Does nothing new
+## if tracing is already on.
+
+def start_tracing(max_events=DEFAULT_MAX_EVENTS):
+    global active
+    if active is not None:
+        return active
+    recorder = trace_recorder(max_events)
+    for module_name, class_name, category, skip in CLASS_SPANS:
+        module = __import__(module_name)
+        recorder.instrument_class(getattr(module, class_name), category, skip)
+    for module_name, path, category in NESTED_SPANS:
+        recorder.instrument_function(__import__(module_name), path, category)
+    active = recorder
+    return recorder
+
+
+## stop_tracing()
+##
+## Summary of the stop function:
+##
+## Stops recording and puts the original functions back.
+##
+## Parameters : none
+##
+## Return Value : the trace_recorder that was active, or None
+
+def stop_tracing():
+    global active
+    recorder = active
+    active = None
+    if recorder is not None:
+        recorder.uninstall()
+    return recorder
+
+
+## trace_callback(function, name, category="ui")
+##
+## Summary of the callback wrapper:
+##
+## Traces a callback that is not a method, such as a function defined
+## inside a method and handed to a button.
+##
+## Parameters :
+##    function - the callback
+##    name - span name
+##    category - span category
+##
+## Return Value : the traced wrapper while tracing, otherwise function
+##                itself
+##
+## Description:
+##
+## Decided once when the callback is handed to Tk, so an untraced run
+## calls the plain function.
+
+def trace_callback(function, name, category="ui"):
+    if active is None:
+        return function
+    return active.traced(function, name, category)